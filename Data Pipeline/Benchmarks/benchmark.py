@@ -0,0 +1,319 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'Imperative Paradigm'))
+sys.path.insert(0, os.path.join(HERE, '..', 'Functional Paradigm'))
+
+from FileLoader import FileLoader
+from DataValidator import DataValidator
+from MissingDataHandler import MissingDataHandler
+from DataStandardizer import DataStandardizer
+from DataTransformer import DataTransformer
+from DataAnalyzer import DataAnalyzer
+from FusedPipeline import FusedPipeline
+import functional_pipeline as fp
+from generate_data import DATE_FORMATS, generate_rows, write_dataset
+
+
+# Function: peak resident set size of this process in MB (None where unavailable)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Function: number of rows in a stage result, or None for scalar results
+def count_rows(result):
+    if isinstance(result, (list, dict)) or hasattr(result, 'column_names'):
+        return len(result)
+    return None
+
+
+# Function: copy rows so that stages which update rows in place start from the same input
+def copy_rows(rows):
+    return [dict(row) for row in rows]
+
+
+# Function: time one stage; runs in a forked child so ru_maxrss covers only this stage
+def time_stage(conn, prepare, run, repeat):
+    rss_start = peak_rss_mb()
+    best = None
+    result = None
+    for _ in range(repeat):
+        args = prepare()
+        started = time.perf_counter()
+        result = run(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    conn.send((best, count_rows(result), rss_start, peak_rss_mb()))
+    conn.close()
+
+
+# Function: run time_stage in a child process (inline where fork is not available)
+def measure(prepare, run, repeat):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        time_stage(sender, prepare, run, repeat)
+        return receiver.recv()
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    child = context.Process(target=time_stage, args=(sender, prepare, run, repeat))
+    child.start()
+    sender.close()
+    try:
+        measured = receiver.recv()
+    except EOFError:
+        measured = None
+    child.join()
+    if measured is None:
+        raise RuntimeError(f"Benchmark stage exited with code {child.exitcode}")
+    return measured
+
+
+# Function: build the (name, input rows, prepare, run) stages; inputs of later stages are computed
+# here once, untimed, by running the earlier stages in the order main.py uses them
+def build_stages(path, threshold, numeric_columns):
+    loader = FileLoader(path, os.devnull)
+    validator = DataValidator()
+    missing = MissingDataHandler()
+    std = DataStandardizer()
+    transformer = DataTransformer()
+    analyzer = DataAnalyzer()
+    metrics = [f"metric_{i}" for i in range(1, numeric_columns + 1)]
+
+    raw = loader.load()
+    clean = validator.remove_none_keys(copy_rows(raw))
+    imputed = missing.impute_mode(missing.impute_mean(copy_rows(clean), "sales"), "region")
+    numeric = std.standardize_numeric_column(copy_rows(imputed), "sales")
+    for column in metrics:
+        numeric = std.standardize_numeric_column(numeric, column)
+    categorical = std.standardize_categorical_column(copy_rows(numeric), "region")
+    standardized = std.standardize_date_column(copy_rows(categorical), "date")
+    n = len(raw)
+
+    stages = [
+        ("FileLoader.load", n, lambda: (), loader.load),
+        ("DataValidator.remove_none_keys", n, lambda: (copy_rows(raw),), validator.remove_none_keys),
+        ("MissingDataHandler.detect_missing", n, lambda: (clean,), missing.detect_missing),
+        ("MissingDataHandler.build_missing_index", n, lambda: (clean,), missing.build_missing_index),
+        ("MissingDataHandler.impute_mean", n, lambda: (copy_rows(clean), "sales"), missing.impute_mean),
+        ("MissingDataHandler.impute_mean[index]", n,
+         lambda: (lambda rows: (rows, "sales", missing.build_missing_index(rows)))(copy_rows(clean)), missing.impute_mean),
+        ("MissingDataHandler.impute_median", n, lambda: (copy_rows(clean), "sales"), missing.impute_median),
+        ("MissingDataHandler.impute_mode", n, lambda: (copy_rows(clean), "region"), missing.impute_mode),
+        ("DataStandardizer.standardize_numeric_column", n,
+         lambda: (copy_rows(imputed), "sales"), std.standardize_numeric_column),
+        ("DataStandardizer.standardize_categorical_column", n,
+         lambda: (copy_rows(numeric), "region"), std.standardize_categorical_column),
+        ("DataStandardizer.standardize_date_column", n,
+         lambda: (copy_rows(categorical), "date"), std.standardize_date_column),
+        ("DataTransformer.filter_rows", n, lambda: (standardized, "sales", threshold), transformer.filter_rows),
+        ("DataTransformer.aggregate", n, lambda: (standardized, "region", "sales"), transformer.aggregate),
+        ("DataAnalyzer.summary", n, lambda: (standardized, "sales"), analyzer.summary),
+    ]
+    if metrics:
+        stages.append(("DataAnalyzer.trend", n, lambda: (standardized, metrics[0], "sales"), analyzer.trend))
+
+    # main.py's chain, one call after another and fused
+    def sequential_chain(rows):
+        rows = validator.remove_none_keys(rows)
+        index = missing.build_missing_index(rows)
+        rows = missing.impute_mean(rows, "sales", index)
+        rows = std.standardize_numeric_column(rows, "sales")
+        rows = std.standardize_categorical_column(rows, "region")
+        rows = std.standardize_date_column(rows, "date")
+        transformer.filter_rows(rows, "sales", threshold)
+        transformer.aggregate(rows, "region", "sales")
+        return rows
+
+    fused = (FusedPipeline()
+             .add(validator.remove_none_keys)
+             .tap("missing", missing.detect_missing)
+             .add(missing.impute_mean, "sales")
+             .add(std.standardize_numeric_column, "sales")
+             .add(std.standardize_categorical_column, "region")
+             .add(std.standardize_date_column, "date")
+             .tap("filtered", transformer.filter_rows, "sales", threshold)
+             .tap("aggregated", transformer.aggregate, "region", "sales"))
+    stages += [
+        ("imperative.sequential_chain", n, lambda: (copy_rows(raw),), sequential_chain),
+        ("FusedPipeline.run", n, lambda: (copy_rows(raw),), lambda rows: fused.run(rows)[0]),
+    ]
+
+    # The same kernels on the columnar representation
+    table = loader.load_table()
+    table_numeric = std.standardize_numeric_column(table, "sales")
+    table_categorical = std.standardize_categorical_column(table_numeric, "region")
+    table_standardized = std.standardize_date_column(table_categorical, "date")
+    stages += [
+        ("FileLoader.load_table", n, lambda: (), loader.load_table),
+        ("DataStandardizer.standardize_numeric_column[table]", n,
+         lambda: (table, "sales"), std.standardize_numeric_column),
+        ("DataStandardizer.standardize_categorical_column[table]", n,
+         lambda: (table_numeric, "region"), std.standardize_categorical_column),
+        ("DataStandardizer.standardize_date_column[table]", n,
+         lambda: (table_categorical, "date"), std.standardize_date_column),
+        ("DataTransformer.filter_rows[table]", n,
+         lambda: (table_standardized, "sales", threshold), transformer.filter_rows),
+        ("DataTransformer.aggregate[table]", n,
+         lambda: (table_standardized, "region", "sales"), transformer.aggregate),
+        ("DataAnalyzer.summary[table]", n, lambda: (table_standardized, "sales"), analyzer.summary),
+    ]
+
+    # Functional pipeline
+    records = fp.load_data(path)
+    processed = fp.process_pipeline(records, "region", "sales", "date", threshold)
+    stages += [
+        ("functional.load_data", n, lambda: (path,), fp.load_data),
+        ("functional.process_pipeline", n,
+         lambda: (records, "region", "sales", "date", threshold), fp.process_pipeline),
+        ("functional.aggregate_values", len(processed),
+         lambda: (processed, "region", "sales"), fp.aggregate_values),
+        ("functional.compute_stats", len(processed), lambda: (processed, "sales", "date"), fp.compute_stats),
+    ]
+    return stages
+
+
+# Function: run every selected stage and collect the report
+def run_benchmark(path, config, repeat=1, only=None):
+    stages = build_stages(path, config["threshold"], config["numeric_columns"])
+    results = []
+    for name, rows, prepare, run in stages:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        seconds, rows_out, rss_start, rss_peak = measure(prepare, run, repeat)
+        result = {
+            "stage": name,
+            "rows": rows,
+            "rows_out": rows_out,
+            "seconds": seconds,
+            "rows_per_sec": rows / seconds if seconds else None,
+            "peak_rss_mb": rss_peak,
+            "rss_delta_mb": rss_peak - rss_start if rss_peak is not None else None
+        }
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "repeat": repeat,
+        "stages": results
+    }
+
+
+def format_result(result):
+    throughput = f"{result['rows_per_sec']:>14,.0f}" if result['rows_per_sec'] else f"{'-':>14}"
+    memory = f"{result['peak_rss_mb']:>9.1f}" if result['peak_rss_mb'] is not None else f"{'-':>9}"
+    delta = f"{result['rss_delta_mb']:>+9.1f}" if result['rss_delta_mb'] is not None else f"{'-':>9}"
+    return f"{result['stage']:<56} {result['seconds']:>9.4f}s {throughput} rows/s {memory} MB {delta} MB"
+
+
+# Function: stages whose throughput dropped, or whose memory growth rose, by more than the tolerance
+def compare_reports(report, baseline, tolerance=0.2, memory_slack_mb=8.0):
+    previous = {stage["stage"]: stage for stage in baseline.get("stages", [])}
+    regressions = []
+    for stage in report["stages"]:
+        before = previous.get(stage["stage"])
+        if before is None:
+            continue
+        if before["rows_per_sec"] and stage["rows_per_sec"] is not None:
+            if stage["rows_per_sec"] < before["rows_per_sec"] * (1 - tolerance):
+                regressions.append((stage["stage"], "rows_per_sec", before["rows_per_sec"], stage["rows_per_sec"]))
+        if before.get("rss_delta_mb") is not None and stage["rss_delta_mb"] is not None:
+            # Small deltas are mostly allocator noise, hence the absolute slack
+            limit = max(before["rss_delta_mb"] * (1 + tolerance), before["rss_delta_mb"] + memory_slack_mb)
+            if stage["rss_delta_mb"] > limit:
+                regressions.append((stage["stage"], "rss_delta_mb", before["rss_delta_mb"], stage["rss_delta_mb"]))
+    return regressions
+
+
+# Function: parse command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic sales data.")
+    parser.add_argument("--input", help="Benchmark this file instead of generating one")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows of synthetic data")
+    parser.add_argument("--regions", type=int, default=5, help="Number of distinct regions")
+    parser.add_argument("--missing-rate", type=float, default=0.05, help="Share of blank cells per column")
+    parser.add_argument("--invalid-rate", type=float, default=0.01,
+                        help="Share of rows with an invalid date or a stray trailing field")
+    parser.add_argument("--date-formats", nargs="+", default=DATE_FORMATS, help="Date formats to mix")
+    parser.add_argument("--numeric-columns", type=int, default=1, help="Extra numeric columns (metric_1, ...)")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="Synthetic file format")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--threshold", type=float, default=1000, help="Filter threshold used by the filter stages")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest one is reported")
+    parser.add_argument("--stages", nargs="+", metavar="PATTERN", help="Only run stages whose name contains a pattern")
+    parser.add_argument("--output", default="benchmark_report.json", help="JSON report file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown (and memory growth) before a stage is flagged")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        "rows": args.rows,
+        "regions": args.regions,
+        "missing_rate": args.missing_rate,
+        "invalid_rate": args.invalid_rate,
+        "date_formats": args.date_formats,
+        "numeric_columns": args.numeric_columns,
+        "format": args.format,
+        "seed": args.seed,
+        "threshold": args.threshold,
+        "input": args.input
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.input
+        if path is None:
+            path = os.path.join(workdir, f"sales.{args.format}")
+            write_dataset(path, generate_rows(args.rows, args.regions, args.missing_rate, args.invalid_rate,
+                                              args.date_formats, args.numeric_columns, args.seed))
+        report = run_benchmark(path, config, args.repeat, args.stages)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("config") != config:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if not regressions:
+            print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+            return 0
+        print(f"Regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for stage, metric, before, after in regressions:
+            print(f"  {stage}: {metric} {before:,.2f} -> {after:,.2f}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
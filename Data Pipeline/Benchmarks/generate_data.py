@@ -0,0 +1,100 @@
+import argparse
+import csv
+import json
+import random
+from datetime import date, timedelta
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d']
+REGION_NAMES = ['North', 'South', 'East', 'West', 'Central']
+
+
+# Function: region names, the sample ones first and then numbered ones
+def make_regions(count):
+    regions = REGION_NAMES[:count]
+    regions += [f"Region {i}" for i in range(len(regions) + 1, count + 1)]
+    return regions
+
+
+# Function: yield synthetic sales rows shaped like Data/mine.csv
+# - missing_rate: share of blank sales / region / date cells (each drawn separately)
+# - invalid_rate: share of rows with an unparseable date or a stray trailing field
+# - date_formats: formats mixed into the date column, the first one dominating
+def generate_rows(rows, regions=5, missing_rate=0.05, invalid_rate=0.01,
+                  date_formats=None, numeric_columns=1, seed=42):
+    rng = random.Random(seed)
+    formats = date_formats or DATE_FORMATS
+    names = make_regions(regions)
+    start = date(2022, 1, 1)
+    weights = [len(formats)] + [1] * (len(formats) - 1)
+
+    for _ in range(rows):
+        region = rng.choice(names)
+        # Untrimmed values as found in hand-made files
+        if rng.random() < 0.05:
+            region = f" {region} "
+        sales = str(rng.randrange(100, 5000, 50))
+        day = start + timedelta(days=rng.randrange(1095))
+        raw_date = day.strftime(rng.choices(formats, weights)[0])
+
+        row = {'region': region, 'sales': sales, 'date': raw_date}
+        for i in range(1, numeric_columns + 1):
+            row[f"metric_{i}"] = str(rng.randrange(1, 100))
+
+        for column in ('region', 'sales', 'date'):
+            if rng.random() < missing_rate:
+                row[column] = ''
+        if rng.random() < invalid_rate:
+            if rng.random() < 0.5:
+                row['date'] = 'invalid-date'
+            else:
+                row[None] = ['']
+        yield row
+
+
+# Function: write the rows as CSV or JSON depending on the extension
+def write_dataset(path, rows):
+    fieldnames = None
+    if path.lower().endswith('.json'):
+        records = []
+        for row in rows:
+            row.pop(None, None)
+            records.append(row)
+        with open(path, 'w') as file:
+            json.dump(records, file, indent=4)
+        return
+
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for row in rows:
+            if fieldnames is None:
+                fieldnames = [name for name in row if name is not None]
+                writer.writerow(fieldnames)
+            writer.writerow([row[name] for name in fieldnames] + row.get(None, []))
+
+
+# Function: parse command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic sales dataset.")
+    parser.add_argument("output_file", help="Output file (.csv or .json)")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of rows")
+    parser.add_argument("--regions", type=int, default=5, help="Number of distinct regions")
+    parser.add_argument("--missing-rate", type=float, default=0.05, help="Share of blank cells per column")
+    parser.add_argument("--invalid-rate", type=float, default=0.01,
+                        help="Share of rows with an invalid date or a stray trailing field")
+    parser.add_argument("--date-formats", nargs="+", default=DATE_FORMATS, help="Date formats to mix")
+    parser.add_argument("--numeric-columns", type=int, default=1,
+                        help="Extra numeric columns (metric_1, metric_2, ...)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    write_dataset(args.output_file, generate_rows(
+        args.rows, args.regions, args.missing_rate, args.invalid_rate,
+        args.date_formats, args.numeric_columns, args.seed))
+    print(f"Wrote {args.rows} rows to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
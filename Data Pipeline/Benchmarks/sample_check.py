@@ -0,0 +1,124 @@
+import argparse
+import csv
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+
+from generate_data import generate_rows, write_dataset
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONAL = os.path.join(HERE, '..', 'Functional Paradigm', 'functional_pipeline.py')
+
+# Sampling options whose runs must match the full run: a whole-input sample is the input itself
+SAMPLE_RUNS = (["--sample", "1.0"], ["--sample", "1.0", "--stratify"])
+
+# Datasets whose samples leave nothing to impute from: no rows at all, or no usable value
+EMPTY_SAMPLES = {'no rows': [], 'no values': [{'region': 'West', 'sales': '', 'date': '2024-01-01'}] * 5}
+
+
+# Function: rows whose group column is skewed by untrimmed duplicates of a smaller group, plus blank groups:
+# the most common raw value ('West') is not the most common trimmed one ('East')
+def skewed_rows():
+    groups = ['West'] * 30 + ['East'] * 20 + [' East '] * 20 + [''] * 10
+    for i, region in enumerate(groups):
+        yield {'region': region, 'sales': str(100 + i * 7), 'date': f"2024-01-{i % 28 + 1:02d}"}
+
+
+# Function: the lines one run prints, writing its rows to output
+def run_pipeline(path, output, workdir, options):
+    command = [sys.executable, FUNCTIONAL, path, "--group_by", "region", "--value", "sales", "--date", "date",
+               "--output", output, "--no-plots"] + options
+    result = subprocess.run(command, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                            check=True, env=dict(os.environ, MPLBACKEND='Agg'))
+    return result.stdout.splitlines()
+
+
+# Function: the "name: value" lines of a run's report by name
+def report_values(lines):
+    return dict(line.split(": ", 1) for line in lines if ": " in line)
+
+
+# Function: write rows (dicts of region, sales and date) to a CSV file at path
+def write_rows(path, rows):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['region', 'sales', 'date'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# Function: problems of the sampled runs of datasets that leave nothing to impute from, which must report that
+# no data is left instead of failing
+def check_empty_samples(workdir):
+    problems = []
+    for name, rows in EMPTY_SAMPLES.items():
+        path = os.path.join(workdir, "empty.csv")
+        write_rows(path, rows)
+        for options in SAMPLE_RUNS:
+            label = f"{name} {' '.join(options)}"
+            try:
+                lines = run_pipeline(path, os.path.join(workdir, "sample.csv"), workdir, options)
+            except subprocess.CalledProcessError as error:
+                problems.append(f"{label}: failed with exit status {error.returncode}")
+                continue
+            if "No data after processing." not in lines:
+                problems.append(f"{label}: does not report that no data is left")
+    return problems
+
+
+# Function: differences between the full run and each whole-input sampled run of the dataset at path
+def check_dataset(name, path, workdir):
+    problems = []
+    full_output = os.path.join(workdir, "full.csv")
+    full_report = report_values(run_pipeline(path, full_output, workdir, []))
+    for options in SAMPLE_RUNS:
+        label = f"{name} {' '.join(options)}"
+        output = os.path.join(workdir, "sample.csv")
+        report = report_values(run_pipeline(path, output, workdir, options))
+        if not filecmp.cmp(full_output, output, shallow=False):
+            problems.append(f"{label}: output rows differ from the full run")
+        # The sampled runs add estimates and notes; whatever the full run reports must be the same
+        for key, expected in full_report.items():
+            if report.get(key) != expected:
+                problems.append(f"{label}: {key} differs from the full run")
+    return problems
+
+
+# Function: parse command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that sampling the whole input (--sample 1.0, with and without --stratify) "
+                    "gives the same output as a full run of the functional pipeline, and that samples leaving nothing to "
+                    "impute from report that no data is left.")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows of synthetic data")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="Share of blank cells of the synthetic data")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        skewed = os.path.join(workdir, "skewed.csv")
+        write_rows(skewed, skewed_rows())
+        synthetic = os.path.join(workdir, "synthetic.csv")
+        # No stray trailing fields: the functional pipeline's CSV writer rejects them
+        write_dataset(synthetic, generate_rows(args.rows, missing_rate=args.missing_rate, invalid_rate=0,
+                                               seed=args.seed))
+        for name, path in (("skewed", skewed), ("synthetic", synthetic)):
+            problems += check_dataset(name, path, workdir)
+        problems += check_empty_samples(workdir)
+
+    if not problems:
+        print("Whole-input samples match the full run; samples with nothing to impute from report no data")
+        return 0
+    print("Sampled runs differ from what they should give:")
+    for problem in problems:
+        print(f"  {problem}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from generate_data import generate_rows, write_dataset
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONAL = os.path.join(HERE, '..', 'Functional Paradigm', 'functional_pipeline.py')
+IMPERATIVE = os.path.join(HERE, '..', 'Imperative Paradigm', 'main.py')
+
+# Modules a run without charts must not import
+HEAVY_MODULES = ('matplotlib', 'seaborn', 'scipy')
+
+
+# Function: (name, command, whether heavy imports are allowed) per scenario; the imperative pipeline
+# reads data/mine.csv from its working directory
+def build_scenarios(path):
+    return [
+        ("functional --no-plots", [sys.executable, FUNCTIONAL, path, "--output", "out.csv", "--no-plots"], False),
+        ("functional charts", [sys.executable, FUNCTIONAL, path, "--output", "out.csv", "--force-charts"], True),
+        ("imperative --no-plots", [sys.executable, IMPERATIVE, "--no-plots"], False),
+        ("imperative --headless", [sys.executable, IMPERATIVE, "--headless", "--force-charts"], True),
+    ]
+
+
+# Function: wall-clock seconds of one run of command
+def time_command(command, workdir):
+    started = time.perf_counter()
+    subprocess.run(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+                   env=dict(os.environ, MPLBACKEND='Agg'))
+    return time.perf_counter() - started
+
+
+# Function: heavy top-level packages imported by a run, with their cumulative import time in seconds
+def heavy_imports(command, workdir):
+    result = subprocess.run([command[0], "-X", "importtime"] + command[1:], cwd=workdir, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=True, env=dict(os.environ, MPLBACKEND='Agg'))
+    found = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        name = fields[2].strip()
+        if name in HEAVY_MODULES:
+            found[name] = int(fields[1]) / 1e6
+    return found
+
+
+# Function: run every scenario and collect the report
+def run_benchmark(path, workdir, config, repeat=5, only=None):
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "scenarios": []
+    }
+    for name, command, heavy_allowed in build_scenarios(path):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        times = [time_command(command, workdir) for _ in range(repeat)]
+        result = {
+            "scenario": name,
+            "best_seconds": min(times),
+            "median_seconds": statistics.median(times),
+            "heavy_imports": heavy_imports(command, workdir),
+            "heavy_allowed": heavy_allowed
+        }
+        report["scenarios"].append(result)
+        print(format_result(result))
+    return report
+
+
+def format_result(result):
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["heavy_imports"].items()) or "none"
+    return (f"{result['scenario']:<24} best {result['best_seconds']:.3f}s  "
+            f"median {result['median_seconds']:.3f}s  heavy imports: {imports}")
+
+
+# Function: scenarios that imported a heavy module they should not, or got slower than the baseline by more
+# than the tolerance (plus an absolute slack, since process start-up is noisy)
+def find_problems(report, baseline=None, tolerance=0.2, slack_seconds=0.05):
+    problems = []
+    for result in report["scenarios"]:
+        if not result["heavy_allowed"] and result["heavy_imports"]:
+            problems.append(f"{result['scenario']}: imports {', '.join(result['heavy_imports'])}")
+
+    previous = {result["scenario"]: result for result in (baseline or {}).get("scenarios", [])}
+    for result in report["scenarios"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        limit = before["best_seconds"] * (1 + tolerance) + slack_seconds
+        if result["best_seconds"] > limit:
+            problems.append(f"{result['scenario']}: best_seconds "
+                            f"{before['best_seconds']:.3f} -> {result['best_seconds']:.3f}")
+    return problems
+
+
+# Function: parse command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the start-up time of both pipelines on a small input.")
+    parser.add_argument("--rows", type=int, default=100, help="Rows of synthetic data")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario; the fastest one is compared")
+    parser.add_argument("--scenarios", nargs="+", metavar="PATTERN",
+                        help="Only run scenarios whose name contains a pattern")
+    parser.add_argument("--output", default="startup_report.json", help="JSON report file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before a scenario is flagged")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {"rows": args.rows, "seed": args.seed}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        os.makedirs(os.path.join(workdir, "Imperative(OOP)"))
+        path = os.path.join(workdir, "data", "mine.csv")
+        # No stray trailing fields: the functional pipeline's CSV writer rejects them
+        write_dataset(path, generate_rows(args.rows, invalid_rate=0, seed=args.seed))
+        report = run_benchmark(path, workdir, config, args.repeat, args.scenarios)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"\nReport written to {args.output}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("config") != config:
+            print("Warning: baseline was recorded with a different configuration")
+    problems = find_problems(report, baseline, args.tolerance)
+    if not problems:
+        print("No start-up regressions" + (f" against {args.baseline}" if args.baseline else ""))
+        return 0
+    print("Start-up regressions:")
+    for problem in problems:
+        print(f"  {problem}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
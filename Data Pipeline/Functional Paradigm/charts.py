@@ -0,0 +1,163 @@
+import json
+import os
+import pickle
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from groupings import format_group_key
+
+# Visualization functions. Figures are built with the object-oriented API (no pyplot state), so they render
+# headless through Agg and can be drawn in worker processes. matplotlib is imported on first use, so runs
+# without charts do not pay for it
+def create_aggregates_bar(aggregates, group_by_col, value_col, aggregate='sum'):
+    if not aggregates:
+        return None
+    from matplotlib.figure import Figure
+    keys = list(aggregates.keys())
+    values = list(aggregates.values())
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(keys, values)
+    ax.set_xlabel(group_by_col.capitalize())
+    ax.set_ylabel(f"{'Total' if aggregate == 'sum' else aggregate.capitalize()} {value_col.capitalize()}")
+    ax.set_title(f"Aggregate {value_col.capitalize()} by {group_by_col.capitalize()}")
+    if len(keys) > 10:
+        # Many (e.g. composite) keys: slanted labels that do not overlap
+        ax.tick_params(axis='x', labelrotation=60, labelsize='small')
+        fig.tight_layout()
+    return fig
+
+# Function: Histogram counts and bin edges, so only the bins (not every value) reach the renderer
+def bin_values(value_list, bins=10, weights=None):
+    counts, edges = np.histogram(np.asarray(value_list, dtype=float), bins=bins, weights=weights)
+    return counts.tolist(), edges.tolist()
+
+def create_histogram(value_list, value_col, weights=None):
+    if not value_list:
+        return None
+    counts, edges = bin_values(value_list, weights=weights)
+    return draw_histogram(counts, edges, value_col)
+
+# Function: Histogram figure from pre-binned counts
+def draw_histogram(counts, edges, value_col):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.hist(edges[:-1], bins=edges, weights=counts, edgecolor='black')
+    ax.set_xlabel(value_col.capitalize())
+    ax.set_ylabel('Frequency')
+    ax.set_title(f"Histogram of {value_col.capitalize()} Values")
+    return fig
+
+# Function: Indices of the points kept by Largest-Triangle-Three-Buckets downsampling to max_points.
+# Points are taken as evenly spaced, as the trend line's categorical date axis draws them
+def lttb_indices(values, max_points):
+    n = len(values)
+    if max_points >= n or max_points < 3:
+        return list(range(n))
+    y = np.asarray(values, dtype=float)
+    x = np.arange(n, dtype=float)
+    # Bucket b holds points edges[b]:edges[b + 1]; the first and last points are always kept
+    edges = (np.arange(max_points - 1) * ((n - 2) / (max_points - 2))).astype(int) + 1
+    edges[-1] = n - 1
+    kept = [0]
+    anchor = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        next_start, next_end = (end, edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Twice the area of the triangle (anchor, candidate, next bucket average)
+        area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor])
+                      - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+        anchor = start + int(area.argmax())
+        kept.append(anchor)
+    kept.append(n - 1)
+    return kept
+
+# Function: Date aggregates in date order, downsampled to at most max_points for plotting
+def trend_points(date_aggregates, max_points=1000):
+    keys = sorted(date_aggregates.keys())
+    values = [date_aggregates[k] for k in keys]
+    kept = lttb_indices(values, max_points)
+    return {keys[i]: values[i] for i in kept}
+
+def create_trend_line(date_aggregates, date_col, value_col, max_points=1000):
+    if not date_aggregates:
+        return None
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import MaxNLocator
+    points = trend_points(date_aggregates, max_points)
+    keys = list(points.keys())
+    values = list(points.values())
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(keys, values, marker='o')
+    ax.set_xlabel(date_col.capitalize())
+    ax.set_ylabel(f"Total {value_col.capitalize()}")
+    ax.set_title(f"Trend of {value_col.capitalize()} Over Time")
+    ax.tick_params(axis='x', labelrotation=45)
+    if len(keys) > 50:
+        # One label per date would overlap and dominates the drawing time
+        ax.xaxis.set_major_locator(MaxNLocator(20))
+    return fig
+
+# Function: Chart jobs as (file path, figure function, arguments); histogram and trend data are reduced here,
+# so the arguments stay small whatever the row count
+def chart_jobs(group_aggregates, date_aggregates, value_list, hist_weights, args):
+    # The bar chart shows the first aggregate; composite keys are labelled as text
+    aggregate = args.aggregates.split(',')[0]
+    bars = {}
+    for key, value in group_aggregates.items():
+        value = value[aggregate] if isinstance(value, dict) else value
+        if value is not None:
+            bars[format_group_key(key)] = value
+    bar_arguments = (bars, args.group_by, args.value) + ((aggregate,) if aggregate != 'sum' else ())
+    jobs = [(f"aggregates_bar.{args.chart_format}", create_aggregates_bar, bar_arguments)]
+    if value_list:
+        counts, edges = bin_values(value_list, weights=hist_weights)
+        jobs.append((f"value_histogram.{args.chart_format}", draw_histogram, (counts, edges, args.value)))
+    if date_aggregates:
+        points = trend_points(date_aggregates, args.chart_max_points)
+        jobs.append((f"trend_line.{args.chart_format}", create_trend_line,
+                     (points, args.date, args.value, args.chart_max_points)))
+    return jobs
+
+# Function: Draw one chart and save it; False when there was nothing to plot
+def render_chart(path, create, arguments):
+    fig = create(*arguments)
+    if fig is None:
+        return False
+    fig.savefig(path)
+    return True
+
+# Function: Fingerprint of what a chart shows
+def chart_digest(path, create, arguments):
+    return hashlib.blake2b(pickle.dumps((path, create.__name__, arguments)), digest_size=16).hexdigest()
+
+# Function: Render the jobs in a process pool, skipping files whose data is unchanged since the last run
+# (digests kept in manifest_path). Returns (rendered paths, skipped paths)
+def render_charts(jobs, workers=1, manifest_path='chart_manifest.json', force=False):
+    try:
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    digests = {path: chart_digest(path, create, arguments) for path, create, arguments in jobs}
+    pending = [job for job in jobs
+               if force or manifest.get(job[0]) != digests[job[0]] or not os.path.exists(job[0])]
+    skipped = [path for path, _, _ in jobs if path not in {job[0] for job in pending}]
+
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            drawn = list(pool.map(render_chart, *zip(*pending)))
+    else:
+        drawn = [render_chart(*job) for job in pending]
+
+    rendered = [job[0] for job, done in zip(pending, drawn) if done]
+    for path in rendered:
+        manifest[path] = digests[path]
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return rendered, skipped
@@ -0,0 +1,152 @@
+import json
+import os
+from datetime import datetime
+import math
+import numpy as np
+from groupings import DATE_PART_LENGTHS
+
+# Rollup cube (--cube): sum, count, sum of squares, min and max of the value per (day, group) of the processed rows,
+# saved as an .npz of column arrays. Queries (query_cube) derive month and year rollups from the days and the stats
+# of any slice from the moments, so dashboards are answered without reading the raw data. An --incremental run
+# folds its new rows into the cube; other runs rebuild it
+CUBE_MEASURES = ('sum', 'count', 'sum_sq', 'min', 'max')
+CUBE_QUERIES = ('totals', 'trend', 'stats')
+
+# Function: Empty cube of rows processed with the given settings (group, value and date columns among them)
+def new_cube(settings):
+    return {'settings': settings, 'cells': {}}
+
+# Function: Add processed rows to the cells of a cube
+def cube_update(cube, rows):
+    settings = cube['settings']
+    group_by_col, value_col, date_col = settings['group_by'], settings['value'], settings['date']
+    cells = cube['cells']
+    for row in rows:
+        key = (row[date_col], row[group_by_col])
+        value = row[value_col]
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [value, 1, value * value, value, value]
+            continue
+        cell[0] += value
+        cell[1] += 1
+        cell[2] += value * value
+        if value < cell[3]:
+            cell[3] = value
+        if value > cell[4]:
+            cell[4] = value
+    return cube
+
+# Function: JSON form of a cube's cells (kept by the --incremental state) and back
+def cube_cells_state(cells):
+    return [[day, group] + cell for (day, group), cell in cells.items()]
+
+def restore_cube_cells(saved):
+    return {(day, group): cell for day, group, *cell in saved}
+
+# Function: Write a cube atomically (temp file + rename): cells sorted by day and group, groups coded by their
+# index in the sorted group names
+def save_cube(cube, cube_path):
+    keys = sorted(cube['cells'])
+    groups = sorted({group for _, group in keys})
+    codes = {group: i for i, group in enumerate(groups)}
+    arrays = {'day': np.array([day for day, _ in keys], dtype='datetime64[D]'),
+              'group': np.array([codes[group] for _, group in keys], dtype=np.int32),
+              'groups': np.array(groups, dtype=str), 'settings': np.array(json.dumps(cube['settings']))}
+    for i, measure in enumerate(CUBE_MEASURES):
+        arrays[measure] = np.array([cube['cells'][key][i] for key in keys],
+                                   dtype=np.int64 if measure == 'count' else np.float64)
+    temp_path = cube_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temp_path, cube_path)
+
+# Function: Cube file as its column arrays (settings decoded), for queries
+def load_cube(cube_path):
+    with np.load(cube_path) as data:
+        cube = {name: data[name] for name in data.files}
+    cube['settings'] = json.loads(cube['settings'].item())
+    return cube
+
+# Function: Cube file as cells that rows can be added to, refusing one built with other settings
+def open_cube(cube_path, settings):
+    arrays = load_cube(cube_path)
+    if arrays['settings'] != settings:
+        raise ValueError(f"Cube {cube_path} was built with different settings; delete it to rebuild.")
+    groups = arrays['groups'].tolist()
+    measures = zip(*(arrays[measure].tolist() for measure in CUBE_MEASURES))
+    cells = {(str(day), groups[code]): list(cell)
+             for day, code, cell in zip(arrays['day'], arrays['group'].tolist(), measures)}
+    return {'settings': settings, 'cells': cells}
+
+# Function: Rows a cube's cells stand for
+def cube_rows(cube):
+    return sum(cell[1] for cell in cube['cells'].values())
+
+# Function: Answer a query from a cube (see load_cube) over the cells dated date_from to date_to (YYYY-MM-DD,
+# inclusive) in the given groups (all when None): 'totals' (sum, count, mean, min and max by group), 'trend' (value
+# sum by day, month or year) or 'stats' (count, sum, mean, variance, stdev, min and max of the value)
+def query_cube(cube, query='totals', date_from=None, date_to=None, groups=None, period='day'):
+    day = cube['day']
+    keep = np.ones(len(day), dtype=bool)
+    if date_from is not None:
+        keep &= day >= np.datetime64(date_from, 'D')
+    if date_to is not None:
+        keep &= day <= np.datetime64(date_to, 'D')
+    if groups is not None:
+        wanted = set(groups)
+        keep &= np.isin(cube['group'], [i for i, group in enumerate(cube['groups'].tolist()) if group in wanted])
+    cells = {measure: cube[measure][keep] for measure in CUBE_MEASURES}
+
+    if query == 'trend':
+        periods = day[keep].astype({'day': 'datetime64[D]', 'month': 'datetime64[M]', 'year': 'datetime64[Y]'}[period])
+        keys, inverse = np.unique(periods, return_inverse=True)
+        totals = np.bincount(inverse, weights=cells['sum'], minlength=len(keys))
+        return {str(key): float(total) for key, total in zip(keys, totals)}
+
+    value_col = cube['settings']['value']
+    if query == 'stats':
+        n = int(cells['count'].sum())
+        if n == 0:
+            return {'count': 0}
+        total = float(cells['sum'].sum())
+        mean = total / n
+        variance = max((float(cells['sum_sq'].sum()) - total * mean) / (n - 1), 0.0) if n > 1 else 0
+        return {
+            'count': n,
+            f"sum_{value_col}": total,
+            f"mean_{value_col}": mean,
+            f"variance_{value_col}": variance,
+            f"stdev_{value_col}": math.sqrt(variance),
+            f"min_{value_col}": float(cells['min'].min()),
+            f"max_{value_col}": float(cells['max'].max())
+        }
+
+    # Totals by group
+    codes = cube['group'][keep]
+    size = len(cube['groups'])
+    sums = np.bincount(codes, weights=cells['sum'], minlength=size)
+    counts = np.bincount(codes, weights=cells['count'], minlength=size)
+    lows = np.full(size, np.inf)
+    np.minimum.at(lows, codes, cells['min'])
+    highs = np.full(size, -np.inf)
+    np.maximum.at(highs, codes, cells['max'])
+    return {group: {'sum': float(sums[i]), 'count': int(counts[i]), 'mean': float(sums[i] / counts[i]),
+                    'min': float(lows[i]), 'max': float(highs[i])}
+            for i, group in enumerate(cube['groups'].tolist()) if counts[i]}
+
+# Function: query_cube on a cube file, checking the query; groups: comma-separated. Raises ValueError
+def run_cube_query(cube_path, query='totals', date_from=None, date_to=None, groups=None, period='day'):
+    if query not in CUBE_QUERIES:
+        raise ValueError(f"unknown cube query {query!r} (expected {', '.join(CUBE_QUERIES)})")
+    if period not in DATE_PART_LENGTHS:
+        raise ValueError(f"unknown period {period!r} (expected {', '.join(DATE_PART_LENGTHS)})")
+    for bound in (date_from, date_to):
+        if bound is not None:
+            try:
+                datetime.strptime(bound, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"invalid date bound {bound!r} (expected YYYY-MM-DD)")
+    if not os.path.exists(cube_path):
+        raise ValueError(f"no such cube: {cube_path}")
+    return query_cube(load_cube(cube_path), query, date_from, date_to, groups.split(',') if groups else None, period)
@@ -1,289 +1,1338 @@
 import sys
 import csv
 import json
+import os
+import heapq
+import pickle
+import tempfile
 from datetime import datetime
+import math
 import statistics
-from functools import reduce
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 import argparse
-import matplotlib.pyplot as plt
-import logging
-from itertools import groupby
-from scipy.stats import linregress
+import numpy as np
+from itertools import chain, groupby, islice, repeat
+from concurrent.futures import ProcessPoolExecutor
+from profiling import export_profile, new_profiler, profile_stage, run_stage
+from records import chunked, csv_records, field_setter, pack_row
+from readers import (compression_of, content_digest, input_files, input_format, input_name, iter_data, load_data,
+                     open_input_set, print_file_progress)
+from sketches import (counter_add, counter_mode, new_sketch, sketch_add, sketch_extend, sketch_histogram, sketch_median,
+                      sketch_merge)
+from groupings import (DATE_PART_LENGTHS, build_groupings, feed_groupings, group_column, grouping_results,
+                       grouping_state, grouping_updater, make_aggregate, merge_grouping, needed_columns, new_grouping,
+                       parse_group_by, restore_grouping)
+from input_cache import cache_key, load_cached_rows, store_cached_rows, warm_get, warm_key, warm_put
+from shards import iter_shard, make_shards, partition_of
+from cube import (CUBE_QUERIES, cube_cells_state, cube_rows, cube_update, new_cube, open_cube, restore_cube_cells,
+                  run_cube_query, save_cube)
+from charts import chart_jobs, render_charts
+from output_sink import (OUTPUT_COMPRESSIONS, OUTPUT_FORMATS, close_sink, output_format, output_sink, quoted_list,
+                         sink_write)
+from sampling import new_sample_totals, parse_sample, sample_data, sample_estimates, scale_groupings
+from service import serve
+
+# Command-line arguments
+def build_parser():
+    parser = argparse.ArgumentParser(description="Functional Data Processing Pipeline with Enhanced Stats and Viz")
+    parser.add_argument("input_file", nargs="?",
+                        help="Input CSV, JSON or NDJSON file, a directory of them or a glob pattern (quoted), "
+                             "read as one input")
+    parser.add_argument("--group_by", default="region",
+                        help="Columns to group by for aggregation, comma-separated; a date column may be cut to "
+                             "a part, e.g. region,date:month. The first plain column drives imputation and windows")
+    parser.add_argument("--aggregates", default="sum",
+                        help="Aggregates per group, comma-separated: sum, count, mean, min, max, distinct "
+                             "(approximate), median or pN (percentile), each optionally :column (default --value)")
+    parser.add_argument("--extra-group-by", action="append", default=[], metavar="SPEC",
+                        help="Also aggregate by this grouping, in the same scan (repeatable)")
+    parser.add_argument("--value", default="sales", help="Numeric value column to process")
+    parser.add_argument("--date", default="date", help="Date column to parse")
+    parser.add_argument("--threshold", type=float, default=0, help="Filter threshold for value > this")
+    parser.add_argument("--groups", metavar="VALUES",
+                        help="Keep only rows whose group column is one of these values (comma-separated)")
+    parser.add_argument("--date-from", metavar="YYYY-MM-DD", help="Keep only rows dated on or after this day")
+    parser.add_argument("--date-to", metavar="YYYY-MM-DD", help="Keep only rows dated on or before this day")
+    parser.add_argument("--columns", metavar="COLS",
+                        help="Read only these columns (comma-separated); the group, value, date and aggregated "
+                             "columns are always kept")
+    parser.add_argument("--read-threads", type=int, default=4,
+                        help="Files of a directory or glob input read (and decompressed) at the same time")
+    parser.add_argument("--progress", action="store_true", help="Report each input file as it is read")
+    parser.add_argument("--output", default="processed_data.csv",
+                        help="Output file: .csv, .json, .ndjson/.jsonl or .npz (columnar), optionally .gz or .zst")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, help="Format of --output instead of its extension")
+    parser.add_argument("--output-compression", choices=OUTPUT_COMPRESSIONS,
+                        help="Compression of --output instead of its extension")
+    parser.add_argument("--sample", type=parse_sample, metavar="SPEC",
+                        help="Process a sample of the rows: a fraction (0.05 or 5%%) or a row count (reservoir). "
+                             "Group sums and counts and the value's sum and mean are estimated for the whole input")
+    parser.add_argument("--stratify", action="store_true",
+                        help="Sample every group (--group_by column) on its own; a row count applies per group")
+    parser.add_argument("--sample-seed", type=int, help="Seed of the sample, for repeatable runs")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="Confidence level of the intervals reported for sampled runs")
+    parser.add_argument("--stream", action="store_true", help="Process rows in bounded-size chunks instead of loading the whole file")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Rows per chunk in --stream mode")
+    parser.add_argument("--impute-error", type=float, default=0.001,
+                        help="Rank error bound of the median sketches used for imputation and the stats (0 = exact median)")
+    parser.add_argument("--date-cache-size", type=int, default=65536, help="Distinct raw date strings kept in the parse cache")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the row-local, growth and aggregation stages")
+    parser.add_argument("--lag", type=int, action="append", default=[], metavar="N",
+                        help="Add the value N periods earlier in the same group (repeatable)")
+    parser.add_argument("--pct-change", type=int, action="append", default=[], metavar="N",
+                        help="Add the percent change over N periods within the group (repeatable)")
+    parser.add_argument("--rolling-mean", type=int, action="append", default=[], metavar="N",
+                        help="Add the mean of the last N periods within the group (repeatable)")
+    parser.add_argument("--running-sum", action="store_true", help="Add the running total within the group")
+    parser.add_argument("--incremental", metavar="STATE_FILE",
+                        help="Process only rows appended since the last run, keeping running state in STATE_FILE. "
+                             "Missing cells are filled with the median or mode of the rows seen so far; the rows "
+                             "with missing cells are kept in STATE_FILE and refilled by every run, so the aggregates, "
+                             "stats and cube match a full run. Rows already written and their window metrics keep "
+                             "the fill values of their run (each run reports fill values that changed)")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="Reuse parsed and standardized rows cached in DIR when the input is unchanged")
+    parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                        help="Size limit of --cache-dir; least recently used entries are evicted")
+    parser.add_argument("--cube", metavar="FILE",
+                        help="Keep a rollup cube (.npz) of value sum, count, sum of squares, min and max per day and "
+                             "group in FILE; --incremental runs add their new rows to it")
+    parser.add_argument("--query-cube", metavar="FILE",
+                        help="Answer --query from a cube built with --cube instead of running the pipeline; "
+                             "--date-from, --date-to and --groups select the cells")
+    parser.add_argument("--query", choices=CUBE_QUERIES, default="totals",
+                        help="Cube query: totals by group, trend of the value sum by --period, or summary stats")
+    parser.add_argument("--period", choices=list(DATE_PART_LENGTHS), default="day", help="Period of a trend query")
+    parser.add_argument("--no-plots", action="store_true", help="Skip the charts (matplotlib is not even imported)")
+    parser.add_argument("--chart-format", choices=["png", "svg"], default="png", help="Image format of the charts")
+    parser.add_argument("--chart-workers", type=int, default=min(3, os.cpu_count() or 1),
+                        help="Worker processes rendering the charts")
+    parser.add_argument("--chart-max-points", type=int, default=1000,
+                        help="Points kept (LTTB downsampling) in the trend line")
+    parser.add_argument("--force-charts", action="store_true",
+                        help="Render the charts even when their data is unchanged since the last run")
+    parser.add_argument("--profile", metavar="FILE", help="Record per-stage time, rows and memory to FILE")
+    parser.add_argument("--profile-format", choices=["jsonl", "prometheus"], default="jsonl",
+                        help="Profile output: JSON lines or Prometheus text format")
+    parser.add_argument("--profile-stage", metavar="STAGE",
+                        help="Stage to capture in detail (cProfile stats or tracemalloc allocations)")
+    parser.add_argument("--profile-detail", choices=["cprofile", "tracemalloc"], default="cprofile",
+                        help="Detail capture used for --profile-stage")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a service accepting jobs over HTTP (see --port and --socket) instead of one job")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the service on 127.0.0.1")
+    parser.add_argument("--socket", metavar="PATH", help="Serve on this Unix socket instead of a TCP port")
+    parser.add_argument("--serve-workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes running the service's jobs")
+    parser.add_argument("--max-queue", type=int, default=16,
+                        help="Jobs waiting for a worker before the service answers 503")
+    parser.add_argument("--warm-datasets", type=int, default=4,
+                        help="Prepared datasets each service worker keeps in memory for later jobs")
+    return parser
+
+# Function: Check option combinations; raises ValueError
+def check_args(args):
+    if args.query_cube:
+        if args.input_file is not None or args.serve:
+            raise ValueError("--query-cube reads only the cube (no input file or --serve)")
+        return
+    if args.input_file is None and not args.serve:
+        raise ValueError("an input file is required")
+    if args.input_file is not None:
+        input_files(args.input_file)
+    if sum([args.stream, args.workers > 1, args.incremental is not None]) > 1:
+        raise ValueError("--stream, --workers and --incremental cannot be combined")
+    if args.cache_dir and (args.stream or args.workers > 1 or args.incremental):
+        raise ValueError("--cache-dir only applies to in-memory runs")
+    if args.read_threads < 1:
+        raise ValueError("--read-threads must be at least 1")
+    if args.sample and (args.stream or args.workers > 1 or args.incremental or args.cache_dir):
+        raise ValueError("--sample cannot be combined with --stream, --workers, --incremental or --cache-dir")
+    if args.sample and args.cube:
+        raise ValueError("--cube needs every row; it cannot be built from a --sample run")
+    if args.stratify and not args.sample:
+        raise ValueError("--stratify needs --sample")
+    if not 0 < args.confidence < 1:
+        raise ValueError("--confidence must be between 0 and 1")
+    if args.output:
+        fmt, _ = output_format(args.output, args.output_format, args.output_compression)
+        if args.incremental and fmt in ('json', 'npz'):
+            raise ValueError(f"--incremental appends to its output, which {fmt} output does not allow")
+    group_column(args.group_by)
+    for spec in [args.group_by] + args.extra_group_by:
+        parse_group_by(spec)
+    for spec in args.aggregates.split(','):
+        make_aggregate(spec, args.value)
+    for bound in (args.date_from, args.date_to):
+        if bound is not None:
+            try:
+                datetime.strptime(bound, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"invalid date bound {bound!r} (expected YYYY-MM-DD)")
 
 # Parse command-line arguments
-parser = argparse.ArgumentParser(description="Functional Data Processing Pipeline with Enhanced Stats and Viz")
-parser.add_argument("input_file", help="Path to input CSV or JSON file")
-parser.add_argument("--group_by", default="region", help="Column to group by for aggregation")
-parser.add_argument("--value", default="sales", help="Numeric value column to process")
-parser.add_argument("--date", default="date", help="Date column to parse")
-parser.add_argument("--threshold", type=float, default=0, help="Filter threshold for value > this")
-parser.add_argument("--output", default="processed_data.csv", help="Output CSV file")
-args = parser.parse_args()
-
-# Function to load data as list
-def load_data(file_path):
-    ext = file_path.lower().split('.')[-1]
-    if ext == 'csv':
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
-    elif ext == 'json':
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            return list(data)
-    else:
-        raise ValueError("Unsupported file format. Use CSV or JSON.")
+def parse_args(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        check_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
 
-# haNDLE mising data
-def compute_stat(data, column, method, numeric=False):
-    clean = [row[column] for row in data if row.get(column) not in (None, '', '0')]
+# Function: (state, add, finish) accumulator that computes method in one pass
+def make_accumulator(method, error):
+    if method is statistics.median and error:
+        return new_sketch(error), sketch_add, sketch_median
+    if method is statistics.mode:
+        return Counter(), counter_add, counter_mode
+    # Exact fallback: keep the values and apply method at the end
+    return [], list.append, method
 
-    if numeric:
-        clean = list(map(float, clean))
-    return method(clean)
-def impute_column(data, column, imputed_value):
-    def impute_row(row):
-        new_row = dict(row)
-        if column not in new_row or new_row[column] in (None, ''):
-            new_row[column] = imputed_value
-        return new_row
+# Function: Fresh (numeric, state, add, finish) accumulator per configured column
+def new_accumulators(config, error=0.001):
+    return {column: (numeric,) + make_accumulator(method, error) for column, (method, numeric) in config.items()}
 
-    return list(map(impute_row, data))
-def recursive_impute(data, config):
-    if not config:
-        return data
+# Function: Feed the non-missing cells of every row into the column accumulators
+def feed_accumulators(accumulators, data):
+    for row in data:
+        for column, (numeric, state, add, _) in accumulators.items():
+            value = row.get(column)
+            if value not in (None, '', '0'):
+                add(state, float(value) if numeric else value)
+    return accumulators
 
-    column, (method, numeric) = next(iter(config.items()))
-    rest_config = dict(list(config.items())[1:])
+# haNDLE mising data: gather the fill value of every configured column in a single pass
+def gather_fill_values(data, config, error=0.001):
+    accumulators = feed_accumulators(new_accumulators(config, error), data)
+    return {column: finish(state) for column, (_, state, _, finish) in accumulators.items()}
 
-    stat_value = compute_stat(data, column, method, numeric=numeric)
-    updated_data = impute_column(data, column, stat_value)
+# Function: Impute missing cells of every configured column (one pass to gather, one to fill). keep: filter of the
+# filled rows; the fill values still come from every row
+def impute_data(data, config, error=0.001, keep=None):
+    fill_values = gather_fill_values(data, config, error)
+    if keep is not None:
+        return [row for row in (fill_row(row, fill_values) for row in data) if keep(row)]
+    return [fill_row(row, fill_values) for row in data]
 
-    return recursive_impute(updated_data, rest_config)
+# Function: Imputation method per column used by the pipeline
+def build_impute_config(group_by_col, value_col, date_col):
+    return {
+        value_col: (statistics.median, True),
+        group_by_col: (statistics.mode, False),
+        date_col: (statistics.mode, False)
+    }
+
+# Function: Fill the missing cells of one row from precomputed fill values
+def fill_row(row, fill_values):
+    missing = [column for column in fill_values if row.get(column) in (None, '')]
+    if not missing:
+        return row
+    return field_setter(*missing)(row, *(fill_values[column] for column in missing))
 
 
 # Function: Standardize numerical to float
 def standardize_value(row, value_col):
     try:
-        return {**row, value_col: round(float(row[value_col]), 2)}
+        return field_setter(value_col)(row, round(float(row[value_col]), 2))
     except ValueError:
         return None
 
-# Function: Standardize categorical
+# Function: Standardize categorical; values are interned, so each distinct category is stored once
 def standardize_categorical(row, cat_col):
     val = row.get(cat_col, 'Unknown')
-    return {**row, cat_col: str(val).strip()}
+    return field_setter(cat_col)(row, sys.intern(str(val).strip()))
 
-# Function: Parse date, return None if invalid
-def parse_date(row, date_col):
-    if date_col not in row or not row[date_col]:
-        return None
-    formats = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d']
-    for fmt in formats:
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%Y/%m/%d']
+
+# Function: First `size` non-empty values of a column (reads only the head of a stream)
+def sample_column(data, column, size=1000):
+    return list(islice((row[column] for row in data if row.get(column) not in (None, '')), size))
+
+# Function: Pick the format that parses the most sample values (earlier formats win ties)
+def detect_date_format(sample, formats=DATE_FORMATS):
+    def parses(value, fmt):
         try:
-            parsed = datetime.strptime(row[date_col], fmt)
-            return {**row, date_col: parsed.strftime('%Y-%m-%d')}
+            datetime.strptime(value, fmt)
+            return True
         except ValueError:
-            pass
-    return None
+            return False
+    counts = [sum(parses(value, fmt) for value in sample) for fmt in formats]
+    return formats[counts.index(max(counts))]
+
+# Function: Memoized raw string -> YYYY-MM-DD parser trying the detected format first, then the rest in order
+def make_date_parser(primary_format=DATE_FORMATS[0], formats=DATE_FORMATS, cache_size=65536):
+    ordered = [primary_format] + [fmt for fmt in formats if fmt != primary_format]
+
+    @lru_cache(maxsize=cache_size)
+    def parse(raw):
+        for fmt in ordered:
+            try:
+                return datetime.strptime(raw, fmt).strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+        return None
+
+    parse.format = primary_format
+    return parse
+
+# Function: Format picked by a date parser and its cache hit rate
+def describe_date_parser(parser, hits=None, misses=None):
+    if hits is None:
+        hits, misses = parser.cache_info().hits, parser.cache_info().misses
+    lookups = hits + misses
+    hit_rate = hits / lookups if lookups else 0.0
+    return f"format {parser.format}, cache hit rate {hit_rate:.1%} ({hits} hits, {misses} misses)"
+
+default_date_parser = make_date_parser()
+
+# Function: Ordinal of a normalized YYYY-MM-DD string; memoized so sorting and trend stats skip strptime per row
+@lru_cache(maxsize=65536)
+def iso_ordinal(value):
+    return datetime.strptime(value, '%Y-%m-%d').toordinal()
+
+# Function: Parse date, return None if invalid
+def parse_date(row, date_col, parser=default_date_parser):
+    raw = row.get(date_col)
+    if not raw:
+        return None
+    parsed = parser(raw)
+    if parsed is None:
+        return None
+    return field_setter(date_col)(row, parsed)
 
 # Function: Filter value > threshold
 def filter_high_value(row, value_col, threshold):
     return row.get(value_col, 0) > threshold
 
-# Function: Aggregate total value per group_by using reduce
+# Row predicates beyond --threshold: {'groups': group values to keep, 'date_from'/'date_to': inclusive YYYY-MM-DD
+# bounds}, each None when unused. Predicates are pushed down to the rows as they are read, under one rule:
+# imputation statistics (median value, mode group and date) and the date format are always computed over every
+# input row, and the predicates are evaluated on the filled row with the same conversions the later stages apply.
+# A pushed-down predicate therefore rejects exactly the rows the filter stage would, just before paying for their
+# standardization and date parsing
+
+# Function: Predicates from the parsed arguments; None when only the threshold applies
+def build_predicates(groups=None, date_from=None, date_to=None):
+    if groups is None and date_from is None and date_to is None:
+        return None
+    return {'groups': sorted(groups) if groups is not None else None, 'date_from': date_from, 'date_to': date_to}
+
+# Function: Filter of standardized rows: value above threshold and the predicates
+def make_row_filter(group_by_col, value_col, date_col, threshold, predicates=None):
+    if predicates is None:
+        return lambda row: filter_high_value(row, value_col, threshold)
+    groups = set(predicates['groups']) if predicates['groups'] is not None else None
+    date_from, date_to = predicates['date_from'], predicates['date_to']
+
+    def keep(row):
+        if not filter_high_value(row, value_col, threshold):
+            return False
+        if groups is not None and row.get(group_by_col) not in groups:
+            return False
+        date = row.get(date_col)
+        return (date_from is None or date >= date_from) and (date_to is None or date <= date_to)
+    return keep
+
+# Function: The same filter on a row fresh from imputation (raw cells). Rows that standardization or date
+# parsing would drop are rejected as well
+def make_raw_filter(group_by_col, value_col, date_col, threshold, predicates=None, date_parser=default_date_parser):
+    groups = set(predicates['groups']) if predicates and predicates['groups'] is not None else None
+    date_from = predicates['date_from'] if predicates else None
+    date_to = predicates['date_to'] if predicates else None
+
+    def keep(row):
+        try:
+            if not round(float(row[value_col]), 2) > threshold:
+                return False
+        except ValueError:
+            return False
+        if groups is not None and str(row.get(group_by_col, 'Unknown')).strip() not in groups:
+            return False
+        if date_from is not None or date_to is not None:
+            date = date_parser(row[date_col]) if row.get(date_col) else None
+            if date is None or (date_from is not None and date < date_from) or \
+                    (date_to is not None and date > date_to):
+                return False
+        return True
+    return keep
+
+# Function: Aggregate total value per group_by in one hash pass; only the distinct keys are sorted
 def aggregate_values(data, group_by_col, value_col):
-    def get_key(r):
-        return r.get(group_by_col, 'Unknown')
-    sorted_data = sorted(data, key=get_key)
-    grouped = groupby(sorted_data, key=get_key)
-    return {key: sum(row[value_col] for row in group_iter) for key, group_iter in grouped}
-
-# Pipeline: Compose functions
-def process_pipeline(input_data, group_by_col, value_col, date_col, threshold):
-    growth_col = f"{value_col}_growth_pct"
-    
-    # Impute missing values
-    impute_config = {
-    value_col: (statistics.median, True), 
-    group_by_col: (statistics.mode, False),
-    date_col: (statistics.mode, False)
+    totals = {}
+    for row in data:
+        key = row.get(group_by_col, 'Unknown')
+        totals[key] = totals.get(key, 0) + row[value_col]
+    return dict(sorted(totals.items()))
+
+# Function: Percent change from the previous value (0 for a group's first row or a zero base)
+def growth_pct(prev_val, value):
+    if prev_val is None or prev_val == 0:
+        return 0.0
+    return (value - prev_val) / prev_val * 100
+
+# Window steps: step(state, value, periods) -> output, where state is the group's own JSON-friendly list
+def lag_step(state, value, periods):
+    result = state[0] if len(state) == periods else None
+    state.append(value)
+    if len(state) > periods:
+        del state[0]
+    return result
+
+def pct_change_step(state, value, periods):
+    return round(growth_pct(lag_step(state, value, periods), value), 2)
+
+def running_sum_step(state, value, periods):
+    if not state:
+        state.append(0)
+    state[0] += value
+    return round(state[0], 2)
+
+def rolling_mean_step(state, value, periods):
+    # state = [window total, last `periods` values...]; early rows average what is available
+    if not state:
+        state.append(0)
+    state.append(value)
+    state[0] += value
+    if len(state) > periods + 1:
+        state[0] -= state.pop(1)
+    return round(state[0] / (len(state) - 1), 2)
+
+WINDOW_STEPS = {
+    'lag': lag_step,
+    'pct_change': pct_change_step,
+    'running_sum': running_sum_step,
+    'rolling_mean': rolling_mean_step
 }
-    imputed = recursive_impute(input_data, impute_config)
+
+# Function: Window ops as (output column, step kind, periods); growth is always the first one
+def build_window_ops(value_col, lags=(), pct_changes=(), rolling_means=(), running_sum=False):
+    ops = [(f"{value_col}_growth_pct", 'pct_change', 1)]
+    ops += [(f"{value_col}_lag_{n}", 'lag', n) for n in lags]
+    ops += [(f"{value_col}_pct_change_{n}", 'pct_change', n) for n in pct_changes]
+    ops += [(f"{value_col}_rolling_mean_{n}", 'rolling_mean', n) for n in rolling_means]
+    if running_sum:
+        ops.append((f"{value_col}_running_sum", 'running_sum', 0))
+    return ops
+
+# Function: Per-group sequential window stage: one linear pass over rows already sorted by group.
+# carry, when given, maps group -> step states and is updated so a later run can continue the windows.
+def group_window(sorted_rows, group_by_col, value_col, ops=None, carry=None):
+    steps = [(column, WINDOW_STEPS[kind], periods) for column, kind, periods in ops or build_window_ops(value_col)]
+    add_windows = field_setter(*(column for column, _, _ in steps))
+    for key, group_iter in groupby(sorted_rows, key=itemgetter(group_by_col)):
+        if carry is None:
+            states = [[] for _ in steps]
+        else:
+            states = carry.setdefault(key, [[] for _ in steps])
+        for row in group_iter:
+            value = row[value_col]
+            yield pack_row(add_windows(row, *[step(state, value, periods)
+                                              for (_, step, periods), state in zip(steps, states)]))
+
+# Function: Sort key by group_by then parsed date
+def group_date_key(group_by_col, date_col):
+    def sort_key(r):
+        try:
+            return (r[group_by_col], iso_ordinal(r[date_col]))
+        except (KeyError, ValueError):
+            return (r[group_by_col], 0)  # Fallback for missing/invalid dates
+    return sort_key
+
+# Pipeline: Compose functions (each step is recorded as a stage when a profiler is given)
+def process_pipeline(input_data, group_by_col, value_col, date_col, threshold, impute_error=0.001,
+                     date_parser=None, window_ops=None, profiler=None, predicates=None):
+    parsed = prepare_rows(input_data, group_by_col, value_col, date_col, impute_error, date_parser, profiler,
+                          (threshold, predicates))
+    return finish_rows(parsed, group_by_col, value_col, date_col, threshold, window_ops, profiler, predicates)
+
+# Pipeline: Imputation and standardization; the result does not depend on threshold or window settings unless
+# pushdown = (threshold, predicates) is given, which drops the rows the filter would reject right after imputation
+def prepare_rows(input_data, group_by_col, value_col, date_col, impute_error=0.001, date_parser=None,
+                 profiler=None, pushdown=None):
+    if date_parser is None:
+        date_parser = make_date_parser(detect_date_format(sample_column(input_data, date_col)))
+
+    # Impute missing values
+    impute_config = build_impute_config(group_by_col, value_col, date_col)
+    keep = None
+    if pushdown is not None:
+        keep = make_raw_filter(group_by_col, value_col, date_col, *pushdown, date_parser)
+    # Each stage's rows replace the previous ones, which are freed as soon as they are no longer needed
+    rows = run_stage(profiler, 'impute', lambda rows: impute_data(rows, impute_config, impute_error, keep), input_data)
     
     # Standardize value (filter None for invalid)
-    standardized = list(filter(None, (standardize_value(row, value_col) for row in imputed)))
+    rows = run_stage(profiler, 'standardize_value',
+                     lambda rows: list(filter(None, (standardize_value(row, value_col) for row in rows))), rows)
     
     # Standardize group_by
-    standardized_group = [standardize_categorical(row, group_by_col) for row in standardized]
+    rows = run_stage(profiler, 'standardize_group',
+                     lambda rows: [standardize_categorical(row, group_by_col) for row in rows], rows)
     
     # Parse dates (filter None for invalid dates)
-    parsed = list(filter(None, (parse_date(row, date_col) for row in standardized_group)))
-    
-    # Filter high value
-    filtered = [row for row in parsed if filter_high_value(row, value_col, threshold)]
-    
-    # Sort by group_by and date for sequential growth
-    def sort_key(r):
-        try:
-            return (r[group_by_col], datetime.strptime(r[date_col], '%Y-%m-%d'))
-        except (KeyError, ValueError):
-            return (r[group_by_col], datetime.min)  # Fallback for missing/invalid dates
+    return run_stage(profiler, 'parse_date',
+                     lambda rows: list(filter(None, (parse_date(row, date_col, date_parser) for row in rows))), rows)
+
+# Pipeline: Filter, sort and window the standardized rows
+def finish_rows(parsed, group_by_col, value_col, date_col, threshold, window_ops=None, profiler=None,
+                predicates=None):
+
+    # Filter high value (and the other predicates)
+    keep = make_row_filter(group_by_col, value_col, date_col, threshold, predicates)
+    filtered = run_stage(profiler, 'filter', lambda rows: [row for row in rows if keep(row)], parsed)
     
-    sorted_data = sorted(filtered, key=sort_key)
+    # Sort once by group_by and date; every later stage reuses this order
+    sorted_data = run_stage(profiler, 'sort', lambda rows: sorted(rows, key=group_date_key(group_by_col, date_col)),
+                            filtered)
     
-    # Compute sequential growth per group
-    def compute_growth(group):
-        def growth_reducer(acc, row):
-            prev_val, results = acc
-            if prev_val is None:
-                growth = 0.0
-            else:
-                growth = ((row[value_col] - prev_val) / prev_val * 100) if prev_val != 0 else 0.0
-            new_row = {**row, growth_col: round(growth, 2)}
-            return (row[value_col], results + [new_row])
-        _, processed_group = reduce(growth_reducer, group, (None, []))
-        return processed_group
-    
-    grouped = groupby(sorted_data, key=lambda r: r[group_by_col])
-    processed = [item for key, group_iter in grouped for item in compute_growth(list(group_iter))]
+    # Sequential growth (and any other window metrics) per group
+    processed = run_stage(profiler, 'window',
+                          lambda rows: list(group_window(rows, group_by_col, value_col, window_ops)),
+                          sorted_data)
     
     return processed
 
-# Statistical summaries, including trend analysis
-def compute_stats(data, value_col, date_col):
-    value_list = [row[value_col] for row in data]
-    if not value_list:
-        return {
-            f"mean_{value_col}": 0,
-            f"median_{value_col}": 0,
-            f"variance_{value_col}": 0,
-            f"stdev_{value_col}": 0,
-            f"min_{value_col}": 0,
-            f"max_{value_col}": 0,
-            f"mode_{value_col}": "No data",
-            "trend_slope": 0,
-            "correlation_with_time": 0
-        }
-    stats = {
-        f"mean_{value_col}": statistics.mean(value_list),
-        f"median_{value_col}": statistics.median(value_list),
-        f"variance_{value_col}": statistics.variance(value_list) if len(value_list) > 1 else 0,
-        f"stdev_{value_col}": statistics.stdev(value_list) if len(value_list) > 1 else 0,
-        f"min_{value_col}": min(value_list),
-        f"max_{value_col}": max(value_list),
-    }
+# Function: Write rows to an anonymous temporary file, one pickle per row
+def spill_rows(rows):
+    handle = tempfile.TemporaryFile()
+    for row in rows:
+        pickle.dump(row, handle, pickle.HIGHEST_PROTOCOL)
+    handle.seek(0)
+    return handle
+
+# Function: Sort one chunk and spill it as a run for the external merge
+def spill_sorted_run(chunk, key):
+    return spill_rows(sorted(chunk, key=key))
+
+# Function: Read the rows of a spilled run back lazily
+def iter_run(handle):
+    while True:
+        try:
+            yield pickle.load(handle)
+        except EOFError:
+            return
+
+# Function: Collapse runs in input order until at most fan_in remain (keeps the merge stable and bounds open files)
+def compact_runs(runs, key, fan_in=64):
+    while len(runs) > fan_in:
+        batch = runs[:fan_in]
+        merged = spill_rows(heapq.merge(*map(iter_run, batch), key=key))
+        for run in batch:
+            run.close()
+        runs = [merged] + runs[fan_in:]
+    return runs
+
+# Function: Row-local stages (impute, standardize, parse dates, filter) as a lazy generator chain
+def row_stages(rows, fill_values, group_by_col, value_col, date_col, threshold, date_parser=default_date_parser,
+               predicates=None):
+    rows = (fill_row(row, fill_values) for row in rows)
+    # Filter pushed down ahead of standardization and date parsing
+    rows = filter(make_raw_filter(group_by_col, value_col, date_col, threshold, predicates, date_parser), rows)
+    rows = filter(None, (standardize_value(row, value_col) for row in rows))
+    rows = (standardize_categorical(row, group_by_col) for row in rows)
+    rows = filter(None, (parse_date(row, date_col, date_parser) for row in rows))
+    return filter(make_row_filter(group_by_col, value_col, date_col, threshold, predicates), rows)
+
+# Pipeline: Same stages as process_pipeline, streamed in chunks through an external merge sort.
+# Rows are written to output_path as they leave the merge and fed to the groupings (see build_groupings, default
+# totals by group and by date), to a summary of the values (see new_summary) and to the cube if given (see
+# new_cube); returns the groupings and the summary, or None when no rows are left.
+def process_pipeline_stream(file_path, group_by_col, value_col, date_col, threshold, output_path, chunk_size,
+                            impute_error=0.001, date_parser=None, window_ops=None, groupings=None, predicates=None,
+                            columns=None, output_format=None, output_compression=None, cube=None):
+    # Impute missing values from statistics gathered in a first pass over the file
+    impute_config = build_impute_config(group_by_col, value_col, date_col)
+    fill_values = gather_fill_values(iter_data(file_path, columns), impute_config, impute_error)
+    if date_parser is None:
+        date_parser = make_date_parser(detect_date_format(sample_column(iter_data(file_path), date_col)))
+
+    rows = row_stages(iter_data(file_path, columns), fill_values, group_by_col, value_col, date_col, threshold,
+                      date_parser, predicates)
+
+    # Sort each chunk, spill it, then merge the runs by group_by and date
+    sort_key = group_date_key(group_by_col, date_col)
+    runs = [spill_sorted_run(chunk, sort_key) for chunk in chunked(rows, chunk_size)]
+    runs = compact_runs(runs, sort_key)
+    merged = heapq.merge(*map(iter_run, runs), key=sort_key)
+
+    if groupings is None:
+        groupings = build_groupings(group_by_col, ['sum'], value_col, date_col)
+    updaters = [grouping_updater(grouping) for grouping in groupings]
+    summary = new_summary(impute_error)
+
+    def feed(batch):
+        for update in updaters:
+            update(batch)
+        summary_update(summary, [row[value_col] for row in batch], [iso_ordinal(row[date_col]) for row in batch])
+        if cube is not None:
+            cube_update(cube, batch)
+
+    batch = []
     try:
-        stats[f"mode_{value_col}"] = statistics.mode(value_list)
-    except statistics.StatisticsError:
-        stats[f"mode_{value_col}"] = "No unique mode"
-    
-    # Trend analysis: linear regression on time vs value
-    if date_col and all(date_col in row for row in data):
-        sorted_data = sorted(data, key=lambda r: r[date_col])
-        time_nums = [datetime.strptime(r[date_col], '%Y-%m-%d').toordinal() for r in sorted_data]
-        values = [r[value_col] for r in sorted_data]
-        if len(value_list) > 1:
-            result = linregress(time_nums, values)
-            stats["trend_slope"] = round(result.slope, 4)
-            stats["correlation_with_time"] = round(result.rvalue, 4)
-        else:
-            stats["trend_slope"] = 0
-            stats["correlation_with_time"] = 0
-    else:
-        stats["trend_slope"] = 0
-        stats["correlation_with_time"] = 0
-    
-    return stats
+        # Batches are written by the sink's thread while the next ones leave the merge
+        with output_sink(output_path, output_format, output_compression) as sink:
+            for row in group_window(merged, group_by_col, value_col, window_ops):
+                batch.append(row)
+                if len(batch) == 4096:
+                    sink_write(sink, batch)
+                    feed(batch)
+                    batch = []
+            sink_write(sink, batch)
+            feed(batch)
+    finally:
+        for run in runs:
+            run.close()
 
-# Visualization functions
-def create_aggregates_bar(aggregates, group_by_col, value_col):
-    if not aggregates:
+    if summary['stats']['count'] == 0:
         return None
-    keys = list(aggregates.keys())
-    values = list(aggregates.values())
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.bar(keys, values)
-    ax.set_xlabel(group_by_col.capitalize())
-    ax.set_ylabel(f"Total {value_col.capitalize()}")
-    ax.set_title(f"Aggregate {value_col.capitalize()} by {group_by_col.capitalize()}")
-    return fig
-
-def create_histogram(value_list, value_col):
-    if not value_list:
+    return groupings, summary
+
+# Worker: one shard's contribution to gather_fill_values (counts for modes, cleaned values otherwise)
+def gather_shard(shard, config):
+    partials = {column: Counter() if method is statistics.mode else [] for column, (method, _) in config.items()}
+    for row in iter_shard(shard):
+        for column, (method, numeric) in config.items():
+            value = row.get(column)
+            if value in (None, '', '0'):
+                continue
+            if method is statistics.mode:
+                partials[column][value] += 1
+            else:
+                partials[column].append(float(value) if numeric else value)
+    return partials
+
+# Function: Fold shard partials into the same accumulators, in shard order, so fill values match a serial pass
+def merge_fill_values(shard_partials, config, error=0.001):
+    accumulators = {column: make_accumulator(method, error) for column, (method, _) in config.items()}
+    for partials in shard_partials:
+        for column, partial in partials.items():
+            state, add, _ = accumulators[column]
+            if isinstance(partial, Counter):
+                state.update(partial)
+            else:
+                for value in partial:
+                    add(state, value)
+    return {column: finish(state) for column, (state, _, finish) in accumulators.items()}
+
+# Function: One date parser per worker process and format, so its cache survives across shards
+@lru_cache(maxsize=None)
+def worker_date_parser(date_format, cache_size):
+    return make_date_parser(date_format, cache_size=cache_size)
+
+# Worker: row-local stages over one shard, rows bucketed by group key for the shuffle
+def process_shard(shard, fill_values, group_by_col, value_col, date_col, threshold, date_format, cache_size, partitions,
+                  predicates=None):
+    date_parser = worker_date_parser(date_format, cache_size)
+    before = date_parser.cache_info()
+    buckets = [[] for _ in range(partitions)]
+    for row in row_stages(iter_shard(shard), fill_values, group_by_col, value_col, date_col, threshold, date_parser,
+                          predicates):
+        buckets[partition_of(row[group_by_col], partitions)].append(row)
+    after = date_parser.cache_info()
+    return buckets, after.hits - before.hits, after.misses - before.misses
+
+# Worker: sort one partition by group and date, attach growth/window metrics and feed it to the groupings
+# built from specs (see new_grouping); returns the rows and each grouping's states
+def growth_partition(rows, group_by_col, value_col, date_col, window_ops=None, specs=()):
+    rows.sort(key=group_date_key(group_by_col, date_col))
+    processed = list(group_window(rows, group_by_col, value_col, window_ops))
+    groupings = feed_groupings([new_grouping(*spec) for spec in specs], processed)
+    return processed, [grouping['groups'] for grouping in groupings]
+
+# Pipeline: process_pipeline over shards in a process pool; returns the same rows as the serial run,
+# the groupings (see build_groupings, default totals by group and by date) and the workers' date cache (hits, misses).
+# Groupings keyed by the group column are fed in the workers, whose partitions hold disjoint groups; the others
+# in one scan of the merged rows, so every total adds up in the serial order
+def process_pipeline_parallel(file_path, group_by_col, value_col, date_col, threshold, workers,
+                              impute_error=0.001, date_parser=None, window_ops=None, groupings=None,
+                              predicates=None, columns=None):
+    impute_config = build_impute_config(group_by_col, value_col, date_col)
+    if date_parser is None:
+        date_parser = make_date_parser(detect_date_format(sample_column(iter_data(file_path), date_col)))
+    shards = make_shards(file_path, workers * 4, columns)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Impute statistics: shard partials folded in order
+        fill_values = merge_fill_values(pool.map(gather_shard, shards, repeat(impute_config)),
+                                        impute_config, impute_error)
+
+        # Row-local stages per shard, then shuffle by group key (shard order keeps each group in input order)
+        shard_results = list(pool.map(process_shard, shards, repeat(fill_values), repeat(group_by_col),
+                                      repeat(value_col), repeat(date_col), repeat(threshold),
+                                      repeat(date_parser.format), repeat(date_parser.cache_info().maxsize),
+                                      repeat(workers), repeat(predicates)))
+        partitions = [[row for buckets, _, _ in shard_results for row in buckets[p]] for p in range(workers)]
+        hits = sum(result[1] for result in shard_results)
+        misses = sum(result[2] for result in shard_results)
+        del shard_results
+
+        # Growth and per-partition groupings
+        if groupings is None:
+            groupings = build_groupings(group_by_col, ['sum'], value_col, date_col)
+        local, rest = [], []
+        for grouping in groupings:
+            (local if (group_by_col, None) in parse_group_by(grouping['spec'][0]) else rest).append(grouping)
+        results = list(pool.map(growth_partition, partitions, repeat(group_by_col), repeat(value_col),
+                                repeat(date_col), repeat(window_ops), repeat([grouping['spec'] for grouping in local])))
+
+    # Partitions hold disjoint groups, so merging them by the sort key restores the serial order
+    processed = list(heapq.merge(*(rows for rows, _ in results), key=group_date_key(group_by_col, date_col)))
+    for _, partials in results:
+        for grouping, groups in zip(local, partials):
+            merge_grouping(grouping, groups)
+    feed_groupings(rest, processed)
+    return processed, groupings, (hits, misses)
+
+# Summary statistics in one pass: a summary holds running moments of (time ordinal, value) pairs (mean,
+# variance, min, max and the least-squares trend), a quantile sketch for the median and value counts for the mode.
+# Summaries are fed in batches and summaries of disjoint rows merge, so chunks, runs and workers can each keep
+# their own. Memory is bounded by the sketch and the distinct values
+
+# Function: Empty running statistics of (time ordinal, value) pairs: Welford moments plus co-moment for the trend
+def new_running_stats():
+    return {'count': 0, 'mean_x': 0.0, 'mean_y': 0.0, 'm2_x': 0.0, 'm2_y': 0.0, 'c_xy': 0.0,
+            'min': None, 'max': None}
+
+# Function: Fold other running statistics into stats (pairwise update of the means and centred moments)
+def merge_running_stats(stats, other):
+    if other['count'] == 0:
+        return stats
+    if stats['count'] == 0:
+        stats.update(other)
+        return stats
+    n = stats['count'] + other['count']
+    dx = other['mean_x'] - stats['mean_x']
+    dy = other['mean_y'] - stats['mean_y']
+    weight = stats['count'] * other['count'] / n
+    stats['m2_x'] += other['m2_x'] + dx * dx * weight
+    stats['m2_y'] += other['m2_y'] + dy * dy * weight
+    stats['c_xy'] += other['c_xy'] + dx * dy * weight
+    stats['mean_x'] += dx * other['count'] / n
+    stats['mean_y'] += dy * other['count'] / n
+    stats['count'] = n
+    stats['min'] = min(stats['min'], other['min'])
+    stats['max'] = max(stats['max'], other['max'])
+    return stats
+
+# Function: Add a batch of (time ordinal, value) pairs to running statistics
+def running_stats_update(stats, xs, ys):
+    if not len(ys):
+        return stats
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    dx = x - x.mean()
+    dy = y - y.mean()
+    batch = {'count': len(y), 'mean_x': float(x.mean()), 'mean_y': float(y.mean()), 'm2_x': float(dx @ dx),
+             'm2_y': float(dy @ dy), 'c_xy': float(dx @ dy), 'min': min(ys), 'max': max(ys)}
+    return merge_running_stats(stats, batch)
+
+# Function: Empty summary; error bounds the rank error of the median (0 = exact, keeping every value)
+def new_summary(error=0.001):
+    return {'stats': new_running_stats(), 'sketch': new_sketch(error), 'counts': Counter(), 'trend': True}
+
+# Function: Add a batch of values and their time ordinals to a summary. Without times (rows without dates) the
+# summary has no trend
+def summary_update(summary, values, times=None):
+    if times is None:
+        summary['trend'] = False
+        times = np.zeros(len(values))
+    running_stats_update(summary['stats'], times, values)
+    sketch_extend(summary['sketch'], values)
+    summary['counts'].update(values)
+    return summary
+
+# Function: Fold the summary of other rows into summary (for the mode, values seen first in summary win ties)
+def merge_summary(summary, other):
+    merge_running_stats(summary['stats'], other['stats'])
+    sketch_merge(summary['sketch'], other['sketch'])
+    summary['counts'].update(other['counts'])
+    summary['trend'] = summary['trend'] and other['trend']
+    return summary
+
+# Function: Summary of rows in one pass, fed a chunk at a time
+def summarize_rows(rows, value_col, date_col, error=0.001, chunk_size=4096):
+    summary = new_summary(error)
+    for chunk in chunked(rows, chunk_size):
+        values = [row[value_col] for row in chunk]
+        times = None
+        if date_col and all(date_col in row for row in chunk):
+            times = [iso_ordinal(row[date_col]) for row in chunk]
+        summary_update(summary, values, times)
+    return summary
+
+# Function: JSON-ready form of a summary (value counts are keyed by repr) and back
+def summary_state(summary):
+    return {**summary, 'counts': {repr(value): count for value, count in summary['counts'].items()}}
+
+def restore_summary(saved):
+    return {**saved, 'counts': Counter({float(value): count for value, count in saved['counts'].items()})}
+
+# Function: Stats of a summary, as printed by the pipeline
+def summary_stats(summary, value_col):
+    stats = summary['stats']
+    n = stats['count']
+    if n == 0:
+        return empty_stats(value_col)
+    variance = stats['m2_y'] / (n - 1) if n > 1 else 0
+    trend = summary['trend'] and n > 1
+    slope = stats['c_xy'] / stats['m2_x'] if stats['m2_x'] else 0
+    spread = math.sqrt(stats['m2_x'] * stats['m2_y'])
+    correlation = max(-1.0, min(1.0, stats['c_xy'] / spread)) if spread else 0
+    return {
+        f"mean_{value_col}": stats['mean_y'],
+        f"median_{value_col}": sketch_median(summary['sketch']),
+        f"variance_{value_col}": variance,
+        f"stdev_{value_col}": math.sqrt(variance) if n > 1 else 0,
+        f"min_{value_col}": stats['min'],
+        f"max_{value_col}": stats['max'],
+        f"mode_{value_col}": counter_mode(summary['counts']),
+        "trend_slope": round(slope, 4) if trend else 0,
+        "correlation_with_time": round(correlation, 4) if trend else 0
+    }
+
+# Function: Stats when no rows are left
+def empty_stats(value_col):
+    return {
+        f"mean_{value_col}": 0,
+        f"median_{value_col}": 0,
+        f"variance_{value_col}": 0,
+        f"stdev_{value_col}": 0,
+        f"min_{value_col}": 0,
+        f"max_{value_col}": 0,
+        f"mode_{value_col}": "No data",
+        "trend_slope": 0,
+        "correlation_with_time": 0
+    }
+
+# Function: Load an incremental state file, refusing one built with different settings
+def load_state(state_path, settings):
+    if not os.path.exists(state_path):
         return None
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(value_list, bins=10, edgecolor='black')
-    ax.set_xlabel(value_col.capitalize())
-    ax.set_ylabel('Frequency')
-    ax.set_title(f"Histogram of {value_col.capitalize()} Values")
-    return fig
-
-def create_trend_line(date_aggregates, date_col, value_col):
-    if not date_aggregates:
+    with open(state_path, 'r') as file:
+        state = json.load(file)
+    if state.get('settings') != settings:
+        raise ValueError(f"State file {state_path} was built with different settings; delete it to rebuild.")
+    return state
+
+# Function: Write the state file atomically (temp file + rename)
+def save_state(state, state_path):
+    temp_path = state_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        # default=list: distinct counters keep their registers in a bytearray
+        json.dump(state, file, default=list)
+    os.replace(temp_path, state_path)
+
+# Function: Records appended since the last run, and the new position (byte offset of complete CSV lines, or record count)
+def read_new_records(file_path, state, columns=None):
+    if isinstance(file_path, dict):
+        return read_new_files(file_path, state, columns)
+    if input_format(file_path) == 'csv' and compression_of(file_path) is None:
+        with open(file_path, 'rb') as file:
+            if state['fieldnames'] is None:
+                header = file.readline()
+                state['fieldnames'] = next(csv.reader([header.decode('utf-8')]), [])
+                state['position'] = len(header)
+            file.seek(0, os.SEEK_END)
+            if file.tell() < state['position']:
+                raise ValueError("Input file shrank since the last run; delete the state file to rebuild.")
+            file.seek(state['position'])
+            tail = file.read()
+        # A trailing partial line is left for the next run
+        complete = tail[:tail.rfind(b'\n') + 1]
+        records = list(csv_records(complete.decode('utf-8').splitlines(), state['fieldnames'], columns))
+        return records, state['position'] + len(complete)
+    # Other inputs are tracked by record count; records already seen are skipped as they stream past
+    records = []
+    seen = 0
+    for seen, record in enumerate(iter_data(file_path, columns), 1):
+        if seen > state['position']:
+            records.append(record)
+    if seen < state['position']:
+        raise ValueError("Input file shrank since the last run; delete the state file to rebuild.")
+    return records, seen
+
+# Function: Records of the files of a file set not read in an earlier run, and the new position: {path: [size,
+# mtime_ns, content hash]} of the files read so far. A file whose content was read before (under any path) is
+# skipped; files are taken as complete once they are listed, so one that changed since it was read is an error
+def read_new_files(file_set, state, columns=None):
+    position = dict(state['position'] or {})
+    read = {content for _, _, content in position.values()}
+    new_files = []
+    for path in file_set['files']:
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        saved = position.get(key)
+        if saved is not None and saved[:2] == [stat.st_size, stat.st_mtime_ns]:
+            continue
+        content = content_digest(path)
+        if saved is not None and saved[2] != content:
+            raise ValueError(f"{path} changed since it was processed; delete the state file to rebuild.")
+        position[key] = [stat.st_size, stat.st_mtime_ns, content]
+        if content not in read:
+            read.add(content)
+            new_files.append(path)
+    records = load_data({**file_set, 'files': new_files}, columns) if new_files else []
+    return records, position
+
+# Pipeline: Process only the rows appended since the last run, using and updating the persisted state.
+# New rows are appended to output_path; returns the groupings (see build_groupings, default totals by group and by
+# date) and the summary of the values (see new_summary) over all rows seen, the number of new rows, the date parser
+# and the fill values that changed: {column: (earlier fill, new fill, missing cells filled in earlier runs)}.
+# The state keeps the groupings and summary of the rows without missing cells, and the rows with missing cells
+# themselves, which every run refills with its fill values, so the aggregates and stats are those of a full run.
+# Rows already written and the window metrics keep the fill values of their run (aggregates of window columns
+# leave the refilled rows out).
+# A cube (see new_cube) must hold the rows of the earlier runs; it is rebuilt from the cells of the rows without
+# missing cells, kept by the state, and the refilled rows
+def process_pipeline_incremental(file_path, group_by_col, value_col, date_col, threshold, output_path, state_path,
+                                 impute_error=0.001, date_cache_size=65536, window_ops=None, groupings=None,
+                                 predicates=None, columns=None, output_format=None, output_compression=None,
+                                 cube=None):
+    window_ops = window_ops or build_window_ops(value_col)
+    if groupings is None:
+        groupings = build_groupings(group_by_col, ['sum'], value_col, date_col)
+    settings = {'input_file': os.path.abspath(input_name(file_path)), 'group_by': group_by_col, 'value': value_col,
+                'date': date_col, 'threshold': threshold, 'impute_error': impute_error,
+                'window_ops': [list(op) for op in window_ops],
+                'groupings': [list(grouping['spec'][:2]) for grouping in groupings], 'predicates': predicates,
+                'columns': columns}
+    state = load_state(state_path, settings)
+    fresh = state is None
+    if fresh:
+        state = {'settings': settings, 'position': 0, 'fieldnames': None, 'date_format': None,
+                 'impute': None, 'windows': {}, 'groupings': [[] for _ in groupings],
+                 'summary': summary_state(new_summary(impute_error)), 'output_fields': None, 'filled': [],
+                 'fills': {}, 'rows': 0, 'cube': []}
+    for grouping, saved in zip(groupings, state['groupings']):
+        restore_grouping(grouping, saved)
+    if cube is not None and cube_rows(cube) != state['rows']:
+        raise ValueError("The cube does not hold the rows of the earlier runs; delete the state file to rebuild both.")
+
+    records, position = read_new_records(file_path, state, columns)
+
+    # Imputation accumulators carry over between runs; new rows are filled from the updated statistics
+    impute_config = build_impute_config(group_by_col, value_col, date_col)
+    accumulators = new_accumulators(impute_config, impute_error)
+    if state['impute'] is not None:
+        for column, saved in state['impute'].items():
+            numeric, fresh_state, add, finish = accumulators[column]
+            accumulators[column] = (numeric, Counter(saved) if isinstance(fresh_state, Counter) else saved, add, finish)
+    feed_accumulators(accumulators, records)
+    state['impute'] = {column: acc[1] for column, acc in accumulators.items()}
+
+    if state['date_format'] is None and records:
+        state['date_format'] = detect_date_format(sample_column(records, date_col))
+    date_parser = make_date_parser(state['date_format'] or DATE_FORMATS[0], cache_size=date_cache_size)
+
+    rows = []
+    complete = set()
+    drift = {}
+    # [fill value, missing cells] per column of the kept rows with missing cells
+    fills = state['fills']
+    fill_values = {column: value for column, (value, _) in fills.items()}
+    if records:
+        fill_values = {column: finish(acc_state) for column, (_, acc_state, _, finish) in accumulators.items()}
+        for column, value in fill_values.items():
+            missing = sum(1 for record in records if record.get(column) in (None, ''))
+            earlier, filled = fills.get(column, (value, 0))
+            if filled and earlier != value:
+                drift[column] = (earlier, value, filled)
+            if filled or missing:
+                fills[column] = [value, filled + missing]
+        # Rows with missing cells are kept with the cells the groupings read
+        gaps = [any(record.get(column) in (None, '') for column in fill_values) for record in records]
+        kept_fields = needed_columns(','.join((group_by_col, value_col, date_col)), groupings)
+        state['filled'] += [{field: record[field] for field in kept_fields if field in record}
+                            for record, gap in zip(records, gaps) if gap]
+        marks = {'gap': False}
+
+        def tagged():
+            for record, gap in zip(records, gaps):
+                marks['gap'] = gap
+                yield record
+
+        # The row stages yield a row as soon as it is read, so it comes from the record last noted
+        for row in row_stages(tagged(), fill_values, group_by_col, value_col, date_col, threshold, date_parser,
+                              predicates):
+            if not marks['gap']:
+                complete.add(id(row))
+            rows.append(row)
+        rows.sort(key=group_date_key(group_by_col, date_col))
+
+    # Growth and window metrics continue from each group's saved window state;
+    # appended rows are assumed to be newer than earlier ones
+    processed = list(group_window(rows, group_by_col, value_col, window_ops, state['windows']))
+    if processed and state['output_fields'] is None:
+        state['output_fields'] = list(processed[0].keys())
+    # New rows are appended while the groupings and the summary are updated
+    write_header = fresh or not os.path.exists(output_path)
+    with output_sink(output_path, output_format, output_compression, state['output_fields'],
+                     append=not write_header) as sink:
+        sink_write(sink, processed)
+        # group_window yields one row for each of rows, in their order
+        complete_rows = [row for row, source in zip(processed, rows) if id(source) in complete]
+        feed_groupings(groupings, complete_rows)
+        state['groupings'] = [grouping_state(grouping) for grouping in groupings]
+        # The new complete rows' summary is merged into the saved one
+        summary = merge_summary(restore_summary(state['summary']), summarize_rows(complete_rows, value_col, date_col,
+                                                                                  impute_error))
+        state['summary'] = summary_state(summary)
+
+    # Every kept row with missing cells, filled with this run's values, joins the saved groupings and summary
+    refilled = list(row_stages(state['filled'], fill_values, group_by_col, value_col, date_col, threshold,
+                               date_parser, predicates))
+    parts = feed_groupings([new_grouping(*grouping['spec']) for grouping in groupings], refilled)
+    for part, grouping in zip(parts, groupings):
+        merge_grouping(part, grouping['groups'])
+    summary = merge_summary(summarize_rows(refilled, value_col, date_col, impute_error), summary)
+    state['rows'] = summary['stats']['count']
+    if cube is not None:
+        base = {'settings': cube['settings'], 'cells': restore_cube_cells(state['cube'])}
+        state['cube'] = cube_cells_state(cube_update(base, complete_rows)['cells'])
+        cube['cells'] = cube_update(base, refilled)['cells']
+
+    state['position'] = position
+    save_state(state, state_path)
+
+    return parts, summary, len(processed), date_parser, drift
+
+# Statistical summaries, including trend analysis, in one pass over data
+def compute_stats(data, value_col, date_col, error=0.001):
+    return summary_stats(summarize_rows(data, value_col, date_col, error), value_col)
+
+# Pipeline: Sampled run: the rows of every stratum are prepared and filtered in input order (with the fill values
+# of the whole sample), then sorted and windowed together. Each stratum's groupings are scaled up by its weight
+# before they are merged, so sums and counts estimate those of the whole input. Returns the processed rows, the
+# groupings, the estimates and, for the histogram, the processed values and their weights; None when the sample
+# holds no value to impute a column from (e.g. no rows at all)
+def process_pipeline_sample(strata, sizes, group_by_col, value_col, date_col, threshold, impute_error, date_parser,
+                            window_ops, groupings, predicates=None, confidence=0.95, profiler=None, order=None,
+                            group_fill=None):
+    if order is None:
+        order = [None] * len(strata[None])
+    rows_of = {key: iter(rows) for key, rows in strata.items()}
+    sample = [next(rows_of[key]) for key in order]
+    impute_config = build_impute_config(group_by_col, value_col, date_col)
+    if group_fill is not None:
+        # Stratified: missing groups get the fill value of the whole input (see sample_data)
+        del impute_config[group_by_col]
+    try:
+        fill_values = gather_fill_values(sample, impute_config, impute_error)
+    except statistics.StatisticsError:
         return None
-    keys = sorted(date_aggregates.keys())
-    values = [date_aggregates[k] for k in keys]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(keys, values, marker='o')
-    ax.set_xlabel(date_col.capitalize())
-    ax.set_ylabel(f"Total {value_col.capitalize()}")
-    ax.set_title(f"Trend of {value_col.capitalize()} Over Time")
-    plt.xticks(rotation=45)
-    return fig
+    if group_fill is not None:
+        fill_values[group_by_col] = group_fill
+    kept = {key: [] for key in strata}
+    state = {'stratum': None}
 
-# Main execution
-input_data = load_data(args.input_file)
-processed_data = process_pipeline(input_data, args.group_by, args.value, args.date, args.threshold)
+    def tagged():
+        for key, row in zip(order, sample):
+            state['stratum'] = key
+            yield row
 
-if not processed_data:
-    print("No data after processing.")
-    sys.exit(0)
+    with profile_stage(profiler, 'prepare_sample', len(sample)) as record:
+        # The row stages yield a row as soon as it is read, so it belongs to the stratum last noted
+        prepared = []
+        for row in row_stages(tagged(), fill_values, group_by_col, value_col, date_col, threshold, date_parser,
+                              predicates):
+            kept[state['stratum']].append(row)
+            prepared.append(row)
+        record['rows_out'] = len(prepared)
+    processed_data = finish_rows(prepared, group_by_col, value_col, date_col, threshold, window_ops, profiler,
+                                 predicates)
 
-# Aggregates by group
-group_aggregates = aggregate_values(processed_data, args.group_by, args.value)
+    with profile_stage(profiler, 'aggregate', len(processed_data)):
+        for key, rows in kept.items():
+            if not rows:
+                continue
+            part = [new_grouping(*grouping['spec']) for grouping in groupings]
+            scale_groupings(feed_groupings(part, rows), sizes[key] / len(strata[key]))
+            for grouping, scaled in zip(groupings, part):
+                merge_grouping(grouping, scaled['groups'])
+    estimates = sample_estimates(new_sample_totals(strata, sizes, kept, value_col), value_col, confidence)
+    values = [row[value_col] for key in kept for row in kept[key]]
+    weights = [sizes[key] / len(strata[key]) for key in kept for _ in kept[key]]
+    return processed_data, groupings, estimates, (values, weights)
 
-# Aggregates by date for trend analysis
-date_aggregates = aggregate_values(processed_data, args.date, args.value)
+# Pipeline: Run the job described by args (as parsed by parse_args) without printing. Returns the aggregates,
+# stats, row count and chart inputs; result['stats'] is None when no rows are left. Messages a run would print are
+# collected in result['notes']. warm: in-process cache of prepared rows (service mode, see new_warm_cache)
+def run_pipeline(args, profiler=None, warm=None):
+    result = {'notes': [], 'hist_weights': None, 'stats': None}
+    window_ops = build_window_ops(args.value, args.lag, args.pct_change, args.rolling_mean, args.running_sum)
+    group_by_col = group_column(args.group_by)
+    groupings = build_groupings(args.group_by, args.aggregates.split(','), args.value, args.date,
+                                args.extra_group_by, args.impute_error or 0.001)
+    predicates = build_predicates(args.groups.split(',') if args.groups else None, args.date_from, args.date_to)
+    # The groupings read the group, value and date columns
+    columns = needed_columns(args.columns, groupings) if args.columns else None
+    # A single file, or the file set of a directory or glob pattern
+    source = open_input_set(args.input_file, args.read_threads, print_file_progress if args.progress else None)
+    if isinstance(source, dict) and not args.incremental:
+        result['notes'].append(f"Input: {len(source['files'])} files")
+    cube = None
+    if args.cube:
+        cube_settings = {'input': os.path.abspath(input_name(source)), 'group_by': group_by_col, 'value': args.value,
+                         'date': args.date, 'threshold': args.threshold, 'impute_error': args.impute_error,
+                         'predicates': predicates}
+        # Other runs rebuild the cube from their rows
+        cube = (open_cube(args.cube, cube_settings) if args.incremental and os.path.exists(args.cube)
+                else new_cube(cube_settings))
 
-# Extract value list for stats and viz
-value_list = [row[args.value] for row in processed_data]
+    if args.incremental:
+        # New rows are appended to args.output; aggregates and stats cover every row seen so far
+        with profile_stage(profiler, 'process_incremental') as record:
+            groupings, summary, new_rows, date_parser, drift = process_pipeline_incremental(
+                source, group_by_col, args.value, args.date, args.threshold, args.output, args.incremental,
+                args.impute_error, args.date_cache_size, window_ops, groupings, predicates, columns,
+                args.output_format, args.output_compression, cube)
+            record['rows_out'] = new_rows
+        if isinstance(source, dict):
+            read = len(source['progress'])
+            result['notes'].append(f"Read {read} of {len(source['files'])} input files "
+                                   f"({len(source['files']) - read} processed in earlier runs)")
+        result['notes'].append(f"Processed {new_rows} new rows (state kept in {args.incremental})")
+        if drift:
+            changes = "; ".join(f"{column} {earlier!r} -> {value!r} ({filled} earlier cells refilled)"
+                                for column, (earlier, value, filled) in drift.items())
+            result['notes'].append(f"Fill values changed: {changes}. Rows already written to {args.output} keep "
+                                   f"the earlier values")
+        if cube is not None:
+            save_cube(cube, args.cube)
+        if not groupings[0]['groups']:
+            return result
+        date_report = describe_date_parser(date_parser)
+    elif args.stream:
+        # Processed rows are written to args.output while streaming
+        date_sample = sample_column(iter_data(source), args.date)
+        date_parser = make_date_parser(detect_date_format(date_sample), cache_size=args.date_cache_size)
+        with profile_stage(profiler, 'process_stream') as record:
+            results = process_pipeline_stream(source, group_by_col, args.value, args.date,
+                                              args.threshold, args.output, args.chunk_size, args.impute_error,
+                                              date_parser, window_ops, groupings, predicates, columns,
+                                              args.output_format, args.output_compression, cube)
+            record['rows_out'] = results[1]['stats']['count'] if results else 0
+        if cube is not None:
+            save_cube(cube, args.cube)
+        if results is None:
+            return result
+        groupings, summary = results
+        date_report = describe_date_parser(date_parser)
+    else:
+        if args.sample:
+            with profile_stage(profiler, 'sample') as record:
+                strata, sizes, order, group_fill = sample_data(source, args.sample,
+                                                               group_by_col if args.stratify else None, columns,
+                                                               args.sample_seed)
+                record['rows_out'] = sum(map(len, strata.values()))
+            date_sample = sample_column(chain.from_iterable(strata.values()), args.date)
+            date_parser = make_date_parser(detect_date_format(date_sample), cache_size=args.date_cache_size)
+            results = process_pipeline_sample(
+                strata, sizes, group_by_col, args.value, args.date, args.threshold, args.impute_error, date_parser,
+                window_ops, groupings, predicates, args.confidence, profiler, order, group_fill)
+            result['notes'].append(
+                f"Sampled {sum(map(len, strata.values()))} of {sum(sizes.values())} rows"
+                + (f" in {len(strata)} strata" if args.stratify else "")
+                + "; sums and counts are scaled up to the whole input, the other aggregates describe the sample")
+            if results is None:
+                return result
+            processed_data, groupings, estimates, sample_values = results
+            date_report = describe_date_parser(date_parser)
+        elif args.workers > 1:
+            date_sample = sample_column(iter_data(source), args.date)
+            date_parser = make_date_parser(detect_date_format(date_sample), cache_size=args.date_cache_size)
+            with profile_stage(profiler, 'process_parallel') as record:
+                processed_data, groupings, (hits, misses) = process_pipeline_parallel(
+                    source, group_by_col, args.value, args.date, args.threshold, args.workers,
+                    args.impute_error, date_parser, window_ops, groupings, predicates, columns)
+                record['rows_out'] = len(processed_data)
+            date_report = describe_date_parser(date_parser, hits, misses)
+        else:
+            parsed, meta = None, None
+            settings = {'group_by': group_by_col, 'value': args.value, 'date': args.date,
+                        'impute_error': args.impute_error}
+            if columns is not None:
+                settings['columns'] = columns
+            warm_hit = False
+            if warm is not None:
+                warm_entry = warm_key(source, settings)
+                parsed, meta = warm_get(warm, warm_entry)
+                warm_hit = parsed is not None
+                if warm_hit:
+                    result['notes'].append(f"Warm dataset: hit ({meta['rows']} rows)")
+            if parsed is None and args.cache_dir:
+                key = cache_key(source, settings)
+                with profile_stage(profiler, 'cache_load') as record:
+                    parsed, meta = load_cached_rows(args.cache_dir, key)
+                    record['rows_out'] = len(parsed) if parsed is not None else None
+                if parsed is not None:
+                    result['notes'].append(f"Input cache: hit ({meta['rows']} rows)")
+
+            if parsed is None:
+                with profile_stage(profiler, 'load') as record:
+                    input_data = load_data(source, columns)
+                    record['rows_out'] = len(input_data)
+                date_sample = sample_column(input_data, args.date)
+                date_parser = make_date_parser(detect_date_format(date_sample), cache_size=args.date_cache_size)
+                # Prepared rows that are kept for later runs must not depend on the filters
+                pushdown = None if args.cache_dir or warm is not None else (args.threshold, predicates)
+                parsed = prepare_rows(input_data, group_by_col, args.value, args.date, args.impute_error,
+                                      date_parser, profiler, pushdown)
+                if args.cache_dir:
+                    stored = store_cached_rows(args.cache_dir, key, parsed, {'date_format': date_parser.format},
+                                               args.cache_size * 1024 * 1024)
+                    result['notes'].append("Input cache: miss, rows stored" if stored
+                                           else "Input cache: miss, rows not cacheable")
+            if warm is not None and not warm_hit:
+                warm_put(warm, warm_entry, parsed, meta or {'date_format': date_parser.format, 'rows': len(parsed)})
+            processed_data = finish_rows(parsed, group_by_col, args.value, args.date, args.threshold,
+                                         window_ops, profiler, predicates)
+            if meta is None:
+                date_report = describe_date_parser(date_parser)
+            else:
+                date_report = f"format {meta['date_format']}, rows parsed in an earlier run (cached)"
 
-# Stats with trend
-stats = compute_stats(processed_data, args.value, args.date)
+        if cube is not None:
+            with profile_stage(profiler, 'cube', len(processed_data)) as record:
+                save_cube(cube_update(cube, processed_data), args.cube)
+                record['rows_out'] = len(cube['cells'])
+        if not processed_data:
+            return result
 
-# Output to console (aggregates + stats)
-print("Group Aggregates:", group_aggregates)
-print("Date Aggregates (for Trend):", date_aggregates)
-for key, val in stats.items():
-    print(f"{key.capitalize()}: {val}")
+        # The sink's thread writes the rows while they are aggregated; save_csv records the wait for it to finish
+        with output_sink(args.output, args.output_format, args.output_compression) as sink:
+            if sink is not None:
+                sink_write(sink, processed_data)
 
-# Generate visualizations
-agg_fig = create_aggregates_bar(group_aggregates, args.group_by, args.value)
-if agg_fig:
-    agg_fig.savefig('aggregates_bar.png')
-    plt.close(agg_fig)
+            # Aggregates by group and by date (for trend analysis) in one scan; --workers and --sample runs have
+            # already fed them
+            if args.workers <= 1 and not args.sample:
+                with profile_stage(profiler, 'aggregate', len(processed_data)):
+                    feed_groupings(groupings, processed_data)
 
-hist_fig = create_histogram(value_list, args.value)
-if hist_fig:
-    hist_fig.savefig('value_histogram.png')
-    plt.close(hist_fig)
+            # Stats with trend, in one pass
+            with profile_stage(profiler, 'stats', len(processed_data)):
+                summary = summarize_rows(processed_data, args.value, args.date, args.impute_error)
+            # The rows are in memory, so the histogram gets every value
+            value_list = [row[args.value] for row in processed_data]
 
-trend_fig = create_trend_line(date_aggregates, args.date, args.value)
-if trend_fig:
-    trend_fig.savefig('trend_line.png')
-    plt.close(trend_fig)
+            if sink is not None:
+                with profile_stage(profiler, 'save_csv', len(processed_data)):
+                    close_sink(sink)
 
-print("Visualizations saved as 'aggregates_bar.png', 'value_histogram.png', and 'trend_line.png'")
+    if args.incremental or args.stream:
+        # Histogram of the summary's sketch: bounded whatever the row count
+        value_list, result['hist_weights'] = sketch_histogram(summary['sketch'])
+    if cube is not None:
+        result['notes'].append(f"Cube {args.cube}: {len(cube['cells'])} day and group cells of {cube_rows(cube)} rows")
+    stats = summary_stats(summary, args.value)
+    if args.sample:
+        # Every value stands for its stratum's share of the input
+        value_list, result['hist_weights'] = sample_values
+        stats.update(estimates)
+    results = [grouping_results(grouping) for grouping in groupings]
+    result.update(group_aggregates=results[0], date_aggregates=results[-1],
+                  extra_aggregates=dict(zip(args.extra_group_by, results[1:-1])), value_list=value_list,
+                  stats=stats, rows=summary['stats']['count'], date_report=date_report)
+    return result
+
+# Job fields a service request may set, named like the CLI options; anything else is rejected
+JOB_FIELDS = ['input', 'output', 'group_by', 'aggregates', 'extra_group_by', 'value', 'date', 'threshold', 'groups',
+              'date_from', 'date_to', 'columns', 'stream', 'chunk_size', 'impute_error', 'date_cache_size', 'lag',
+              'pct_change', 'rolling_mean', 'running_sum', 'incremental', 'cache_dir', 'cache_size', 'output_format',
+              'output_compression', 'cube']
+
+# Function: Arguments of a service job (a JSON object of JOB_FIELDS), with the CLI defaults for missing fields.
+# Jobs write their rows only when they name an output and never draw charts. Raises ValueError
+def job_args(job):
+    if not isinstance(job, dict) or not isinstance(job.get('input'), str):
+        raise ValueError("a job is a JSON object with an 'input' path")
+    unknown = sorted(set(job) - set(JOB_FIELDS))
+    if unknown:
+        raise ValueError(f"unknown job fields: {', '.join(unknown)}")
+
+    args = build_parser().parse_args([job['input']])
+    args.output = None
+    args.no_plots = True
+    for field, value in job.items():
+        name = 'input_file' if field == 'input' else field
+        default = getattr(args, name)
+        try:
+            if isinstance(default, bool):
+                if not isinstance(value, bool):
+                    raise TypeError(field)
+            elif isinstance(default, (int, float)):
+                value = type(default)(value)
+            elif isinstance(default, list):
+                if not isinstance(value, list):
+                    raise TypeError(field)
+                # Repeatable options: window periods, or group-by specs
+                value = [str(item) if field == 'extra_group_by' else int(item) for item in value]
+            elif value is not None:
+                value = str(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid value for {field}: {value!r}")
+        setattr(args, name, value)
+    check_args(args)
+    if (args.stream or args.incremental) and not args.output:
+        raise ValueError("stream and incremental jobs write their rows to an output, which is missing")
+    return args
 
-# Save processed data to CSV
-def save_csv(data, file_path):
-    if not data:
+# Main execution
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        serve(args, job_args, run_pipeline)
+        return
+    if args.query_cube:
+        try:
+            answer = run_cube_query(args.query_cube, args.query, args.date_from, args.date_to, args.groups,
+                                    args.period)
+        except ValueError as error:
+            sys.exit(f"error: {error}")
+        print(json.dumps(answer, indent=2))
         return
-    fieldnames = list(data[0].keys())
-    with open(file_path, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
+    profiler = None
+    if args.profile:
+        profiler = new_profiler(args.profile_stage, args.profile_detail, f"{args.profile}.{args.profile_stage}.prof")
+
+    result = run_pipeline(args, profiler)
+    for note in result['notes']:
+        print(note)
+    if result['stats'] is None:
+        print("No data after processing.")
+        sys.exit(0)
+    group_aggregates = result['group_aggregates']
+    date_aggregates = result['date_aggregates']
+    stats = result['stats']
+
+    # Output to console (aggregates + stats)
+    print("Group Aggregates:", group_aggregates)
+    print("Date Aggregates (for Trend):", date_aggregates)
+    for spec, aggregates in result['extra_aggregates'].items():
+        print(f"Aggregates by {spec}:", aggregates)
+    for key, val in stats.items():
+        print(f"{key.capitalize()}: {val}")
+    print(f"Date parsing ({args.date}): {result['date_report']}")
+
+    # Generate visualizations (charts whose data did not change since the last run are kept as they are)
+    if not args.no_plots:
+        with profile_stage(profiler, 'charts') as record:
+            jobs = chart_jobs(group_aggregates, date_aggregates, result['value_list'], result['hist_weights'], args)
+            rendered, skipped = render_charts(jobs, args.chart_workers, force=args.force_charts)
+            record['rows_out'] = len(rendered)
+
+        if rendered:
+            print(f"Visualizations saved as {quoted_list(rendered)}")
+        if skipped:
+            print(f"Visualizations unchanged since the last run: {quoted_list(skipped)}")
+
+    if profiler:
+        export_profile(profiler, args.profile, args.profile_format)
+        print(f"Profile written to {args.profile}")
 
-save_csv(processed_data, args.output)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+from operator import itemgetter
+from records import chunked
+from sketches import (hll_add, hll_count, hll_merge, new_hll, new_sketch, sketch_add, sketch_median, sketch_merge,
+                      sketch_quantile)
+
+# Group-by engine: hash aggregation with composite keys, several aggregates per group and several groupings fed
+# in one scan. Aggregate states are small lists/dicts updated in place; they merge across partitions and are
+# saved as JSON by the incremental mode
+
+# Length of a normalized YYYY-MM-DD date cut down to a date part
+DATE_PART_LENGTHS = {'year': 4, 'month': 7, 'day': 10}
+
+# Function: Key columns of a group-by spec such as 'region,date:month', as (column, date part or None) pairs
+def parse_group_by(spec):
+    keys = []
+    for item in spec.split(','):
+        column, _, part = item.strip().partition(':')
+        if not column or (part and part not in DATE_PART_LENGTHS):
+            raise ValueError(f"invalid group-by key {item!r} (expected column or column:year|month|day)")
+        keys.append((column, part or None))
+    return keys
+
+# Function: row -> group key: the value of a single key column, a tuple for several ('Unknown' when missing)
+def make_key_getter(keys):
+    def key_part(column, part):
+        if part is None:
+            return lambda row: row.get(column, 'Unknown')
+        length = DATE_PART_LENGTHS[part]
+        return lambda row: row.get(column, 'Unknown')[:length] if isinstance(row.get(column), str) \
+            else row.get(column, 'Unknown')
+
+    getters = [key_part(column, part) for column, part in keys]
+    if len(getters) == 1:
+        return getters[0]
+    return lambda row: tuple(get(row) for get in getters)
+
+# Function: Readable form of a group key (composite keys are joined)
+def format_group_key(key):
+    return ' / '.join(map(str, key)) if isinstance(key, tuple) else key
+
+def add_sum(state, value):
+    state[0] += value
+
+def add_count(state, value):
+    state[0] += 1
+
+def add_mean(state, value):
+    state[0] += value
+    state[1] += 1
+
+def add_min(state, value):
+    if state[0] is None or value < state[0]:
+        state[0] = value
+
+def add_max(state, value):
+    if state[0] is None or value > state[0]:
+        state[0] = value
+
+def merge_sums(state, other):
+    for i, value in enumerate(other):
+        state[i] += value
+
+def merge_min(state, other):
+    if other[0] is not None:
+        add_min(state, other[0])
+
+def merge_max(state, other):
+    if other[0] is not None:
+        add_max(state, other[0])
+
+# Function: (label, column, new state, add, merge, finish) of an aggregate spec: sum, count, mean, min, max,
+# distinct (approximate), median or pN (N-th percentile, from a quantile sketch), each optionally followed by
+# ':column' (default value_col). Missing (None) values are skipped
+def make_aggregate(spec, value_col, error=0.001):
+    name, _, column = spec.strip().partition(':')
+    column = column or value_col
+    if name in ('sum', 'count'):
+        return spec, column, lambda: [0], add_sum if name == 'sum' else add_count, merge_sums, itemgetter(0)
+    if name == 'mean':
+        return (spec, column, lambda: [0, 0], add_mean, merge_sums,
+                lambda state: state[0] / state[1] if state[1] else None)
+    if name in ('min', 'max'):
+        return (spec, column, lambda: [None], add_min if name == 'min' else add_max,
+                merge_min if name == 'min' else merge_max, itemgetter(0))
+    if name == 'distinct':
+        return spec, column, new_hll, hll_add, hll_merge, hll_count
+    if name == 'median':
+        return (spec, column, lambda: new_sketch(error), sketch_add, sketch_merge,
+                lambda sketch: sketch_median(sketch) if sketch['count'] else None)
+    if name[:1] == 'p' and name[1:].isdigit() and int(name[1:]) <= 100:
+        q = int(name[1:]) / 100
+        return (spec, column, lambda: new_sketch(error), sketch_add, sketch_merge,
+                lambda sketch: sketch_quantile(sketch, q) if sketch['count'] else None)
+    raise ValueError(f"unknown aggregate {spec!r} (expected sum, count, mean, min, max, distinct, median or pN)")
+
+# Function: Empty grouping of rows by a group-by spec, with the given aggregate specs. The spec is kept so
+# worker processes can build the same grouping
+def new_grouping(group_by, aggregates, value_col, error=0.001):
+    keys = parse_group_by(group_by)
+    return {'spec': (group_by, list(aggregates), value_col, error), 'keys': keys, 'key': make_key_getter(keys),
+            'aggregates': [make_aggregate(spec, value_col, error) for spec in aggregates], 'groups': {}}
+
+# Function: Groupings of a run: the group aggregates, any extra group-by specs, then the date totals for the trend
+def build_groupings(group_by, aggregates, value_col, date_col, extra_group_by=(), error=0.001):
+    return ([new_grouping(group_by, aggregates, value_col, error)]
+            + [new_grouping(spec, aggregates, value_col, error) for spec in extra_group_by]
+            + [new_grouping(date_col, ['sum'], value_col, error)])
+
+# Function: Sorted projection for --columns: the listed columns plus every column the groupings read
+def needed_columns(columns, groupings):
+    wanted = set(column.strip() for column in columns.split(','))
+    for grouping in groupings:
+        wanted.update(column for column, _ in grouping['keys'])
+        wanted.update(aggregate[1] for aggregate in grouping['aggregates'])
+    return sorted(wanted)
+
+# Function: Key column of a group-by spec that drives imputation, sorting and the window metrics
+def group_column(group_by):
+    for column, part in parse_group_by(group_by):
+        if part is None:
+            return column
+    raise ValueError(f"group-by {group_by!r} needs a column without a date part")
+
+# Function: Updater feeding a batch of rows to a grouping
+def grouping_updater(grouping):
+    key_of = grouping['key']
+    groups = grouping['groups']
+    news = [new for _, _, new, _, _, _ in grouping['aggregates']]
+    steps = [(column, add) for _, column, _, add, _, _ in grouping['aggregates']]
+    if len(steps) == 1 and steps[0][1] is add_sum and len(grouping['keys']) == 1 and grouping['keys'][0][1] is None:
+        # Plain totals by one column, the common case
+        key_col = grouping['keys'][0][0]
+        column = steps[0][0]
+
+        def update(rows):
+            for row in rows:
+                key = row.get(key_col, 'Unknown')
+                states = groups.get(key)
+                if states is None:
+                    states = groups[key] = [[0]]
+                value = row.get(column)
+                if value is not None:
+                    states[0][0] += value
+        return update
+
+    def update(rows):
+        for row in rows:
+            key = key_of(row)
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = [new() for new in news]
+            for state, (column, add) in zip(states, steps):
+                value = row.get(column)
+                if value is not None:
+                    add(state, value)
+    return update
+
+# Function: Feed rows to several groupings in one scan, a cache-sized chunk at a time
+def feed_groupings(groupings, rows, chunk_size=4096):
+    updaters = [grouping_updater(grouping) for grouping in groupings]
+    for chunk in chunked(rows, chunk_size):
+        for update in updaters:
+            update(chunk)
+    return groupings
+
+# Function: Fold group states computed elsewhere (another partition or run) into a grouping
+def merge_grouping(grouping, groups):
+    merges = [merge for _, _, _, _, merge, _ in grouping['aggregates']]
+    for key, states in groups.items():
+        mine = grouping['groups'].get(key)
+        if mine is None:
+            grouping['groups'][key] = states
+            continue
+        for merge, state, other in zip(merges, mine, states):
+            merge(state, other)
+    return grouping
+
+# Function: JSON form of a grouping's states (composite keys become lists)
+def grouping_state(grouping):
+    return [[list(key) if isinstance(key, tuple) else key, states] for key, states in grouping['groups'].items()]
+
+# Function: Restore states saved by grouping_state
+def restore_grouping(grouping, saved):
+    grouping['groups'] = {tuple(key) if isinstance(key, list) else key: states for key, states in saved}
+    return grouping
+
+# Function: Results sorted by key: {key: value} for a single aggregate, {key: {label: value}} for several
+def grouping_results(grouping):
+    labels = [label for label, _, _, _, _, _ in grouping['aggregates']]
+    finishes = [finish for _, _, _, _, _, finish in grouping['aggregates']]
+    results = {}
+    for key, states in sorted(grouping['groups'].items(), key=itemgetter(0)):
+        values = [finish(state) for finish, state in zip(finishes, states)]
+        results[key] = values[0] if len(values) == 1 else dict(zip(labels, values))
+    return results
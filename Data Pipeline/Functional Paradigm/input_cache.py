@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import hashlib
+import shutil
+from collections import OrderedDict
+import numpy as np
+from records import record_type, rows_to_columns
+from readers import file_fingerprint
+
+# Caches of prepared rows: on disk between runs (--cache-dir), keyed by the input's fingerprint and the settings
+# that shaped the rows, and in process between the jobs of the service (the warm cache)
+
+# Bump when the layout of cached rows changes
+CACHE_VERSION = 1
+
+# Function: Cache key from the fingerprint of the input file (of every file of a file set) plus the settings
+def cache_key(file_path, settings):
+    if isinstance(file_path, dict):
+        files = {'files': [file_fingerprint(path) for path in file_path['files']]}
+    else:
+        files = file_fingerprint(file_path)
+    fingerprint = {'version': CACHE_VERSION, **files, 'settings': settings}
+    return hashlib.blake2b(json.dumps(fingerprint, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+# Function: Rows stored by store_cached_rows, read through memory maps, and their metadata (None on a miss)
+def load_cached_rows(cache_dir, key):
+    entry = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_path) as file:
+            meta = json.load(file)
+        cells = []
+        for i in range(len(meta['columns'])):
+            values = np.load(os.path.join(entry, f"{i}.values.npy"), mmap_mode='r').tolist()
+            mask = np.load(os.path.join(entry, f"{i}.mask.npy"), mmap_mode='r').tolist()
+            cells.append([value if ok else None for value, ok in zip(values, mask)])
+    except (OSError, ValueError, KeyError):
+        return None, None
+    # Last use drives the LRU eviction
+    os.utime(meta_path)
+    kind = record_type(tuple(meta['columns']))
+    rows = [tuple.__new__(kind, row) for row in zip(*cells)] if cells else [{} for _ in range(meta['rows'])]
+    return rows, meta
+
+# Function: Snapshot rows as one .npy file per column; returns False when the rows cannot be stored
+def store_cached_rows(cache_dir, key, rows, meta, max_bytes):
+    columns = rows_to_columns(rows)
+    if columns is None:
+        return False
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    for i, (_, values, mask) in enumerate(columns):
+        np.save(os.path.join(staging, f"{i}.values.npy"), values)
+        np.save(os.path.join(staging, f"{i}.mask.npy"), mask)
+    with open(os.path.join(staging, 'meta.json'), 'w') as file:
+        json.dump({**meta, 'columns': [name for name, _, _ in columns], 'rows': len(rows)}, file)
+    try:
+        os.replace(staging, os.path.join(cache_dir, key))
+    except OSError:
+        # Another run stored the same entry first
+        shutil.rmtree(staging, ignore_errors=True)
+    evict_cache(cache_dir, max_bytes)
+    return True
+
+# Function: Remove least recently used entries until the cache fits in max_bytes
+def evict_cache(cache_dir, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        meta_path = os.path.join(entry, 'meta.json')
+        if name.startswith('.') or not os.path.isfile(meta_path):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+        entries.append((os.path.getmtime(meta_path), size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+# Function: In-process LRU of prepared rows for the service mode. Prepared rows are never modified by the later
+# stages, so jobs can share them
+def new_warm_cache(max_datasets):
+    return {'max_datasets': max_datasets, 'entries': OrderedDict()}
+
+# Function: Warm cache key from the input files' paths, sizes and mtimes plus the settings that shaped the rows
+def warm_key(file_path, settings):
+    files = file_path['files'] if isinstance(file_path, dict) else [file_path]
+    stats = [(path, os.stat(path)) for path in files]
+    return (tuple((os.path.abspath(path), stat.st_size, stat.st_mtime_ns) for path, stat in stats),
+            json.dumps(settings, sort_keys=True))
+
+# Function: (rows, metadata) of a warm dataset, (None, None) on a miss
+def warm_get(warm, key):
+    entry = warm['entries'].get(key)
+    if entry is None:
+        return None, None
+    warm['entries'].move_to_end(key)
+    return entry
+
+# Function: Keep a prepared dataset, dropping the least recently used ones beyond max_datasets
+def warm_put(warm, key, rows, meta):
+    warm['entries'][key] = (rows, meta)
+    warm['entries'].move_to_end(key)
+    while len(warm['entries']) > warm['max_datasets']:
+        warm['entries'].popitem(last=False)
@@ -0,0 +1,236 @@
+import csv
+import json
+import os
+import gzip
+import io
+from contextlib import contextmanager
+from collections import OrderedDict
+import numpy as np
+import threading
+import queue
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from records import Record, chunked, rows_to_columns
+
+# Output sinks: rows are handed to a background thread in batches; it encodes them, compresses and writes them with
+# large buffered writes, so writing overlaps the stages still running and no encoded copy of the whole output is
+# held. A new output is written under a temporary name and renamed into place when the sink is closed, so readers
+# never see a partial file; appending (as --incremental does) writes in place. Nothing is written without rows
+
+OUTPUT_FORMATS = ('csv', 'json', 'ndjson', 'npz')
+OUTPUT_COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+# Function: 'a', 'b', and 'c'
+def quoted_list(items):
+    names = [repr(item) for item in items]
+    if len(names) < 3:
+        return ' and '.join(names)
+    return f"{', '.join(names[:-1])}, and {names[-1]}"
+
+# Function: (format, compression) of an output path: a .gz or .zst suffix gives the compression, the extension before
+# it the format (csv unless .json, .ndjson/.jsonl or .npz); fmt and compression override them. Raises ValueError
+def output_format(file_path, fmt=None, compression=None):
+    name = os.path.basename(file_path).lower()
+    found = 'gzip' if name.endswith('.gz') else 'zstd' if name.endswith('.zst') else 'none'
+    if found != 'none':
+        name = name.rsplit('.', 1)[0]
+    ext = name.rsplit('.', 1)[-1] if '.' in name else ''
+    fmt = fmt or {'json': 'json', 'ndjson': 'ndjson', 'jsonl': 'ndjson', 'npz': 'npz'}.get(ext, 'csv')
+    compression = compression or found
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output format {fmt!r} (use {quoted_list(OUTPUT_FORMATS)})")
+    if compression not in OUTPUT_COMPRESSIONS:
+        raise ValueError(f"unsupported output compression {compression!r} (use {quoted_list(OUTPUT_COMPRESSIONS)})")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("Writing zstd-compressed output requires the zstandard package.")
+    if fmt == 'npz' and compression == 'zstd':
+        raise ValueError("npz output is compressed with gzip (zip deflate) or not at all")
+    return fmt, compression
+
+# Function: Encoder of row batches to text in a text format; the CSV header comes from fieldnames or the first row
+def text_encoder(fmt, fieldnames=None, header=True):
+    buffer = io.StringIO(newline='')
+    state = {'write_row': None, 'rows': 0}
+
+    def encode(rows):
+        if fmt == 'csv':
+            if state['write_row'] is None:
+                state['write_row'] = csv_row_writer(buffer, fieldnames or list(rows[0].keys()), header)
+            write_row = state['write_row']
+            for row in rows:
+                write_row(row)
+        else:
+            # JSON arrays are written one element at a time, without indentation
+            separator = '\n' if fmt == 'ndjson' else ',\n'
+            for row in rows:
+                if fmt == 'json':
+                    buffer.write('[' if state['rows'] == 0 else separator)
+                buffer.write(json.dumps(dict(row.items())))
+                if fmt == 'ndjson':
+                    buffer.write(separator)
+                state['rows'] += 1
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    def finish():
+        return ']\n' if fmt == 'json' and state['rows'] else ''
+    return encode, finish
+
+# Function: Collector of row batches as typed column arrays (as in the input cache), saved as one .npz: the values of
+# each column under its name and its validity mask under '<name>.mask'. Only the compact arrays are held until then
+def column_collector():
+    parts = OrderedDict()
+
+    def add(rows):
+        columns = rows_to_columns(rows)
+        if columns is None or (parts and [name for name, _, _ in columns] != list(parts)):
+            raise ValueError("npz output needs rows with the same columns, holding str, int or float values")
+        for name, values, mask in columns:
+            parts.setdefault(name, []).append((values, mask))
+
+    def save(file, compressed):
+        arrays = {}
+        for name, blocks in parts.items():
+            # Blocks without a value default to str; they take the type of the others
+            typed = [values.dtype for values, mask in blocks if mask.any()] or [np.dtype(str)]
+            try:
+                arrays[name] = np.concatenate([values if mask.any() else np.zeros(len(values), typed[0])
+                                               for values, mask in blocks])
+            except TypeError:
+                raise ValueError(f"npz output: column {name!r} mixes text and numbers")
+            arrays[name + '.mask'] = np.concatenate([mask for _, mask in blocks])
+        (np.savez_compressed if compressed else np.savez)(file, **arrays)
+    return add, save
+
+# Function: Open the file of a sink (its temporary file unless appending) and the writer of its rows
+def open_sink_stream(sink):
+    if sink['append']:
+        raw = open(sink['path'], 'ab', buffering=sink['buffer_size'])
+    else:
+        sink['temp_path'] = sink['path'] + '.tmp'
+        raw = open(sink['temp_path'], 'wb', buffering=sink['buffer_size'])
+    compression = sink['compression']
+    if sink['format'] == 'npz':
+        add, save = column_collector()
+        return raw, add, lambda: save(raw, compression == 'gzip')
+    if compression == 'gzip':
+        # A new gzip member, so appending to a .gz output keeps it readable
+        out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+    elif compression == 'zstd':
+        out = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    else:
+        out = raw
+    encode, finish = text_encoder(sink['format'], sink['fieldnames'], not sink['append'])
+
+    def write(rows):
+        out.write(encode(rows).encode('utf-8'))
+
+    def close():
+        out.write(finish().encode('utf-8'))
+        if out is not raw:
+            out.close()
+    return raw, write, close
+
+# Worker: the writer thread of a sink. After a failure it keeps taking batches (so the producer never blocks) and
+# drops them; the producer sees the error on its next write or on close
+def sink_worker(sink):
+    raw = None
+    while True:
+        rows = sink['queue'].get()
+        if rows is None:
+            break
+        if sink['error'] is not None or not rows:
+            continue
+        try:
+            if raw is None:
+                raw, write, finish = open_sink_stream(sink)
+            for batch in chunked(rows, 4096):
+                write(batch)
+        except Exception as error:
+            sink['error'] = error
+    try:
+        if raw is not None and sink['error'] is None and not sink['discard']:
+            finish()
+    except Exception as error:
+        sink['error'] = error
+    finally:
+        if raw is not None:
+            raw.close()
+
+# Function: Sink writing rows to file_path (see output_format for fmt and compression); fieldnames fixes the CSV
+# columns (default: the first row's) and append adds to an existing file without a header. Raises ValueError
+def open_sink(file_path, fmt=None, compression=None, fieldnames=None, append=False, buffer_size=1 << 20,
+              max_pending=8):
+    fmt, compression = output_format(file_path, fmt, compression)
+    if append and fmt in ('json', 'npz'):
+        raise ValueError(f"{fmt} output cannot be appended to")
+    sink = {'path': file_path, 'format': fmt, 'compression': compression, 'fieldnames': fieldnames, 'append': append,
+            'buffer_size': buffer_size, 'queue': queue.Queue(max_pending), 'temp_path': None, 'error': None,
+            'discard': False, 'closed': False}
+    sink['thread'] = threading.Thread(target=sink_worker, args=(sink,), name='output-sink', daemon=True)
+    sink['thread'].start()
+    return sink
+
+# Function: Hand a batch of rows to the writer thread; blocks while max_pending batches are waiting. The rows must not
+# change afterwards
+def sink_write(sink, rows):
+    if sink['error'] is not None:
+        raise sink['error']
+    sink['queue'].put(rows)
+
+# Function: Wait for the writer thread, then move the file into place (or remove it when discarding or on error)
+def close_sink(sink, discard=False):
+    if sink['closed']:
+        return
+    sink['closed'] = True
+    sink['discard'] = discard
+    sink['queue'].put(None)
+    sink['thread'].join()
+    temp_path = sink['temp_path']
+    if discard or sink['error'] is not None:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        if not discard:
+            raise sink['error']
+    elif temp_path is not None:
+        os.replace(temp_path, sink['path'])
+
+# Function: open_sink as a context: the output is kept when the block completes and discarded when it raises.
+# Yields None when file_path is None (no output)
+@contextmanager
+def output_sink(file_path, fmt=None, compression=None, fieldnames=None, append=False):
+    if file_path is None:
+        yield None
+        return
+    sink = open_sink(file_path, fmt, compression, fieldnames, append)
+    try:
+        yield sink
+    except BaseException:
+        close_sink(sink, discard=True)
+        raise
+    close_sink(sink)
+
+# Save processed data to CSV
+def save_csv(data, file_path):
+    with output_sink(file_path, 'csv', 'none') as sink:
+        sink_write(sink, data)
+
+# Function: Writer of rows to a CSV file under the given header (written first unless header is False). Records laid
+# out like the header are written as they are, without the per-field lookups of csv.DictWriter
+def csv_row_writer(file, fieldnames, header=True):
+    dict_writer = csv.DictWriter(file, fieldnames=fieldnames)
+    writer = csv.writer(file)
+    if header:
+        dict_writer.writeheader()
+    fields = tuple(fieldnames)
+
+    def write_row(row):
+        if isinstance(row, Record) and row.fields == fields:
+            writer.writerow(tuple.__iter__(row))
+        else:
+            dict_writer.writerow(row)
+    return write_row
@@ -0,0 +1,104 @@
+import json
+import os
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+# Stage profiling (--profile): wall and CPU time, rows in and out and memory of every stage, one stage optionally
+# captured in detail (cProfile or tracemalloc), exported as JSON lines or in the Prometheus text format
+
+# Function: Current resident set size in bytes (None where /proc is not available)
+def current_rss():
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# Function: New profiling session; detail_mode ('cprofile' or 'tracemalloc') is applied to detail_stage only
+def new_profiler(detail_stage=None, detail_mode=None, detail_path=None):
+    return {'records': [], 'detail_stage': detail_stage, 'detail_mode': detail_mode, 'detail_path': detail_path}
+
+# Function: Measure one stage; the caller fills in record['rows_out']. Does nothing when profiler is None
+@contextmanager
+def profile_stage(profiler, stage, rows_in=None):
+    record = {'stage': stage, 'rows_in': rows_in, 'rows_out': None}
+    if profiler is None:
+        yield record
+        return
+    detail = profiler['detail_mode'] if stage == profiler['detail_stage'] else None
+    tracer = cProfile.Profile() if detail == 'cprofile' else None
+    if detail == 'tracemalloc':
+        tracemalloc.start()
+    rss_before = current_rss()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if tracer:
+        tracer.enable()
+    try:
+        yield record
+    finally:
+        if tracer:
+            tracer.disable()
+        record['wall_seconds'] = time.perf_counter() - wall_start
+        record['cpu_seconds'] = time.process_time() - cpu_start
+        rss_after = current_rss()
+        record['memory_delta_bytes'] = rss_after - rss_before if None not in (rss_before, rss_after) else None
+        record['rows_dropped'] = (record['rows_in'] - record['rows_out']
+                                  if None not in (record['rows_in'], record['rows_out']) else None)
+        if tracer:
+            tracer.dump_stats(profiler['detail_path'])
+            record['cprofile_file'] = profiler['detail_path']
+        elif detail == 'tracemalloc':
+            # Allocations still alive when the stage ends, by source line
+            snapshot = tracemalloc.take_snapshot()
+            record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            record['top_allocations'] = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+        profiler['records'].append(record)
+
+# Function: Apply one list -> list stage, recording it when profiling
+def run_stage(profiler, stage, func, rows):
+    with profile_stage(profiler, stage, len(rows)) as record:
+        result = func(rows)
+        record['rows_out'] = len(result)
+    return result
+
+# Exported per-stage metrics: (record field, metric name, type, help)
+PROFILE_METRICS = [
+    ('calls', 'pipeline_stage_calls_total', 'counter', 'Times the stage ran'),
+    ('wall_seconds', 'pipeline_stage_wall_seconds_total', 'counter', 'Wall-clock time spent in the stage'),
+    ('cpu_seconds', 'pipeline_stage_cpu_seconds_total', 'counter', 'CPU time spent in the stage'),
+    ('rows_in', 'pipeline_stage_rows_in_total', 'counter', 'Rows passed to the stage'),
+    ('rows_out', 'pipeline_stage_rows_out_total', 'counter', 'Rows produced by the stage'),
+    ('rows_dropped', 'pipeline_stage_rows_dropped_total', 'counter', 'Rows removed by the stage (invalid or filtered)'),
+    ('memory_delta_bytes', 'pipeline_stage_memory_delta_bytes', 'gauge', 'Resident memory change over the stage'),
+]
+
+# Function: Prometheus text exposition of the records, summed per stage
+def profile_to_prometheus(records):
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'calls': 0})
+        total['calls'] += 1
+        for field, _, _, _ in PROFILE_METRICS[1:]:
+            if record.get(field) is not None:
+                total[field] = total.get(field, 0) + record[field]
+    lines = []
+    for field, metric, kind, help_text in PROFILE_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for stage, total in totals.items():
+            if field in total:
+                label = stage.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                lines.append(f'{metric}{{stage="{label}"}} {total[field]}')
+    return '\n'.join(lines) + '\n'
+
+# Function: Write the profile as JSON lines (one record per stage run) or Prometheus text
+def export_profile(profiler, file_path, fmt='jsonl'):
+    with open(file_path, 'w') as file:
+        if fmt == 'prometheus':
+            file.write(profile_to_prometheus(profiler['records']))
+        else:
+            for record in profiler['records']:
+                file.write(json.dumps(record) + '\n')
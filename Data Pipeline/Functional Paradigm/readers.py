@@ -0,0 +1,226 @@
+import sys
+import csv
+import json
+import os
+import hashlib
+import gzip
+import glob
+import io
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+from records import csv_records, project_rows
+
+# Input readers: CSV, JSON arrays and NDJSON, plain or gzip/zstd compressed, read whole (load_data) or streamed
+# (iter_data); a directory or glob pattern is a file set read as one input
+
+# Function: Compression of a file from its magic bytes ('gzip', 'zstd' or None)
+def compression_of(file_path):
+    with open(file_path, 'rb') as file:
+        head = file.read(4)
+    if head.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if head.startswith(b'\x28\xb5\x2f\xfd'):
+        return 'zstd'
+    return None
+
+# Function: Open a (possibly compressed) input file as text
+def open_input(file_path, newline=None):
+    compression = compression_of(file_path)
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rt', encoding='utf-8', newline=newline)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd-compressed input requires the zstandard package.")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline=newline)
+    return open(file_path, 'r', encoding='utf-8', newline=newline)
+
+# Function: 'csv', 'json' (top-level array) or 'ndjson' from the first non-blank character; the extension
+# only decides for empty files
+def input_format(file_path):
+    with open_input(file_path) as file:
+        head = file.read(4096).lstrip('\ufeff \t\r\n')
+    if not head:
+        ext = file_path.lower().split('.')[-1]
+        if ext in ('gz', 'zst'):
+            ext = file_path.lower().split('.')[-2]
+        if ext not in ('csv', 'json', 'ndjson', 'jsonl'):
+            raise ValueError("Unsupported file format. Use CSV, JSON or NDJSON.")
+        return 'ndjson' if ext == 'jsonl' else ext
+    if head[0] == '[':
+        return 'json'
+    if head[0] == '{':
+        return 'ndjson'
+    return 'csv'
+
+# Function: Yield the elements of a top-level JSON array one at a time, reading block_size characters at a time
+def iter_json_array(handle, block_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buffer = handle.read(block_size).lstrip('\ufeff \t\r\n')
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array of records.")
+    pos = 1
+    eof = False
+    while True:
+        # Whitespace and the separating comma; read on when the buffer runs out
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            block = handle.read(block_size)
+            buffer, pos, eof = buffer[pos:] + block, 0, not block
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array.")
+        if buffer[pos] == ']':
+            return
+
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+                # A number cut by the block boundary decodes as a shorter one, so only accept values
+                # followed by a separator
+                if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]'):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            block = handle.read(block_size)
+            buffer, pos, eof = buffer[pos:] + block, 0, not block
+        yield record
+        pos = end
+
+# Function: Yield the records of a JSON Lines file, skipping blank lines
+def iter_ndjson(handle):
+    for line in handle:
+        if line.strip():
+            yield json.loads(line)
+
+# Function to load data as list
+def load_data(file_path, columns=None):
+    return list(iter_data(file_path, columns))
+
+# Function to lazily yield rows one at a time; CSV, JSON arrays and NDJSON, optionally gzip/zstd-compressed.
+# file_path may be a file set (see new_file_set). columns: projection; other columns are never materialized.
+# layout: column order of CSV records (see csv_records)
+def iter_data(file_path, columns=None, layout=None):
+    if isinstance(file_path, dict):
+        yield from iter_file_set(file_path, columns)
+        return
+    fmt = input_format(file_path)
+    with open_input(file_path) as file:
+        if fmt == 'csv':
+            yield from csv_records(file, columns=columns, layout=layout)
+        elif fmt == 'json':
+            yield from project_rows(iter_json_array(file), columns)
+        else:
+            yield from project_rows(iter_ndjson(file), columns)
+
+# Multi-file input: a directory (its data files) or a glob pattern names a file set, read as one input in path
+# order. A bounded pool of threads reads and decompresses the next files while the rows of the current one are
+# consumed, so at most `threads` files are held ahead. CSV records of every file take one layout, the header
+# columns of all the files in the order first seen, with None where a file lacks a column
+INPUT_EXTENSIONS = ('.csv', '.json', '.ndjson', '.jsonl')
+
+# Function: Whether a directory entry is an input file by its extension (optionally followed by .gz or .zst)
+def is_input_file(path):
+    name = path.lower()
+    for suffix in ('.gz', '.zst'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.isfile(path) and name.endswith(INPUT_EXTENSIONS)
+
+# Function: Files of an input: the file itself, the input files of a directory or the files matching a glob pattern
+# (** spans directories), sorted by path. Raises ValueError when there are none
+def input_files(spec):
+    if os.path.isfile(spec):
+        return [spec]
+    if os.path.isdir(spec):
+        files = [path for path in (os.path.join(spec, name) for name in os.listdir(spec)) if is_input_file(path)]
+    else:
+        files = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+    if not files:
+        raise ValueError(f"no input files match {spec!r}")
+    return sorted(files)
+
+# Function: Header columns of the CSV files, in the order first seen (None when no file is a CSV)
+def csv_layout(files):
+    layout = {}
+    for path in files:
+        if input_format(path) == 'csv':
+            with open_input(path) as file:
+                layout.update(dict.fromkeys(next(csv.reader([file.readline()]), [])))
+    return list(layout) if layout else None
+
+# Function: File set of input files, read by `threads` threads. progress: {path: {'rows', 'bytes', 'seconds',
+# 'reads'}} of the files read so far; report(path, entry) is called (from the reading thread) as each file is read
+def new_file_set(spec, files, threads=4, report=None):
+    return {'spec': spec, 'files': files, 'layout': csv_layout(files), 'threads': threads, 'progress': {},
+            'report': report}
+
+# Function: Input of a run: the path of a single file as it is, a file set for a directory or glob pattern
+def open_input_set(spec, threads=4, report=None):
+    if os.path.isfile(spec):
+        return spec
+    return new_file_set(spec, input_files(spec), threads, report)
+
+# Function: Path (or pattern) naming an input
+def input_name(file_path):
+    return file_path['spec'] if isinstance(file_path, dict) else file_path
+
+# Worker: the rows of one file of a file set, its progress entry updated once it is read
+def read_set_file(file_set, path, columns=None):
+    start = time.perf_counter()
+    rows = list(iter_data(path, columns, file_set['layout']))
+    entry = file_set['progress'].setdefault(path, {'rows': 0, 'bytes': os.path.getsize(path), 'seconds': 0.0,
+                                                   'reads': 0})
+    entry.update(rows=len(rows), seconds=time.perf_counter() - start, reads=entry['reads'] + 1)
+    if file_set['report'] is not None:
+        file_set['report'](path, entry)
+    return rows
+
+# Function: Rows of the files of a file set, in path order
+def iter_file_set(file_set, columns=None):
+    files = iter(file_set['files'])
+    with ThreadPoolExecutor(max_workers=file_set['threads'], thread_name_prefix='input') as pool:
+        pending = deque(pool.submit(read_set_file, file_set, path, columns)
+                        for path in islice(files, file_set['threads']))
+        try:
+            while pending:
+                rows = pending.popleft().result()
+                for path in islice(files, 1):
+                    pending.append(pool.submit(read_set_file, file_set, path, columns))
+                yield from rows
+        finally:
+            # A reader stopping early (e.g. after a sample of the head) leaves the queued files unread
+            for future in pending:
+                future.cancel()
+
+# Function: Progress report of --progress: a line per file read, on stderr
+def print_file_progress(path, entry):
+    # One write per line, as the reading threads report concurrently
+    sys.stderr.write(f"Read {path}: {entry['rows']} rows, {entry['bytes'] / 1e6:.1f} MB in {entry['seconds']:.2f}s\n")
+
+# Function: Hash of a file's bytes
+def content_digest(file_path):
+    content = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            content.update(block)
+    return content.hexdigest()
+
+# Function: Path, size, mtime and content hash of a file
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content': content_digest(file_path)
+    }
@@ -0,0 +1,176 @@
+import sys
+import csv
+from functools import lru_cache
+import numpy as np
+from itertools import islice
+
+# Compact rows: a record is a tuple of cell values whose class holds the schema (field names and their positions),
+# made once per header. Rows are records where many are held at once (loaded input, windowed output, cached rows)
+# and read like dicts there (row[col], row.get, keys, items, csv writers, pickling). A stage that changes a row
+# builds the new record straight from the old one's cells (field_setter); only rows that are dicts stay dicts.
+class Record(tuple):
+    __slots__ = ()
+    fields = ()
+    index = {}
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, self.index[key])
+
+    def get(self, key, default=None):
+        try:
+            return tuple.__getitem__(self, self.index[key])
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.index.keys()
+
+    def values(self):
+        return list(tuple.__iter__(self))
+
+    def items(self):
+        return list(zip(self.fields, tuple.__iter__(self)))
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __eq__(self, other):
+        return dict(self.items()) == (dict(other.items()) if hasattr(other, 'items') else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return make_record, (self.fields, tuple(tuple.__iter__(self)))
+
+# Function: Record class for a tuple of field names, made once per schema
+@lru_cache(maxsize=None)
+def record_type(fields):
+    return type('Record', (Record,), {'__slots__': (), 'fields': fields,
+                                      'index': {name: i for i, name in enumerate(fields)}})
+
+# Function: Record of the given fields and values
+def make_record(fields, values):
+    return tuple.__new__(record_type(tuple(fields)), values)
+
+# Function: Setter of the given fields, made once per field list: setter(row, *values) is the row with the fields
+# set to the values, those it lacks added at the end. Per record schema the positions (and the schema of the wider
+# record) are found once, and each new record is built from the old one's cells; a dict row is copied with them
+@lru_cache(maxsize=None)
+def field_setter(*fields):
+    new = tuple.__new__
+    cells = tuple.__iter__
+    plans = {}
+
+    def plan(kind):
+        positions = [kind.index.get(field) for field in fields]
+        added = tuple(field for field, position in zip(fields, positions) if position is None)
+        target = record_type(kind.fields + added) if added else kind
+        return target, positions[0] if len(fields) == 1 else None, added == fields, positions
+
+    def setter(row, *values):
+        kind = type(row)
+        found = plans.get(kind)
+        if found is None:
+            if not issubclass(kind, Record):
+                return {**row, **dict(zip(fields, values))}
+            found = plans[kind] = plan(kind)
+        target, single, appended, positions = found
+        if single is not None:
+            items = [*cells(row)]
+            items[single] = values[0]
+            return new(target, items)
+        if appended:
+            return new(target, tuple.__add__(row, values))
+        items = [*cells(row)]
+        for position, value in zip(positions, values):
+            if position is None:
+                items.append(value)
+            else:
+                items[position] = value
+        return new(target, items)
+    return setter
+
+# Function: Row packed as a record for keeping; rows with stray fields (under None) stay dicts
+def pack_row(row):
+    if isinstance(row, Record) or None in row:
+        return row
+    return tuple.__new__(record_type(tuple(row)), row.values())
+
+# Function: Records of CSV lines (header first unless fieldnames is given). With a projection only the wanted
+# fields are kept (in file order). Missing trailing fields are None, as with DictReader; a line with more fields
+# than the header becomes a dict with the extras under None, also as with DictReader. layout: the fields of the
+# records in that order instead, None for the ones the header lacks (stray fields are dropped)
+def csv_records(lines, fieldnames=None, columns=None, layout=None):
+    lines = iter(lines)
+    reader = csv.reader(lines)
+    if fieldnames is None:
+        fieldnames = next(reader, [])
+    if len(set(fieldnames)) < len(fieldnames):
+        # Repeated header names: plain dicts, where the last of them wins
+        yield from project_rows(csv.DictReader(lines, fieldnames=fieldnames), columns)
+        return
+    new = tuple.__new__
+    if layout is not None and list(layout) == fieldnames:
+        layout = None
+    if columns is not None or layout is not None:
+        names = [name for name in (fieldnames if layout is None else layout) if columns is None or name in columns]
+        position = {name: i for i, name in enumerate(fieldnames)}
+        picks = [position.get(name, sys.maxsize) for name in names]
+        kind = record_type(tuple(names))
+        for fields in reader:
+            if fields:
+                yield new(kind, [fields[i] if i < len(fields) else None for i in picks])
+        return
+    kind = record_type(tuple(fieldnames))
+    width = len(fieldnames)
+    for fields in reader:
+        if len(fields) == width:
+            yield new(kind, fields)
+        elif len(fields) > width:
+            yield {**dict(zip(fieldnames, fields)), None: fields[width:]}
+        elif fields:
+            yield new(kind, fields + [None] * (width - len(fields)))
+
+# Function: Rows restricted to the given columns (all columns when None)
+def project_rows(rows, columns):
+    if columns is None:
+        return rows
+    wanted = set(columns)
+    return ({key: value for key, value in row.items() if key in wanted} for row in rows)
+
+# Function: Split an iterable into lists of at most chunk_size items
+def chunked(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+# Function: (name, values, mask) per column, or None when rows differ in keys or hold non-scalar values
+def rows_to_columns(rows):
+    names = list(rows[0].keys()) if rows else []
+    if None in names or any(row.keys() != rows[0].keys() for row in rows):
+        return None
+    columns = []
+    for name in names:
+        cells = [row[name] for row in rows]
+        kinds = {type(cell) for cell in cells if cell is not None}
+        if len(kinds) > 1 or not kinds <= {str, float, int}:
+            return None
+        kind = kinds.pop() if kinds else str
+        mask = np.array([cell is not None for cell in cells], dtype=bool)
+        filler = kind()
+        values = np.array([filler if cell is None else cell for cell in cells],
+                          dtype={str: str, float: np.float64, int: np.int64}[kind])
+        columns.append((name, values, mask))
+    return columns
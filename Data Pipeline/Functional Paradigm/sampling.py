@@ -0,0 +1,175 @@
+import math
+import random
+import statistics
+from collections import Counter
+from operator import itemgetter
+import argparse
+from itertools import chain, count, islice
+from records import csv_records
+from readers import input_format, iter_data, open_input
+from sketches import counter_mode
+from groupings import merge_sums
+
+# Sampling (--sample): a quick run over a sample of the input, a fraction of the rows (Bernoulli) or a reservoir of a
+# fixed number of them, optionally drawn per group (stratified, missing groups forming a stratum of their own). The
+# whole input is still read, but an unstratified CSV sample parses only the lines it keeps (lines are assumed not to
+# break inside quoted fields, as for the shards). A stratum that kept n of its N rows stands for N / n rows each
+
+# Function: ('fraction', f) or ('size', n) of a --sample value: 0.05 or 5% (fraction), 10000 (rows)
+def parse_sample(text):
+    try:
+        if text.endswith('%'):
+            kind, amount = 'fraction', float(text[:-1]) / 100
+        elif text.isdigit():
+            kind, amount = 'size', int(text)
+        else:
+            kind, amount = 'fraction', float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid sample {text!r} (expected a fraction such as 0.05 or 5%, "
+                                         f"or a row count)")
+    if not (0 < amount <= 1 if kind == 'fraction' else amount > 0):
+        raise argparse.ArgumentTypeError(f"invalid sample {text!r} (a fraction is in (0, 1], a row count above 0)")
+    return kind, amount
+
+# Function: Items kept by independent draws with probability fraction, skipping ahead a geometric number of items
+# between them instead of drawing for each
+def bernoulli_sample(items, fraction, rng):
+    items = iter(items)
+    if fraction >= 1:
+        yield from items
+        return
+    log_skip = math.log1p(-fraction)
+    end = object()
+    while True:
+        item = next(islice(items, int(math.log(1.0 - rng.random()) / log_skip), None), end)
+        if item is end:
+            return
+        yield item
+
+# Function: Uniform sample of size items (all of them when fewer), skipping ahead between replacements (Li's
+# algorithm L)
+def reservoir_sample(items, size, rng):
+    items = iter(items)
+    reservoir = list(islice(items, size))
+    weight = math.exp(math.log(1.0 - rng.random()) / size)
+    end = object()
+    while weight < 1:
+        item = next(islice(items, int(math.log(1.0 - rng.random()) / math.log1p(-weight)), None), end)
+        if item is end:
+            break
+        reservoir[rng.randrange(size)] = item
+        weight *= math.exp(math.log(1.0 - rng.random()) / size)
+    return reservoir
+
+# Function: Stratum of a row by its raw group cell, as standardization will key it; None for a missing cell
+def stratum_of(row, group_by_col):
+    value = row.get(group_by_col)
+    return None if value in (None, '') else str(value).strip()
+
+# Function: Sampled rows by stratum, the size of each stratum, the stratum of every sampled row in input order and
+# the fill value of missing group cells: ({stratum: rows}, {stratum: rows read}, [stratum], fill). Unstratified
+# samples have the single stratum None, no order (their rows are the order) and no fill; stratified ones keep each
+# stratum's rows in input order and, as they read every group cell, fill with the mode of the raw cells as a full
+# run imputes them
+def sample_data(file_path, sample, group_by_col=None, columns=None, seed=None):
+    kind, amount = sample
+    rng = random.Random(seed)
+    if group_by_col is None:
+        counter = count()
+        if isinstance(file_path, str) and input_format(file_path) == 'csv':
+            with open_input(file_path) as file:
+                header = file.readline()
+                lines = map(itemgetter(0), zip(file, counter))
+                picked = (list(bernoulli_sample(lines, amount, rng)) if kind == 'fraction'
+                          else reservoir_sample(lines, amount, rng))
+            rows = list(csv_records(chain([header], picked), columns=columns))
+        else:
+            records = map(itemgetter(0), zip(iter_data(file_path, columns), counter))
+            rows = (list(bernoulli_sample(records, amount, rng)) if kind == 'fraction'
+                    else reservoir_sample(records, amount, rng))
+        return {None: rows}, {None: next(counter)}, None, None
+
+    # One draw per row; a reservoir of amount rows per stratum (Algorithm R)
+    strata, positions, sizes, cells = {}, {}, Counter(), Counter()
+    for position, row in enumerate(iter_data(file_path, columns)):
+        key = stratum_of(row, group_by_col)
+        value = row.get(group_by_col)
+        if value not in (None, '', '0'):
+            cells[value] += 1
+        seen = sizes[key]
+        sizes[key] += 1
+        rows, spots = strata.setdefault(key, []), positions.setdefault(key, [])
+        if kind == 'fraction':
+            if rng.random() < amount:
+                rows.append(row)
+                spots.append(position)
+        elif seen < amount:
+            rows.append(row)
+            spots.append(position)
+        else:
+            slot = rng.randrange(seen + 1)
+            if slot < amount:
+                rows[slot], spots[slot] = row, position
+    # Reservoirs are back in input order, as a full run would see their rows
+    for key, spots in positions.items():
+        if kind != 'fraction':
+            strata[key] = [row for _, row in sorted(zip(spots, strata[key]), key=itemgetter(0))]
+            spots.sort()
+    order = [key for _, key in sorted((position, key) for key, spots in positions.items() for position in spots)]
+    return strata, dict(sizes), order, counter_mode(cells) if cells else None
+
+# Function: Sum, mean and the sample of each stratum of a sampled run, for the estimates. kept: {stratum: processed
+# rows}; each stratum's rows that did not make it through the pipeline count as 0 towards the sum
+def new_sample_totals(strata, sizes, kept, value_col):
+    totals = {}
+    for key, rows in strata.items():
+        values = [row[value_col] for row in kept[key]]
+        totals[key] = {'n': len(rows), 'N': sizes[key], 'k': len(values), 'sum': math.fsum(values),
+                       'sum_sq': math.fsum(value * value for value in values)}
+    return totals
+
+# Function: Estimated variance of the total over the strata of sum_z and sum_zz (sum and sum of squares of the
+# sampled rows' z), each stratum a simple random sample of n of its N rows
+def stratified_variance(totals, sum_z, sum_zz):
+    variance = 0.0
+    for key, stratum in totals.items():
+        n, N = stratum['n'], stratum['N']
+        if n > 1:
+            spread = (sum_zz[key] - sum_z[key] ** 2 / n) / (n - 1)
+            variance += N * N * (1 - n / N) * max(spread, 0.0) / n
+    return variance
+
+# Function: Estimates of the value's total and mean over the whole input, with their confidence intervals (normal
+# approximation). The mean is a ratio of two estimated totals (value sum / row count), its variance linearized
+def sample_estimates(totals, value_col, confidence=0.95):
+    weights = {key: stratum['N'] / stratum['n'] for key, stratum in totals.items() if stratum['n']}
+    total = math.fsum(weights[key] * totals[key]['sum'] for key in weights)
+    rows = math.fsum(weights[key] * totals[key]['k'] for key in weights)
+    mean = total / rows if rows else 0
+    sums = {key: totals[key]['sum'] for key in weights}
+    squares = {key: totals[key]['sum_sq'] for key in weights}
+    # z = value - mean for the processed rows, 0 for the others
+    z_sums = {key: sums[key] - mean * totals[key]['k'] for key in weights}
+    z_squares = {key: squares[key] - 2 * mean * sums[key] + mean * mean * totals[key]['k'] for key in weights}
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    total_margin = z * math.sqrt(stratified_variance(totals, sums, squares))
+    mean_margin = z * math.sqrt(stratified_variance(totals, z_sums, z_squares)) / rows if rows else 0
+    return {
+        f"mean_{value_col}": mean,
+        f"mean_{value_col}_ci": (mean - mean_margin, mean + mean_margin),
+        f"sum_{value_col}": total,
+        f"sum_{value_col}_ci": (total - total_margin, total + total_margin),
+        "sample_rows": sum(stratum['n'] for stratum in totals.values()),
+        "population_rows": sum(stratum['N'] for stratum in totals.values())
+    }
+
+# Function: Scale the sum, count and mean states of every group by weight (a mean's sum and count both, so it
+# stays a mean); the other aggregates describe the sample as they are
+def scale_groupings(groupings, weight):
+    for grouping in groupings:
+        scaled = [merge is merge_sums for _, _, _, _, merge, _ in grouping['aggregates']]
+        for states in grouping['groups'].values():
+            for state, scale in zip(states, scaled):
+                if scale:
+                    state[:] = [part * weight for part in state]
+    return groupings
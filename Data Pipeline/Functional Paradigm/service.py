@@ -0,0 +1,191 @@
+import sys
+import json
+import os
+import time
+import logging
+import signal
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from stat import S_ISSOCK
+from concurrent.futures import ProcessPoolExecutor
+from groupings import format_group_key
+from input_cache import new_warm_cache
+from cube import run_cube_query
+
+# Service mode (--serve): jobs posted as JSON over HTTP or a Unix socket run in a pool of worker processes, with
+# admission control, metrics and cube queries answered in the server
+
+# Warm cache of the current service worker process (set by init_service_worker)
+service_warm_cache = None
+
+def init_service_worker(warm_datasets):
+    global service_warm_cache
+    service_warm_cache = new_warm_cache(warm_datasets)
+
+# Function: Run one job in a service worker with run (run_pipeline); returns the JSON response body
+def run_service_job(run, args):
+    started = time.perf_counter()
+    result = run(args, warm=service_warm_cache)
+    response = {'rows': 0, 'group_aggregates': {}, 'date_aggregates': {}, 'extra_aggregates': {}, 'stats': None,
+                'date_parsing': None}
+    if result['stats'] is not None:
+        # JSON object keys are text: composite keys are joined
+        response.update(rows=result['rows'],
+                        group_aggregates={format_group_key(key): value
+                                          for key, value in result['group_aggregates'].items()},
+                        date_aggregates=result['date_aggregates'],
+                        extra_aggregates={spec: {format_group_key(key): value for key, value in aggregates.items()}
+                                          for spec, aggregates in result['extra_aggregates'].items()},
+                        stats=result['stats'], date_parsing=result['date_report'])
+    response['notes'] = result['notes']
+    response['seconds'] = time.perf_counter() - started
+    return response
+
+# Function: Job counters of the service; a job is in flight from admission until its response is ready
+def new_service_state(workers, max_queue):
+    return {'workers': workers, 'limit': workers + max_queue, 'in_flight': 0, 'completed': 0, 'failed': 0,
+            'rejected': 0, 'lock': threading.Lock()}
+
+# Exported service metrics: (state field, metric name, type, help); 'queued' and 'running' are derived
+SERVICE_METRICS = [
+    ('queued', 'pipeline_service_jobs_queued', 'gauge', 'Jobs waiting for a worker'),
+    ('running', 'pipeline_service_jobs_running', 'gauge', 'Jobs being processed'),
+    ('completed', 'pipeline_service_jobs_completed_total', 'counter', 'Jobs that returned results'),
+    ('failed', 'pipeline_service_jobs_failed_total', 'counter', 'Jobs that raised an error'),
+    ('rejected', 'pipeline_service_jobs_rejected_total', 'counter', 'Jobs refused because the queue was full'),
+    ('workers', 'pipeline_service_workers', 'gauge', 'Worker processes'),
+]
+
+# Function: Prometheus text exposition of the service state
+def service_metrics(state):
+    with state['lock']:
+        values = {field: state[field] for field in ('completed', 'failed', 'rejected', 'workers')}
+        values['running'] = min(state['in_flight'], state['workers'])
+        values['queued'] = state['in_flight'] - values['running']
+    lines = []
+    for field, metric, kind, help_text in SERVICE_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {values[field]}"]
+    return '\n'.join(lines) + '\n'
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # POST /jobs runs a job and answers with its results as JSON; GET /cube answers a cube query (parameters
+    # path, query, date_from, date_to, groups and period, as run_cube_query takes them) in the handler thread;
+    # GET /metrics and GET /health report on the service. self.server carries the worker pool, the state
+    # and the functions given to serve
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/cube':
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            unknown = sorted(set(params) - {'path', 'query', 'date_from', 'date_to', 'groups', 'period'})
+            try:
+                if unknown or 'path' not in params:
+                    raise ValueError(f"a cube query needs a path; unknown parameters: {', '.join(unknown) or 'none'}")
+                self.reply_json(200, run_cube_query(params.pop('path'), **params))
+            except ValueError as error:
+                self.reply_json(400, {'error': str(error)})
+        elif self.path == '/metrics':
+            self.reply(200, service_metrics(self.server.state), 'text/plain; version=0.0.4')
+        elif self.path == '/health':
+            self.reply_json(200, {'status': 'ok'})
+        else:
+            self.reply_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.reply_json(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            args = self.server.job_args(json.loads(self.rfile.read(length) or b'null'))
+        except ValueError as error:
+            self.reply_json(400, {'error': str(error)})
+            return
+
+        # Backpressure: past workers + max_queue jobs in flight, clients are told to retry later
+        state = self.server.state
+        with state['lock']:
+            admitted = state['in_flight'] < state['limit']
+            if admitted:
+                state['in_flight'] += 1
+            else:
+                state['rejected'] += 1
+        if not admitted:
+            self.reply_json(503, {'error': "job queue is full"}, {'Retry-After': '1'})
+            return
+
+        try:
+            status, body = 200, self.server.pool.submit(run_service_job, self.server.run, args).result()
+        except Exception as error:
+            status, body = 500, {'error': f"{type(error).__name__}: {error}"}
+        with state['lock']:
+            state['in_flight'] -= 1
+            state['completed' if status == 200 else 'failed'] += 1
+        self.reply_json(status, body)
+
+    def reply_json(self, status, body, headers=None):
+        self.reply(status, json.dumps(body, default=str), 'application/json', headers)
+
+    def reply(self, status, text, content_type, headers=None):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.info("%s %s", self.address_string(), format % args)
+
+class UnixServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+# Function: SIGTERM stops the service like Ctrl-C
+def stop_service(signum, frame):
+    raise KeyboardInterrupt
+
+# Function: Serve jobs until interrupted: HTTP on 127.0.0.1:port, or on a Unix socket. Worker processes keep the
+# imported libraries and recently prepared datasets warm between jobs. job_args(job) turns a request body into the
+# job's arguments (raising ValueError), run(args, warm=...) runs it in a worker
+def serve(args, job_args, run):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    pool = ProcessPoolExecutor(max_workers=args.serve_workers, initializer=init_service_worker,
+                               initargs=(args.warm_datasets,))
+    # Start every worker now, before the server threads exist (workers are forked from this process)
+    for future in [pool.submit(os.getpid) for _ in range(args.serve_workers)]:
+        future.result()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            if not S_ISSOCK(os.stat(args.socket).st_mode):
+                sys.exit(f"{args.socket} exists and is not a socket")
+            # Left behind by an earlier service
+            os.unlink(args.socket)
+        server = UnixServiceServer(args.socket, ServiceHandler)
+        where = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), ServiceHandler)
+        where = f"http://127.0.0.1:{server.server_address[1]}"
+    server.pool = pool
+    server.job_args = job_args
+    server.run = run
+    server.state = new_service_state(args.serve_workers, args.max_queue)
+
+    signal.signal(signal.SIGTERM, stop_service)
+    print(f"Serving on {where} with {args.serve_workers} workers (POST /jobs, GET /metrics)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown(cancel_futures=True)
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
@@ -0,0 +1,50 @@
+import csv
+import os
+import zlib
+from records import chunked, csv_records
+from readers import compression_of, input_format, iter_data
+
+# Shards of the input for --workers (byte ranges of a CSV, or record batches) and the partition of a group key in
+# the shuffle between the row-local stages and the per-group ones
+
+# Function: Yield the decoded lines of a file whose first byte lies in [start, end)
+def read_byte_range(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        # Skip the line straddling start; it belongs to the previous range
+        file.seek(start - 1)
+        file.readline()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line.decode('utf-8')
+
+# Function: Split the input into shards: byte ranges of a CSV (no newlines inside quoted fields) or record batches.
+# The files of a file set are split one by one, each into a share of the parts that follows its size
+def make_shards(file_path, parts, columns=None, layout=None):
+    if isinstance(file_path, dict):
+        sizes = [os.path.getsize(path) for path in file_path['files']]
+        total = sum(sizes) or 1
+        return [shard for path, size in zip(file_path['files'], sizes)
+                for shard in make_shards(path, max(1, round(parts * size / total)), columns, file_path['layout'])]
+    if input_format(file_path) == 'csv' and compression_of(file_path) is None:
+        with open(file_path, 'rb') as file:
+            header = file.readline()
+        fieldnames = next(csv.reader([header.decode('utf-8')]), [])
+        size = os.path.getsize(file_path)
+        step = max(1, (size - len(header)) // parts + 1)
+        return [('csv', file_path, fieldnames, start, min(start + step, size), columns, layout)
+                for start in range(len(header), size, step)]
+    records = list(iter_data(file_path, columns, layout))
+    return [('records', batch) for batch in chunked(records, max(1, len(records) // parts + 1))]
+
+# Function: Rows of one shard
+def iter_shard(shard):
+    if shard[0] == 'csv':
+        _, file_path, fieldnames, start, end, columns, layout = shard
+        return csv_records(read_byte_range(file_path, start, end), fieldnames, columns, layout)
+    return iter(shard[1])
+
+# Function: Stable partition number of a group key (str hash is salted per process)
+def partition_of(key, partitions):
+    return zlib.crc32(str(key).encode('utf-8')) % partitions
@@ -0,0 +1,126 @@
+import sys
+import hashlib
+import math
+import statistics
+
+# Mergeable summaries of a column in bounded memory: quantile sketches (median, percentiles, histograms),
+# HyperLogLog distinct counts and mode counters. They are fed value by value or in batches and merge across
+# chunks, partitions and runs
+
+# Function: Empty quantile sketch (KLL-style compactors); rank error is roughly bounded by error * count.
+# With error 0 it never compacts, so it keeps every value and is exact
+def new_sketch(error):
+    return {'k': max(8, math.ceil(2 / error)) if error else sys.maxsize, 'levels': [[]], 'count': 0, 'flip': 0}
+
+# Function: Capacity of a compactor level; lower levels shrink geometrically as the sketch grows
+def level_capacity(sketch, level):
+    depth = len(sketch['levels']) - level - 1
+    return max(2, int(sketch['k'] * (2 / 3) ** depth))
+
+# Function: Halve every full level into the one above it, keeping alternate items of the sorted level
+def compress_sketch(sketch):
+    levels = sketch['levels']
+    for level in range(len(levels)):
+        if len(levels[level]) < level_capacity(sketch, level):
+            continue
+        if level + 1 == len(levels):
+            levels.append([])
+        items = sorted(levels[level])
+        leftover = [items.pop()] if len(items) % 2 else []
+        sketch['flip'] ^= 1
+        levels[level + 1].extend(items[sketch['flip']::2])
+        levels[level] = leftover
+    return sketch
+
+# Function: Add one value to a sketch
+def sketch_add(sketch, value):
+    sketch['levels'][0].append(value)
+    sketch['count'] += 1
+    if len(sketch['levels'][0]) >= level_capacity(sketch, 0):
+        compress_sketch(sketch)
+    return sketch
+
+# Function: Add a batch of values to a sketch; the same sketch as adding them one at a time
+def sketch_extend(sketch, values):
+    values = list(values)
+    start = 0
+    while start < len(values):
+        room = max(1, level_capacity(sketch, 0) - len(sketch['levels'][0]))
+        sketch['levels'][0].extend(values[start:start + room])
+        sketch['count'] += len(values[start:start + room])
+        start += room
+        if len(sketch['levels'][0]) >= level_capacity(sketch, 0):
+            compress_sketch(sketch)
+    return sketch
+
+# Function: Items of a sketch and their weights (each item at level h stands for 2**h values), e.g. for a
+# weighted histogram
+def sketch_histogram(sketch):
+    weighted = [(value, 2 ** level) for level, items in enumerate(sketch['levels']) for value in items]
+    return [value for value, _ in weighted], [weight for _, weight in weighted]
+
+# Function: Approximate q-quantile; each item at level h stands for 2**h values
+def sketch_quantile(sketch, q):
+    weighted = sorted((value, 2 ** level) for level, items in enumerate(sketch['levels']) for value in items)
+    target = q * sketch['count']
+    seen = 0
+    for value, weight in weighted:
+        seen += weight
+        if seen >= target:
+            return value
+    return weighted[-1][0]
+
+# Function: Median from a sketch, exact while nothing has been compacted yet
+def sketch_median(sketch):
+    if sketch['count'] == 0:
+        raise statistics.StatisticsError("no median for empty data")
+    if len(sketch['levels']) == 1:
+        return statistics.median(sketch['levels'][0])
+    return sketch_quantile(sketch, 0.5)
+
+# Function: Fold another quantile sketch into this one
+def sketch_merge(sketch, other):
+    for level, items in enumerate(other['levels']):
+        if level == len(sketch['levels']):
+            sketch['levels'].append([])
+        sketch['levels'][level].extend(items)
+    sketch['count'] += other['count']
+    return compress_sketch(sketch)
+
+# Function: Count one categorical value
+def counter_add(counter, value):
+    counter[value] += 1
+    return counter
+
+# Function: Most common value from a counter (first seen wins ties, like statistics.mode)
+def counter_mode(counter):
+    if not counter:
+        raise statistics.StatisticsError("no mode for empty data")
+    return counter.most_common(1)[0][0]
+
+# Function: Empty HyperLogLog distinct counter with 2**precision registers (relative error ~1.04 / sqrt(registers))
+def new_hll(precision=12):
+    return {'p': precision, 'registers': bytearray(1 << precision)}
+
+# Function: Add one value to a distinct counter; the hash is stable across processes, so counters merge
+def hll_add(hll, value):
+    p = hll['p']
+    hashed = int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'big')
+    rest = hashed & ((1 << (64 - p)) - 1)
+    rank = 64 - p - rest.bit_length() + 1
+    index = hashed >> (64 - p)
+    if rank > hll['registers'][index]:
+        hll['registers'][index] = rank
+
+def hll_merge(hll, other):
+    hll['registers'] = bytearray(map(max, hll['registers'], other['registers']))
+
+# Function: Estimated number of distinct values (linear counting while many registers are still empty)
+def hll_count(hll):
+    registers = hll['registers']
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in registers)
+    empty = registers.count(0)
+    if estimate <= 2.5 * m and empty:
+        estimate = m * math.log(m / empty)
+    return round(estimate)
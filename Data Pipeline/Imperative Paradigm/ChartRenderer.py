@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+class ChartRenderer:
+    # Saves charts without a display: each job is (file name, figure function, arguments) and the figure
+    # functions build their figures with the object-oriented API, so jobs can be drawn in worker processes.
+    # A chart is skipped when its arguments are unchanged since it was last saved (digests kept in the manifest)
+    def __init__(self, out_dir=".", fmt="png", workers=None, force=False, manifest="chart_manifest.json"):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.workers = workers or min(3, os.cpu_count() or 1)
+        self.force = force
+        self.manifest_path = os.path.join(out_dir, manifest)
+
+    @staticmethod
+    def lttb_indices(values, max_points):
+        # Indices kept by Largest-Triangle-Three-Buckets downsampling; points are taken as evenly spaced,
+        # as a categorical axis draws them. The first and last points are always kept
+        n = len(values)
+        if max_points >= n or max_points < 3:
+            return list(range(n))
+        y = np.asarray(values, dtype=float)
+        x = np.arange(n, dtype=float)
+        # Bucket b holds points edges[b]:edges[b + 1]
+        edges = (np.arange(max_points - 1) * ((n - 2) / (max_points - 2))).astype(int) + 1
+        edges[-1] = n - 1
+        kept = [0]
+        anchor = 0
+        for b in range(max_points - 2):
+            start, end = edges[b], edges[b + 1]
+            next_start, next_end = (end, edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+            # Twice the area of the triangle (anchor, candidate, next bucket average)
+            area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor])
+                          - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+            anchor = start + int(area.argmax())
+            kept.append(anchor)
+        kept.append(n - 1)
+        return kept
+
+    @staticmethod
+    def bin_values(values, bins=10):
+        # Histogram counts and edges, so only the bins (not every value) reach the renderer
+        counts, edges = np.histogram(np.asarray(values, dtype=float), bins=bins)
+        return counts.tolist(), edges.tolist()
+
+    @staticmethod
+    def draw(path, figure, arguments, style):
+        # Runs in the workers; False when there was nothing to plot
+        import matplotlib as mpl
+        with mpl.rc_context(style):
+            fig = figure(*arguments)
+            if fig is None:
+                return False
+            fig.savefig(path)
+        return True
+
+    def digest(self, name, figure, arguments, style):
+        return hashlib.blake2b(pickle.dumps((name, figure.__qualname__, arguments, style)),
+                               digest_size=16).hexdigest()
+
+    def render(self, jobs, style=None):
+        # jobs: (name without extension, figure function, arguments); style: rcParams applied while drawing.
+        # Returns (saved paths, skipped paths)
+        style = style or {}
+        try:
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = {}
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        pending = []
+        skipped = []
+        for name, figure, arguments in jobs:
+            path = os.path.join(self.out_dir, f"{name}.{self.fmt}")
+            digest = self.digest(name, figure, arguments, style)
+            if not self.force and manifest.get(path) == digest and os.path.exists(path):
+                skipped.append(path)
+            else:
+                pending.append((path, figure, arguments, digest))
+
+        if self.workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                drawn = list(pool.map(self.draw, *zip(*[(path, figure, arguments, style)
+                                                       for path, figure, arguments, _ in pending])))
+        else:
+            drawn = [self.draw(path, figure, arguments, style) for path, figure, arguments, _ in pending]
+
+        saved = []
+        for (path, _, _, digest), done in zip(pending, drawn):
+            if done:
+                manifest[path] = digest
+                saved.append(path)
+        with open(self.manifest_path, 'w') as file:
+            json.dump(manifest, file, indent=2)
+        return saved, skipped
@@ -0,0 +1,105 @@
+import numpy as np
+
+MISSING_VALUES = (None, '', 'NA', 'N/A')
+# Cell of a record without the column (see from_rows); rows read it as row.get(column, "Unknown")
+ABSENT = object()
+
+class ColumnarTable:
+    # One typed NumPy array per column plus a validity mask (True = value present)
+    def __init__(self, columns, masks=None):
+        self.columns = dict(columns)
+        self.masks = dict(masks) if masks else {}
+        for name, values in self.columns.items():
+            if name not in self.masks:
+                self.masks[name] = np.ones(len(values), dtype=bool)
+
+    @classmethod
+    def from_columns(cls, raw_columns):
+        # raw_columns: {name: list of raw cell values}; every column keeps its cells' text as str() gives it, as rows
+        # do ('00123' stays '00123', missing cells read 'None', 'NA', ...); numeric_column parses them when asked
+        columns = {}
+        masks = {}
+        for name, raw in raw_columns.items():
+            mask = np.array([value not in MISSING_VALUES and value is not ABSENT for value in raw], dtype=bool)
+            values = np.array(["Unknown" if value is ABSENT else str(value) for value in raw], dtype=str)
+            columns[name] = values
+            masks[name] = mask
+        return cls(columns, masks)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # Single pass over any iterable of dicts; a column first seen late is padded with ABSENT
+        raw = {}
+        count = 0
+        for row in rows:
+            for name, value in row.items():
+                if name is None:
+                    continue
+                if name not in raw:
+                    raw[name] = [ABSENT] * count
+                raw[name].append(value)
+            count += 1
+            if len(row) < len(raw):
+                for values in raw.values():
+                    if len(values) < count:
+                        values.append(ABSENT)
+        return cls.from_columns(raw)
+
+    def __len__(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def column_names(self):
+        return list(self.columns.keys())
+
+    def valid_values(self, name):
+        return self.columns[name][self.masks[name]]
+
+    def with_column(self, name, values, mask):
+        columns = dict(self.columns)
+        masks = dict(self.masks)
+        columns[name] = values
+        masks[name] = mask
+        return ColumnarTable(columns, masks)
+
+    def take(self, selector):
+        # selector: boolean mask or index array over rows
+        return ColumnarTable({name: values[selector] for name, values in self.columns.items()},
+                             {name: mask[selector] for name, mask in self.masks.items()})
+
+    def numeric_column(self, name):
+        # Float view of a column; unparseable and NaN cells become invalid
+        values = self.columns[name]
+        mask = self.masks[name].copy()
+        if values.dtype.kind == 'f':
+            return values, mask & ~np.isnan(values)
+        converted = np.full(len(values), np.nan)
+        try:
+            # NumPy parses text as float() does; a cell it rejects sends the column through float() cell by cell
+            converted[mask] = values[mask].astype(np.float64)
+        except ValueError:
+            for i in np.flatnonzero(mask):
+                try:
+                    converted[i] = float(values[i])
+                except ValueError:
+                    mask[i] = False
+        return converted, mask & ~np.isnan(converted)
+
+    def factorize(self, name, selector=None, missing_key="Unknown"):
+        # Integer code per (selected) row and the distinct keys, in order of first appearance
+        keys = np.where(self.masks[name], self.columns[name].astype(str), missing_key)
+        if selector is not None:
+            keys = keys[selector]
+        uniques, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(first_index, kind='stable')
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+        return rank[inverse], uniques[order]
+
+    def to_rows(self):
+        names = self.column_names()
+        lists = {name: values.tolist() for name, values in self.columns.items()}
+        masks = {name: mask.tolist() for name, mask in self.masks.items()}
+        return [{name: lists[name][i] if masks[name][i] else None for name in names}
+                for i in range(len(self))]
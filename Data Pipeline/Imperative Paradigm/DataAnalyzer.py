@@ -1,27 +1,46 @@
 
 import statistics
-from scipy.stats import linregress
+from itertools import islice
+import numpy as np
+from ColumnarTable import ColumnarTable
+from RunningStats import RunningStats
+from StageProfiler import StageProfiler
 
 class DataAnalyzer :
     def __init__(self):
         pass
   
 
-    def summary(self, data, col):
-        values = [row.get(col) for row in data ]
-        clean = [v for v in values if v is not None]
-        if not clean:
+    @StageProfiler.stage
+    def summary(self, data, col, error=0.001, chunk_size=65536):
+        # One pass over the present values, a chunk at a time, into RunningStats; the median comes from its
+        # sketch (exact with error=0, and until the sketch first compacts)
+        stats = RunningStats(error)
+        if isinstance(data, ColumnarTable):
+            values, mask = data.numeric_column(col)
+            clean = values[mask]
+            for start in range(0, len(clean), chunk_size):
+                stats.update(clean[start:start + chunk_size])
+        else:
+            rows = iter(data)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                stats.update([value for value in (row.get(col) for row in chunk) if value is not None])
+        if stats.count == 0:
             return None
 
         return {
-            "count": len(clean),
-            "mean": statistics.mean(clean),
-            "median": statistics.median(clean),
-            "variance": statistics.variance(clean) if len(clean) > 1 else 0,
-            "min": min(clean),
-            "max": max(clean)
+            "count": stats.count,
+            "mean": stats.mean,
+            "median": stats.median(),
+            "variance": stats.variance(),
+            "min": stats.min,
+            "max": stats.max
         }
 
+    @StageProfiler.stage
     def correlation(self, data, col1, col2):
         x_values = [row.get(col1) for row in data]
         y_values = [row.get(col2) for row in data]
@@ -35,14 +54,110 @@ class DataAnalyzer :
         xs, ys = zip(*clean_pairs)
         return statistics.correlation(xs, ys)
 
-    def correlation_matrix(self, data, columns):
-        matrix = {}
-        for col1 in columns:
-            matrix[col1] = {}
-            for col2 in columns:
-                matrix[col1][col2] = self.correlation(data, col1, col2)
+    @StageProfiler.stage
+    def correlation_matrix(self, data, columns, method="pearson", chunk_size=65536):
+        # Every pair over its pairwise-complete rows, as correlation() does, from one pass over the data.
+        # None where a pair has fewer than 2 rows or a constant column
+        if method not in ("pearson", "spearman"):
+            raise ValueError("Unsupported correlation method. Use pearson or spearman.")
+        columns = list(columns)
+        if not columns:
+            return {}
+        if method == "spearman":
+            upper_i, upper_j, r = self.spearman_upper(data, columns)
+        else:
+            upper_i, upper_j, r = self.pearson_upper(self.column_blocks(data, columns, chunk_size), len(columns))
+
+        matrix = {col: {} for col in columns}
+        for i, j, value in zip(upper_i.tolist(), upper_j.tolist(), r.tolist()):
+            value = None if np.isnan(value) else value
+            matrix[columns[i]][columns[j]] = value
+            matrix[columns[j]][columns[i]] = value
         return matrix
 
+    def column_blocks(self, data, columns, chunk_size=65536):
+        # (values, mask) per block of rows, both shaped (rows, columns); the columns are read once
+        if isinstance(data, ColumnarTable):
+            extracted = [data.numeric_column(col) for col in columns]
+            for start in range(0, len(data), chunk_size):
+                values = np.column_stack([v[start:start + chunk_size] for v, _ in extracted])
+                mask = np.column_stack([m[start:start + chunk_size] for _, m in extracted])
+                yield values, mask
+            return
+
+        rows = iter(data)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            # None becomes NaN
+            values = np.array([[row.get(col) for col in columns] for row in chunk], dtype=float)
+            yield values, ~np.isnan(values)
+
+    def pearson_upper(self, blocks, k):
+        # Pairwise-complete sums accumulated with BLAS: symmetric products (rank-k updates) fill only the
+        # upper triangle. Values are shifted by a value of their column first, so the sums stay small.
+        # scipy is imported here rather than with the module, so runs that never correlate skip its import time
+        from scipy.linalg import blas
+        count = np.zeros((k, k), order='F')
+        sxy = np.zeros((k, k), order='F')
+        sx = np.zeros((k, k))
+        sxx = np.zeros((k, k))
+        shift = None
+        for values, mask in blocks:
+            if shift is None:
+                first = np.argmax(mask, axis=0)
+                shift = np.where(mask.any(axis=0), values[first, np.arange(k)], 0.0)
+            centered = np.where(mask, values - shift, 0.0)
+            sxy = blas.dsyrk(1.0, centered, beta=1.0, c=sxy, trans=1, overwrite_c=1)
+            if mask.all():
+                # No missing values: the per-pair sums are plain column sums
+                count += len(values)
+                sx += centered.sum(axis=0)[:, None]
+                sxx += (centered * centered).sum(axis=0)[:, None]
+            else:
+                weights = mask.astype(float)
+                count = blas.dsyrk(1.0, weights, beta=1.0, c=count, trans=1, overwrite_c=1)
+                sx += centered.T @ weights
+                sxx += (centered * centered).T @ weights
+
+        upper_i, upper_j = np.triu_indices(k)
+        n = count[upper_i, upper_j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # sx[i, j]: sum of column i over the rows where j is present
+            cov = sxy[upper_i, upper_j] - sx[upper_i, upper_j] * sx[upper_j, upper_i] / n
+            var_i = sxx[upper_i, upper_j] - sx[upper_i, upper_j] ** 2 / n
+            var_j = sxx[upper_j, upper_i] - sx[upper_j, upper_i] ** 2 / n
+            r = np.clip(cov / np.sqrt(var_i * var_j), -1.0, 1.0)
+        constant = (var_i <= 1e-12 * sxx[upper_i, upper_j]) | (var_j <= 1e-12 * sxx[upper_j, upper_i])
+        r[(n < 2) | constant] = np.nan
+        return upper_i, upper_j, r
+
+    def spearman_upper(self, data, columns):
+        # Pearson over ranks (ties get their average rank). Columns with the same missing-value pattern
+        # are ranked once; pairs whose patterns differ are re-ranked over their common rows
+        from scipy.stats import rankdata
+        k = len(columns)
+        blocks = list(self.column_blocks(data, columns))
+        values = np.concatenate([v for v, _ in blocks]) if blocks else np.empty((0, k))
+        mask = np.concatenate([m for _, m in blocks]) if blocks else np.empty((0, k), dtype=bool)
+
+        ranks = np.zeros_like(values)
+        for j in range(k):
+            ranks[mask[:, j], j] = rankdata(values[mask[:, j], j])
+        upper_i, upper_j, r = self.pearson_upper([(ranks, mask)], k)
+
+        patterns = {}
+        pattern_of = [patterns.setdefault(mask[:, j].tobytes(), len(patterns)) for j in range(k)]
+        for index, (i, j) in enumerate(zip(upper_i.tolist(), upper_j.tolist())):
+            if pattern_of[i] == pattern_of[j]:
+                continue
+            both = mask[:, i] & mask[:, j]
+            pair = np.column_stack([rankdata(values[both, i]), rankdata(values[both, j])])
+            r[index] = self.pearson_upper([(pair, np.ones_like(pair, dtype=bool))], 2)[2][1]
+        return upper_i, upper_j, r
+
+    @StageProfiler.stage
     def trend(self, data, x_col, y_col):
         x_values = [row.get(x_col) for row in data]
         y_values = [row.get(y_col) for row in data]
@@ -53,6 +168,7 @@ class DataAnalyzer :
         if len(clean_pairs) < 2:
             return None
 
+        from scipy.stats import linregress
         xs, ys = zip(*clean_pairs)
         model = linregress(xs, ys)
 
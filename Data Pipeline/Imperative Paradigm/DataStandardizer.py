@@ -1,6 +1,13 @@
-from datetime import datetime
+import numpy as np
+from ColumnarTable import ColumnarTable
+from DateNormalizer import DateNormalizer
+from StageProfiler import StageProfiler
 
 class DataStandardizer :
+    # x * 100 needs up to 58 significant bits (53 of x, 5 of 25 = 100 / 4): exact in long double only where it is
+    # wider than float64 (x87 extended, quad), not where it is float64 itself (e.g. MSVC, Apple arm64)
+    EXACT_SCALING = np.finfo(np.longdouble).nmant >= 57
+
     def __init__(self):
         # Allowed date formats to try
         self.date_formats = [
@@ -9,8 +16,21 @@ class DataStandardizer :
             '%m/%d/%Y',
             '%Y/%m/%d'
         ]
+        self.date_cache_size = 65536
+        # Picked format and cache hit rate of the last run per date column
+        self.date_reports = {}
 
+    @StageProfiler.stage
     def standardize_numeric_column(self, data, column):
+        if isinstance(data, ColumnarTable):
+            values, mask = data.numeric_column(column)
+            if self.EXACT_SCALING:
+                # Rounding the exact x * 100 rounds like round(x, 2)
+                scaled = np.round(values.astype(np.longdouble) * 100).astype(np.float64)
+                return data.with_column(column, scaled / 100, mask)
+            rounded = np.array([round(value, 2) for value in values.tolist()], dtype=np.float64)
+            return data.with_column(column, rounded, mask)
+
         for row in data:
             try:
                 row[column] = round(float(row[column]), 2)
@@ -18,32 +38,34 @@ class DataStandardizer :
                 row[column] = None
         return data
 
+    @StageProfiler.stage
     def standardize_categorical_column(self, data, column):
+        if isinstance(data, ColumnarTable):
+            # Every cell becomes a string, as in the row path: missing cells keep their text ('None', 'NA', '' or
+            # 'Unknown', see ColumnarTable.from_columns)
+            values = data.columns[column].astype(str)
+            return data.with_column(column, np.char.strip(values), np.ones(len(values), dtype=bool))
+
         for row in data:
             val = row.get(column, "Unknown")
             row[column] = str(val).strip()
         return data
 
+    @StageProfiler.stage
     def standardize_date_column(self, data, column):
-        for row in data:
-            raw = row.get(column)
-
-            if not raw:
-                row[column] = None
-                continue
-
-            parsed_successfully = False
+        normalizer = DateNormalizer(self.date_formats, self.date_cache_size)
 
-            for fmt in self.date_formats:
-                try:
-                    parsed = datetime.strptime(raw, fmt)
-                    row[column] = parsed.strftime('%Y-%m-%d')
-                    parsed_successfully = True
-                    break
-                except ValueError:
-                    continue
+        if isinstance(data, ColumnarTable):
+            raw = np.where(data.masks[column], data.columns[column].astype(str), '')
+            normalizer.detect_format(raw[:normalizer.sample_size].tolist())
+            iso, _, valid = normalizer.normalize_column(raw)
+            self.date_reports[column] = normalizer.report()
+            return data.with_column(column, iso, valid)
 
-            if not parsed_successfully:
-                row[column] = None
+        normalizer.detect_format(row.get(column) for row in data)
+        for row in data:
+            parsed = normalizer.parse(row.get(column))
+            row[column] = parsed[0] if parsed else None
 
-        return data
\ No newline at end of file
+        self.date_reports[column] = normalizer.report()
+        return data
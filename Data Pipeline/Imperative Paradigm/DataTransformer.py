@@ -1,12 +1,23 @@
 from itertools import groupby
 from operator import itemgetter
+import numpy as np
+from ColumnarTable import ColumnarTable
+from GroupBy import GroupBy
+from StageProfiler import StageProfiler
 
 class DataTransformer:
     def __init__(self):
         pass
 
 
+    @StageProfiler.stage
     def filter_rows(self, data, col, threshold):
+        if isinstance(data, ColumnarTable):
+            values, mask = data.numeric_column(col)
+            keep = mask.copy()
+            keep[mask] = values[mask] > threshold
+            return data.take(keep)
+
         filtered = []
         for row in data:
             val = row.get(col)
@@ -15,7 +26,21 @@ class DataTransformer:
         return filtered
 
 
-    def aggregate(self, data, group_col, value_col):
+    @StageProfiler.stage
+    def aggregate(self, data, group_col, value_col, aggregates=None):
+        # Total of value_col per group_col, in order of first appearance. group_col may also be several keys
+        # ("region,date:month" or a list) and aggregates a list of GroupBy specs ("sum", "mean", "p90",
+        # "distinct:customer", ...); several aggregates give {key: {aggregate: value}}
+        if aggregates is not None or not self.is_plain_column(group_col):
+            return GroupBy(group_col, aggregates or ["sum"], value_col).update(self.rows_of(data)).results(sort=False)
+
+        if isinstance(data, ColumnarTable):
+            # Group-by sum over factorized keys
+            values, mask = data.numeric_column(value_col)
+            codes, keys = data.factorize(group_col, mask)
+            sums = np.bincount(codes, weights=values[mask], minlength=len(keys))
+            return dict(zip(keys.tolist(), sums.tolist()))
+
         aggregates = {}
         for row in data:
             key = row.get(group_col, "Unknown")
@@ -24,3 +49,24 @@ class DataTransformer:
                 continue
             aggregates[key] = aggregates.get(key, 0) + val
         return aggregates
+
+    @StageProfiler.stage
+    def aggregate_many(self, data, value_col, group_cols, aggregates=None):
+        # aggregate() for each of group_cols, computed in one scan of the rows; {group_col: result}
+        groupings = [GroupBy(group_col, aggregates or ["sum"], value_col) for group_col in group_cols]
+        GroupBy.feed(groupings, self.rows_of(data))
+        return {self.label(group_col): grouping.results(sort=False)
+                for group_col, grouping in zip(group_cols, groupings)}
+
+    @staticmethod
+    def is_plain_column(group_col):
+        return isinstance(group_col, str) and ',' not in group_col and ':' not in group_col
+
+    @staticmethod
+    def label(group_col):
+        return group_col if isinstance(group_col, str) else ",".join(group_col)
+
+    @staticmethod
+    def rows_of(data):
+        # Composite keys and the richer aggregates run on rows; tables are converted
+        return data.to_rows() if isinstance(data, ColumnarTable) else data
@@ -1,5 +1,12 @@
+from ColumnarTable import ColumnarTable
+from StageProfiler import StageProfiler
+
 class DataValidator:
     def __init__(self):
         pass
+    @StageProfiler.stage
     def remove_none_keys(self, data):
+        if isinstance(data, ColumnarTable):
+            # Column names never include None
+            return data
         return [{k: v for k, v in row.items() if k is not None} for row in data]
@@ -1,12 +1,41 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
+from ChartRenderer import ChartRenderer
+from StageProfiler import StageProfiler
 
 class DataVisualizer:
-    def __init__(self , transformer, analyzer):
-        sns.set(style="whitegrid") 
+    # matplotlib and seaborn are imported when the first chart is drawn, not with this module, so runs that
+    # never plot do not pay for them
+    def __init__(self , transformer, analyzer, headless=False, max_points=1000):
+        # headless: figures are plain Figure objects (no pyplot state or display), to be saved rather than shown
+        self.headless = headless
+        self.styled = False
         self.transformer = transformer
         self.analyzer = analyzer
+        self.max_points = max_points
 
+    @staticmethod
+    def style():
+        # Style of the charts; applied globally for interactive use, per chart when saving headless
+        import seaborn as sns
+        return {**sns.axes_style("whitegrid"), **sns.plotting_context("notebook")}
+
+    @staticmethod
+    def figure_class(new_figure):
+        if new_figure is not None:
+            return new_figure
+        from matplotlib.figure import Figure
+        return Figure
+
+    def new_figure(self):
+        if self.headless:
+            return self.figure_class(None)
+        import matplotlib.pyplot as plt
+        if not self.styled:
+            import seaborn as sns
+            sns.set(style="whitegrid")
+            self.styled = True
+        return plt.figure
+
+    @StageProfiler.stage
     def bar_chart(self, data, value_col, category_col):
         aggregates = self.transformer.aggregate(data, category_col, value_col)
 
@@ -14,15 +43,29 @@ class DataVisualizer:
             print("No data to plot.")
             return None
 
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.bar(aggregates.keys(), aggregates.values(), color='skyblue')
+        return self.bar_figure(list(aggregates.keys()), list(aggregates.values()), value_col, category_col,
+                               self.new_figure())
+
+    @staticmethod
+    def bar_figure(keys, values, value_col, category_col, new_figure=None):
+        fig = DataVisualizer.figure_class(new_figure)(figsize=(10, 6))
+        ax = fig.subplots()
+        ax.bar(keys, values, color='skyblue')
         ax.set_xlabel(category_col.capitalize())
         ax.set_ylabel(f"Total {value_col.capitalize()}")
         ax.set_title(f"Total {value_col.capitalize()} by {category_col.capitalize()}")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
         return fig
 
+    def line_points(self, aggregated):
+        # Prepare x and y lists, downsampled (LTTB) to at most max_points
+        xs = list(aggregated.keys())
+        ys = list(aggregated.values())
+        kept = ChartRenderer.lttb_indices(ys, self.max_points)
+        return [xs[i] for i in kept], [ys[i] for i in kept]
+
+    @StageProfiler.stage
     def line_chart(self, data, group_col, value_col):
         aggregated = self.transformer.aggregate(data, group_col, value_col)
 
@@ -30,32 +73,68 @@ class DataVisualizer:
             print("No data to plot after aggregation.")
             return None
 
-        # Prepare x and y lists
-        xs = list(aggregated.keys())
-        ys = list(aggregated.values())
+        xs, ys = self.line_points(aggregated)
+        return self.line_figure(xs, ys, group_col, value_col, self.new_figure())
 
-        fig, ax = plt.subplots(figsize=(10, 6))
+    @staticmethod
+    def line_figure(xs, ys, group_col, value_col, new_figure=None):
+        fig = DataVisualizer.figure_class(new_figure)(figsize=(10, 6))
+        ax = fig.subplots()
         ax.plot(xs, ys, marker='o', linestyle='-', color='orange')
         ax.set_xlabel(group_col.capitalize())
         ax.set_ylabel(value_col.capitalize())
         ax.set_title(f"{value_col.capitalize()} by {group_col.capitalize()}")
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        ax.tick_params(axis='x', labelrotation=45)
+        if len(xs) > 50:
+            # One label per point would overlap and dominates the drawing time
+            from matplotlib.ticker import MaxNLocator
+            ax.xaxis.set_major_locator(MaxNLocator(20))
+        fig.tight_layout()
         return fig
-        
-    def correlation_heatmap(self, data, numeric_cols):
-        
-        matrix = self.analyzer.correlation_matrix(data, numeric_cols)
 
-        if not matrix:
+    @StageProfiler.stage
+    def correlation_heatmap(self, data, numeric_cols, method="pearson"):
+
+        corr_values = self.correlation_values(data, numeric_cols, method)
+
+        if corr_values is None:
             print("No data to plot correlation.")
             return None
 
+        return self.heatmap_figure(corr_values, numeric_cols, self.new_figure())
+
+    def correlation_values(self, data, numeric_cols, method):
+        matrix = self.analyzer.correlation_matrix(data, numeric_cols, method)
+        if not matrix:
+            return None
         # Convert matrix to 2D list for seaborn
-        corr_values = [[matrix[r][c] if matrix[r][c] is not None else 0 for c in numeric_cols] for r in numeric_cols]
+        return [[matrix[r][c] if matrix[r][c] is not None else 0 for c in numeric_cols] for r in numeric_cols]
 
-        fig, ax = plt.subplots(figsize=(8,6))
-        sns.heatmap(corr_values, annot=True, fmt=".2f", xticklabels=numeric_cols, yticklabels=numeric_cols, cmap="coolwarm", cbar=True)
+    @staticmethod
+    def heatmap_figure(corr_values, numeric_cols, new_figure=None):
+        fig = DataVisualizer.figure_class(new_figure)(figsize=(8,6))
+        ax = fig.subplots()
+        import seaborn as sns
+        sns.heatmap(corr_values, annot=True, fmt=".2f", xticklabels=numeric_cols, yticklabels=numeric_cols,
+                    cmap="coolwarm", cbar=True, ax=ax)
         ax.set_title("Correlation Heatmap")
-        plt.tight_layout()
+        fig.tight_layout()
         return fig
+
+    @StageProfiler.stage
+    def save_charts(self, data, value_col, category_col, numeric_cols, renderer, method="pearson"):
+        # The three charts above, saved concurrently by renderer (a ChartRenderer). Only the aggregated
+        # chart data is sent to the workers. Returns (saved paths, paths skipped as unchanged)
+        jobs = []
+        aggregates = self.transformer.aggregate(data, category_col, value_col)
+        if aggregates:
+            jobs.append(("bar_chart", self.bar_figure,
+                         (list(aggregates.keys()), list(aggregates.values()), value_col, category_col)))
+            xs, ys = self.line_points(aggregates)
+            jobs.append(("line_chart", self.line_figure, (xs, ys, category_col, value_col)))
+        else:
+            print("No data to plot.")
+        corr_values = self.correlation_values(data, numeric_cols, method)
+        if corr_values is not None:
+            jobs.append(("correlation_heatmap", self.heatmap_figure, (corr_values, list(numeric_cols))))
+        return renderer.render(jobs, self.style())
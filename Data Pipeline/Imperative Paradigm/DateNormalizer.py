@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+
+class DateNormalizer:
+    # Detects a column's date format from a sample and memoizes raw strings in a bounded LRU cache
+    def __init__(self, formats, cache_size=65536, sample_size=1000):
+        self.formats = list(formats)
+        self.format = self.formats[0]
+        self.cache_size = cache_size
+        self.sample_size = sample_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def matches(value, fmt):
+        try:
+            datetime.strptime(value, fmt)
+            return True
+        except (ValueError, TypeError):
+            return False
+
+    def detect_format(self, values):
+        sample = []
+        for value in values:
+            if value:
+                sample.append(value)
+                if len(sample) >= self.sample_size:
+                    break
+
+        # Earlier formats win ties
+        counts = [sum(1 for value in sample if self.matches(value, fmt)) for fmt in self.formats]
+        self.format = self.formats[counts.index(max(counts))]
+        self.cache.clear()
+        return self.format
+
+    def parse(self, raw):
+        # (YYYY-MM-DD, ordinal) or None; detected format first, then the remaining ones in order
+        if not raw:
+            return None
+        if raw in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(raw)
+            return self.cache[raw]
+
+        self.misses += 1
+        result = None
+        for fmt in [self.format] + [f for f in self.formats if f != self.format]:
+            try:
+                parsed = datetime.strptime(raw, fmt)
+                result = (parsed.strftime('%Y-%m-%d'), parsed.toordinal())
+                break
+            except ValueError:
+                continue
+
+        self.cache[raw] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def normalize_column(self, values):
+        # Vectorized path: parse each distinct string once and scatter back with the inverse index
+        uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+        parsed = [self.parse(value) for value in uniques.tolist()]
+        self.hits += len(values) - len(uniques)
+
+        iso = np.array([p[0] if p else '' for p in parsed], dtype='<U10')
+        ordinals = np.array([p[1] if p else 0 for p in parsed], dtype=np.int64)
+        valid = np.array([p is not None for p in parsed], dtype=bool)
+        return iso[inverse], ordinals[inverse], valid[inverse]
+
+    def report(self):
+        lookups = self.hits + self.misses
+        return {
+            "format": self.format,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
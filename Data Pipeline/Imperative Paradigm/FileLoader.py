@@ -1,35 +1,396 @@
 import csv
+import glob
+import gzip
+import hashlib
+import io
 import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from ColumnarTable import ColumnarTable
+from OutputSink import OutputSink
+from StageProfiler import StageProfiler
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 class FileLoader : 
-    def __init__(self,input_path, output_path):
+    # The input is a file, or a directory (its .csv/.json/.ndjson/.jsonl files, optionally .gz/.zst) or glob pattern
+    # naming several files, which are read as one input:
+    #
+    #   loader = FileLoader("data/stores/*.csv.gz", "out/processed.csv", threads=8, manifest="out/read.json")
+    #   rows = loader.load()           # new files only, read 8 at a time
+    #   loader.progress                # {path: {"rows": 1200, "bytes": 48213, "seconds": 0.04}}
+    #   loader.mark_processed()        # once the run succeeded: skip these files next time
+    INPUT_EXTENSIONS = ('.csv', '.json', '.ndjson', '.jsonl')
+
+    def __init__(self,input_path, output_path, cache=None, threads=4, manifest=None, report=None):
         self.input_path = input_path
         self.output_path = output_path
+        # Optional TableCache for load_table
+        self.cache = cache
         self.ext = self.input_path.lower().split('.')[-1]
+        # Files of a directory or glob input (None for a single file), read by `threads` threads
+        pattern = glob.escape(input_path) != input_path and not os.path.isfile(input_path)
+        self.files = self.expand(input_path) if pattern or os.path.isdir(input_path) else None
+        self.threads = threads
+        # JSON file of the fingerprints of files processed earlier, which are skipped (see mark_processed)
+        self.manifest = manifest
+        # path -> {"rows", "bytes", "seconds"} of each file read; report(path, entry) is called (from the reading
+        # thread) as each file is read
+        self.progress = {}
+        self.report = report
+        self.fingerprints = {}
 
-    def load(self):
-        
-        if self.ext == 'csv':
-            with open(self.input_path, 'r') as file:
-                reader = csv.DictReader(file)
-                return list(reader)
-        elif self.ext == 'json':
-            with open(self.input_path, 'r') as file:
-                data = json.load(file)
-                return list(data)
+    @classmethod
+    def expand(cls, pattern):
+        # Files of a directory or glob pattern (** spans directories), sorted by path
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+            files = [path for path in paths if cls.is_input_file(path)]
         else:
-            raise ValueError("Unsupported file format. Use CSV or JSON.")
-        
-    def save(self, data):
-        if self.ext == 'csv':
-            with open(self.output_path, 'w', newline='') as file:
-                if len(data) == 0:
+            files = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        if not files:
+            raise ValueError(f"No input files match {pattern!r}.")
+        return sorted(files)
+
+    @classmethod
+    def is_input_file(cls, path):
+        name = path.lower()
+        for suffix in ('.gz', '.zst'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        return os.path.isfile(path) and name.endswith(cls.INPUT_EXTENSIONS)
+
+    def compression(self):
+        # From the magic bytes: 'gzip', 'zstd' or None
+        with open(self.input_path, 'rb') as file:
+            head = file.read(4)
+        if head.startswith(b'\x1f\x8b'):
+            return 'gzip'
+        if head.startswith(b'\x28\xb5\x2f\xfd'):
+            return 'zstd'
+        return None
+
+    def open_input(self, newline=None):
+        compression = self.compression()
+        if compression == 'gzip':
+            return gzip.open(self.input_path, 'rt', encoding='utf-8', newline=newline)
+        if compression == 'zstd':
+            if zstandard is None:
+                raise ValueError("Reading zstd-compressed input requires the zstandard package.")
+            raw = zstandard.ZstdDecompressor().stream_reader(open(self.input_path, 'rb'), closefd=True)
+            return io.TextIOWrapper(raw, encoding='utf-8', newline=newline)
+        return open(self.input_path, 'r', encoding='utf-8', newline=newline)
+
+    def detect_format(self):
+        # 'csv', 'json' (top-level array) or 'ndjson' from the first non-blank character;
+        # the extension only decides for empty files
+        with self.open_input() as file:
+            head = file.read(4096).lstrip('\ufeff \t\r\n')
+        if not head:
+            ext = self.ext
+            if ext in ('gz', 'zst'):
+                ext = self.input_path.lower().split('.')[-2]
+            if ext not in ('csv', 'json', 'ndjson', 'jsonl'):
+                raise ValueError("Unsupported file format. Use CSV, JSON or NDJSON.")
+            return 'ndjson' if ext == 'jsonl' else ext
+        if head[0] == '[':
+            return 'json'
+        if head[0] == '{':
+            return 'ndjson'
+        return 'csv'
+
+    @staticmethod
+    def iter_json_array(handle, block_size=1 << 16):
+        # Elements of a top-level JSON array, one at a time, without reading the whole text
+        decoder = json.JSONDecoder()
+        buffer = handle.read(block_size).lstrip('\ufeff \t\r\n')
+        if not buffer.startswith('['):
+            raise ValueError("Expected a JSON array of records.")
+        pos = 1
+        eof = False
+        while True:
+            # Whitespace and the separating comma; read on when the buffer runs out
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                block = handle.read(block_size)
+                buffer, pos, eof = buffer[pos:] + block, 0, not block
+            if pos >= len(buffer):
+                raise ValueError("Unterminated JSON array.")
+            if buffer[pos] == ']':
+                return
+
+            while True:
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                    # A number cut by the block boundary decodes as a shorter one
+                    if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,]'):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                block = handle.read(block_size)
+                buffer, pos, eof = buffer[pos:] + block, 0, not block
+            yield record
+            pos = end
+
+    # Values the imputation stages treat as missing (MissingDataHandler's default); the loader never rejects a row
+    # on them
+    MISSING = (None, '', 'NA', 'N/A')
+
+    def iter_records(self, columns=None, where=None, observe=None):
+        # Rows one at a time from CSV, JSON arrays or NDJSON, optionally gzip/zstd-compressed.
+        # columns: projection, other columns are never materialized. where: {column: test(raw value)}, rows
+        # failing a test are dropped as they are parsed. observe(row) sees every row before the tests.
+        #
+        # Pushing a filter down here must not change the imputation: fill values (mean/median/mode) are still
+        # computed over the unfiltered rows, by passing MissingDataHandler.fill_accumulator's add as observe and
+        # imputing with MissingDataHandler.fill. Rows whose tested cell is missing are kept, since the test can only
+        # be decided after imputation; the later filter stage still runs and stays the authority
+        rows = self.iter_raw(columns)
+        if observe is None and not where:
+            yield from rows
+            return
+        tests = list((where or {}).items())
+        missing = self.MISSING
+        for row in rows:
+            if observe is not None:
+                observe(row)
+            for column, test in tests:
+                value = row.get(column)
+                if value not in missing and not test(value):
+                    break
+            else:
+                yield row
+
+    def iter_raw(self, columns=None):
+        if self.files is not None:
+            yield from self.iter_files(columns)
+            return
+        fmt = self.detect_format()
+        with self.open_input() as file:
+            if fmt == 'csv':
+                if columns is None:
+                    yield from csv.DictReader(file)
                     return
-                writer = csv.DictWriter(file, fieldnames=list(data[0].keys()))
-                writer.writeheader()
-                writer.writerows(data)
-        elif self.ext == 'json':
-            with open(self.output_path, 'w') as file:
-                json.dump(data, file, indent=4)
-        else:
-            raise ValueError("Unsupported file format. Use CSV or JSON.")
\ No newline at end of file
+                # Only the wanted fields of each line become dict entries (in file order)
+                reader = csv.reader(file)
+                wanted = set(columns)
+                picks = [(name, i) for i, name in enumerate(next(reader, [])) if name in wanted]
+                for fields in reader:
+                    if fields:
+                        yield {name: fields[i] if i < len(fields) else None for name, i in picks}
+                return
+            records = self.iter_json_array(file) if fmt == 'json' else \
+                (json.loads(line) for line in file if line.strip())
+            if columns is None:
+                yield from records
+            else:
+                wanted = set(columns)
+                for record in records:
+                    yield {key: value for key, value in record.items() if key in wanted}
+
+    # -- Several input files --
+
+    def header(self):
+        # Columns of a CSV file's header (None for JSON)
+        if self.detect_format() != 'csv':
+            return None
+        with self.open_input(newline='') as file:
+            return next(csv.reader([file.readline()]), [])
+
+    def pending_files(self):
+        # Files not processed in an earlier run. A file whose content was processed before (under any path) is
+        # skipped; files are taken as complete once they are listed, so one that changed since is an error
+        if self.manifest is None:
+            return list(self.files)
+        processed = {}
+        if os.path.exists(self.manifest):
+            with open(self.manifest) as file:
+                processed = json.load(file)
+        seen = {content for _, _, content in processed.values()}
+        pending = []
+        for path in self.files:
+            key = os.path.abspath(path)
+            stat = os.stat(path)
+            saved = processed.get(key)
+            if saved is not None and saved[:2] == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            content = self.content_digest(path)
+            if saved is not None and saved[2] != content:
+                raise ValueError(f"{path} changed since it was processed; remove it from {self.manifest} "
+                                 f"to rebuild.")
+            self.fingerprints[key] = [stat.st_size, stat.st_mtime_ns, content]
+            if content not in seen:
+                seen.add(content)
+                pending.append(path)
+        return pending
+
+    @staticmethod
+    def content_digest(path):
+        content = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content.update(block)
+        return content.hexdigest()
+
+    def mark_processed(self):
+        # Add the files listed by the last read to the manifest (written atomically)
+        if self.manifest is None:
+            return
+        processed = {}
+        if os.path.exists(self.manifest):
+            with open(self.manifest) as file:
+                processed = json.load(file)
+        processed.update(self.fingerprints)
+        with open(self.manifest + '.tmp', 'w') as file:
+            json.dump(processed, file)
+        os.replace(self.manifest + '.tmp', self.manifest)
+
+    def iter_files(self, columns=None):
+        # Rows of the pending files in path order. The next `threads` files are read (and decompressed) by a
+        # thread pool while the rows of the current one are consumed. CSV rows all take the columns of every
+        # header, in the order first seen, with None where a file lacks a column
+        loaders = [FileLoader(path, None) for path in self.pending_files()]
+        headers = [loader.header() for loader in loaders]
+        layout = {}
+        for header in headers:
+            layout.update(dict.fromkeys(header or []))
+        names = [name for name in layout if columns is None or name in columns]
+        remaining = zip(loaders, headers)
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='input') as pool:
+            pending = deque(pool.submit(self.read_file, loader, header, columns, names)
+                            for loader, header in islice(remaining, self.threads))
+            try:
+                while pending:
+                    rows = pending.popleft().result()
+                    for loader, header in islice(remaining, 1):
+                        pending.append(pool.submit(self.read_file, loader, header, columns, names))
+                    yield from rows
+            finally:
+                # A reader stopping early leaves the queued files unread
+                for future in pending:
+                    future.cancel()
+
+    def read_file(self, loader, header, columns, layout):
+        # One file's rows, in the layout when its header has another column order (or lacks columns)
+        start = time.perf_counter()
+        rows = list(loader.iter_raw(columns))
+        if header is not None and [name for name in header if name in layout] != layout:
+            rows = [{name: row.get(name) for name in layout} for row in rows]
+        entry = {"rows": len(rows), "bytes": os.path.getsize(loader.input_path),
+                 "seconds": time.perf_counter() - start}
+        self.progress[loader.input_path] = entry
+        if self.report is not None:
+            self.report(loader.input_path, entry)
+        return rows
+
+    # -- Tests for where=; each rejects only rows the matching later stage would drop --
+
+    @staticmethod
+    def greater_than(threshold):
+        # DataTransformer.filter_rows(col, threshold) after DataStandardizer.standardize_numeric_column (which
+        # rounds to 2 decimals, and turns unparseable cells into None, which filter_rows drops)
+        def test(value):
+            try:
+                return round(float(value), 2) > threshold
+            except (ValueError, TypeError):
+                return False
+        return test
+
+    @staticmethod
+    def one_of(values):
+        # Categorical cells as DataStandardizer.standardize_categorical_column leaves them
+        values = set(values)
+        return lambda value: str(value).strip() in values
+
+    @staticmethod
+    def date_between(start, end, formats):
+        # Inclusive YYYY-MM-DD bounds. The date format is only detected later, so a cell is kept when any of the
+        # formats reads it as a day in the range
+        def test(value):
+            for fmt in formats:
+                try:
+                    day = datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+                except ValueError:
+                    continue
+                if start <= day <= end:
+                    return True
+            return False
+        return test
+
+    @StageProfiler.stage
+    def load(self, columns=None, where=None, observe=None):
+        return list(self.iter_records(columns, where, observe))
+
+
+    @StageProfiler.stage
+    def load_table(self, prepare=None, settings=None, columns=None):
+        # prepare(table) -> table runs after parsing (e.g. standardization); with a cache its result is
+        # stored under the file's fingerprint plus settings, and unchanged inputs skip both steps.
+        # columns: projection, as for load()
+        key = None
+        if self.cache is not None:
+            if columns is not None:
+                settings = {"settings": settings, "columns": sorted(columns)}
+            key = self.cache.key(self.input_path if self.files is None else self.pending_files(), settings)
+            table = self.cache.load(key)
+            if table is not None:
+                return table
+
+        table = self.parse_table(columns)
+        if prepare is not None:
+            table = prepare(table)
+        if key is not None:
+            self.cache.store(key, table)
+        return table
+
+    def parse_table(self, columns=None):
+        # Columnar load: cells go straight into per-column lists instead of one dict per row
+        if self.files is None and self.detect_format() == 'csv':
+            with self.open_input(newline='') as file:
+                reader = csv.reader(file)
+                header = next(reader, [])
+                if columns is None:
+                    raw = {name: [] for name in header}
+                    appenders = [raw[name].append for name in header]
+                    for record in reader:
+                        # Blank lines are no records, as csv.DictReader (load) skips them
+                        if not record:
+                            continue
+                        if len(record) < len(header):
+                            record += [None] * (len(header) - len(record))
+                        for append, value in zip(appenders, record):
+                            append(value)
+                else:
+                    wanted = set(columns)
+                    raw = {name: [] for name in header if name in wanted}
+                    picks = [(raw[name].append, i) for i, name in enumerate(header) if name in wanted]
+                    for record in reader:
+                        if not record:
+                            continue
+                        for append, i in picks:
+                            append(record[i] if i < len(record) else None)
+            return ColumnarTable.from_columns(raw)
+        # JSON records are added to the columns as they are parsed
+        return ColumnarTable.from_rows(self.iter_records(columns))
+
+    def sink(self, fmt=None, compression=None, fieldnames=None, append=False):
+        # OutputSink on the output path, for writing chunks while the pipeline runs; the format and compression
+        # come from the output path unless given
+        return OutputSink(self.output_path, fmt, compression, fieldnames, append)
+
+    @StageProfiler.stage
+    def save(self, data, fmt=None, compression=None):
+        # Rows or a ColumnarTable, written by a sink's thread (tables in slices, or column-wise to npz)
+        with self.sink(fmt, compression) as sink:
+            sink.write(data)
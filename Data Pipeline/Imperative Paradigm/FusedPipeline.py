@@ -0,0 +1,296 @@
+from itertools import islice
+from DateNormalizer import DateNormalizer
+from GroupBy import GroupBy
+from MissingIndex import MissingIndex
+from StageProfiler import StageProfiler
+
+class FusedPipeline:
+    # Runs a chain of the pipeline classes' method calls with every row-local step fused into one pass over
+    # cache-sized chunks of rows. A new pass starts only where a stage needs a statistic over its whole input
+    # (imputation values, date format), and that statistic is gathered as early as the columns it reads allow.
+    #
+    #   pipeline = (FusedPipeline()
+    #               .add(validator.remove_none_keys)
+    #               .tap("missing", missing.detect_missing)
+    #               .add(missing.impute_mean, "sales")
+    #               .add(std.standardize_date_column, "date")
+    #               .tap("aggregated", transformer.aggregate, "region", "sales"))
+    #   data, outputs = pipeline.run(data)
+    #
+    # Rows are updated in place, as the class methods do. Calls the pipeline does not know how to fuse run
+    # unchanged on the whole list, between passes.
+
+    # Method (by qualified name) -> builder of its fused stage
+    BUILDERS = {
+        "DataValidator.remove_none_keys": "remove_none_keys_stage",
+        "MissingDataHandler.detect_missing": "detect_missing_stage",
+        "MissingDataHandler.build_missing_index": "detect_missing_stage",
+        "MissingDataHandler.impute": "impute_stage",
+        "MissingDataHandler.impute_mean": "impute_stage",
+        "MissingDataHandler.impute_median": "impute_stage",
+        "MissingDataHandler.impute_mode": "impute_stage",
+        "DataStandardizer.standardize_numeric_column": "numeric_stage",
+        "DataStandardizer.standardize_categorical_column": "categorical_stage",
+        "DataStandardizer.standardize_date_column": "date_stage",
+        "DataTransformer.filter_rows": "filter_stage",
+        "DataTransformer.aggregate": "aggregate_stage",
+        "DataTransformer.aggregate_many": "aggregate_many_stage",
+    }
+
+    def __init__(self, chunk_size=4096):
+        self.chunk_size = chunk_size
+        # (method, args, output name); the output name is None for steps that transform the rows
+        self.steps = []
+        # Passes over the rows made by the last run
+        self.passes = 0
+
+    def add(self, method, *args):
+        # The result of method(data, *args) becomes the rows of the following steps
+        self.steps.append((method, args, None))
+        return self
+
+    def tap(self, name, method, *args):
+        # The result of method(data, *args) is returned as outputs[name]; the rows continue unchanged
+        self.steps.append((method, args, name))
+        return self
+
+    @staticmethod
+    def stage(kind, apply=None, reads=(), writes=(), observe=None, ready=None, finish=None):
+        # apply(records) runs on one chunk. kind: 'map' (rows updated in place), 'filter' (returns the rows kept),
+        # 'tap' (rows only read) or 'opaque' (run on the whole list). observe(records)/ready(): statistic needed
+        # before apply() can run. reads/writes: column sets, None for unknown
+        return {"kind": kind, "apply": apply, "reads": None if reads is None else set(reads),
+                "writes": None if writes is None else set(writes), "observe": observe, "ready": ready,
+                "finish": finish}
+
+    def compile(self, method, args, name):
+        qualname = getattr(method, '__qualname__', None)
+        builder = self.BUILDERS.get(qualname)
+        stage = None
+        if builder is not None:
+            stage = getattr(self, builder)(method.__self__, qualname.split('.')[-1], name is not None, *args)
+        if stage is None:
+            # Unknown calls and the ones that only make sense on the whole list
+            stage = self.stage('opaque', reads=None, writes=None)
+        stage["method"] = method
+        stage["args"] = args
+        stage["name"] = name
+        return stage
+
+    # -- Fused stages; each builder returns None when the call cannot be fused --
+
+    def remove_none_keys_stage(self, owner, method_name, is_tap):
+        if is_tap:
+            return None
+
+        def apply(records):
+            for record in records:
+                record.pop(None, None)
+        return self.stage('map', apply)
+
+    def detect_missing_stage(self, owner, method_name, is_tap):
+        if not is_tap:
+            return None
+        # The index grows a chunk at a time; detect_missing reports its cells and counts at the end
+        index = MissingIndex(owner.missing_values)
+        if method_name == 'build_missing_index':
+            return self.stage('tap', index.extend, reads=None, finish=lambda: index)
+        return self.stage('tap', index.extend, reads=None, finish=lambda: (index.cells(), index.counts()))
+
+    def impute_stage(self, owner, method_name, is_tap, column_or_strategies, index=None):
+        # With an index the call runs on the whole list, where it can use it
+        if is_tap or index is not None:
+            return None
+        if method_name == 'impute':
+            strategies = column_or_strategies
+        else:
+            strategies = {column_or_strategies: method_name.split('_')[-1]}
+        add, finish = owner.fill_accumulator(strategies)
+        fill_items = []
+        missing = owner.missing_values
+
+        def observe(records):
+            for record in records:
+                add(record)
+
+        def apply(records):
+            for record in records:
+                for column, value in fill_items:
+                    if record.get(column) in missing:
+                        record[column] = value
+        return self.stage('map', apply, reads=strategies, writes=strategies, observe=observe,
+                          ready=lambda: fill_items.extend(finish().items()))
+
+    def numeric_stage(self, owner, method_name, is_tap, column):
+        if is_tap:
+            return None
+
+        def apply(records):
+            for record in records:
+                try:
+                    record[column] = round(float(record[column]), 2)
+                except (ValueError, TypeError, KeyError):
+                    record[column] = None
+        return self.stage('map', apply, reads=[column], writes=[column])
+
+    def categorical_stage(self, owner, method_name, is_tap, column):
+        if is_tap:
+            return None
+
+        def apply(records):
+            for record in records:
+                record[column] = str(record.get(column, "Unknown")).strip()
+        return self.stage('map', apply, reads=[column], writes=[column])
+
+    def date_stage(self, owner, method_name, is_tap, column):
+        if is_tap:
+            return None
+        normalizer = DateNormalizer(owner.date_formats, owner.date_cache_size)
+        # The format is detected from the first non-empty values, as standardize_date_column does
+        sample = []
+
+        def observe(records):
+            for record in records:
+                if len(sample) >= normalizer.sample_size:
+                    return
+                value = record.get(column)
+                if value:
+                    sample.append(value)
+
+        def apply(records):
+            parse = normalizer.parse
+            for record in records:
+                parsed = parse(record.get(column))
+                record[column] = parsed[0] if parsed else None
+
+        def finish():
+            owner.date_reports[column] = normalizer.report()
+        return self.stage('map', apply, reads=[column], writes=[column], observe=observe,
+                          ready=lambda: normalizer.detect_format(sample), finish=finish)
+
+    def filter_stage(self, owner, method_name, is_tap, col, threshold):
+        def keep(records):
+            return [record for record in records
+                    if record.get(col) is not None and record.get(col) > threshold]
+
+        if not is_tap:
+            return self.stage('filter', keep, reads=[col])
+        kept = []
+        return self.stage('tap', lambda records: kept.extend(keep(records)), reads=[col], finish=lambda: kept)
+
+    def aggregate_stage(self, owner, method_name, is_tap, group_col, value_col, aggregates=None):
+        if not is_tap:
+            return None
+        if aggregates is not None or not owner.is_plain_column(group_col):
+            grouping = GroupBy(group_col, aggregates or ["sum"], value_col)
+            columns = [column for column, _ in grouping.keys] + [aggregate[1] for aggregate in grouping.aggregates]
+            return self.stage('tap', grouping.update, reads=columns, finish=lambda: grouping.results(sort=False))
+        aggregates = {}
+
+        def apply(records):
+            for record in records:
+                val = record.get(value_col)
+                if val is None:
+                    continue
+                key = record.get(group_col, "Unknown")
+                aggregates[key] = aggregates.get(key, 0) + val
+        return self.stage('tap', apply, reads=[group_col, value_col], finish=lambda: aggregates)
+
+    def aggregate_many_stage(self, owner, method_name, is_tap, value_col, group_cols, aggregates=None):
+        if not is_tap:
+            return None
+        groupings = [GroupBy(group_col, aggregates or ["sum"], value_col) for group_col in group_cols]
+
+        def apply(records):
+            for grouping in groupings:
+                grouping.update(records)
+
+        def finish():
+            return {owner.label(group_col): grouping.results(sort=False)
+                    for group_col, grouping in zip(group_cols, groupings)}
+        return self.stage('tap', apply, reads=None, finish=finish)
+
+    # -- Planning and execution --
+
+    @staticmethod
+    def observe_position(stages, index):
+        # Last stage before index that changes what the statistic of stages[index] would see (-1 = the input)
+        reads = stages[index]["reads"]
+        for position in range(index - 1, -1, -1):
+            stage = stages[position]
+            if stage["kind"] in ('opaque', 'filter') or stage["writes"] is None or reads is None:
+                return position
+            if stage["writes"] & reads:
+                return position
+        return -1
+
+    @StageProfiler.stage
+    def run(self, data):
+        # data: list or any iterable of rows (e.g. FileLoader.iter_records()); returns (rows, outputs)
+        stages = [self.compile(method, args, name) for method, args, name in self.steps]
+        positions = [self.observe_position(stages, i) if stage["observe"] else None
+                     for i, stage in enumerate(stages)]
+        observed = set()
+        outputs = {}
+        rows = data
+        self.passes = 0
+        start = 0
+
+        while start < len(stages):
+            stage = stages[start]
+            if stage["kind"] == 'opaque':
+                result = stage["method"](rows if isinstance(rows, list) else list(rows), *stage["args"])
+                if stage["name"] is None:
+                    rows = result
+                else:
+                    outputs[stage["name"]] = result
+                self.passes += 1
+                start += 1
+                continue
+
+            # Apply stages up to the first one whose statistic is still missing or that cannot be fused
+            end = start
+            while end < len(stages) and stages[end]["kind"] != 'opaque' and \
+                    (stages[end]["observe"] is None or end in observed):
+                end += 1
+
+            # Statistics gathered in this pass, grouped by the stage after which they see the rows
+            pending = [i for i, position in enumerate(positions)
+                       if position is not None and i not in observed and start - 1 <= position < end]
+            observers = {}
+            for i in pending:
+                observers.setdefault(positions[i], []).append(stages[i]["observe"])
+            at_input = observers.get(start - 1, [])
+            steps = [(stages[i]["kind"] == 'filter', stages[i]["apply"], observers.get(i, []))
+                     for i in range(start, end)]
+
+            kept = []
+            iterator = iter(rows)
+            while True:
+                records = list(islice(iterator, self.chunk_size))
+                if not records:
+                    break
+                for observe in at_input:
+                    observe(records)
+                for is_filter, apply, after in steps:
+                    if is_filter:
+                        records = apply(records)
+                    else:
+                        apply(records)
+                    for observe in after:
+                        observe(records)
+                kept.extend(records)
+            rows = kept
+            self.passes += 1
+
+            for i in range(start, end):
+                if stages[i]["finish"] is not None:
+                    result = stages[i]["finish"]()
+                    if stages[i]["name"] is not None:
+                        outputs[stages[i]["name"]] = result
+            for i in pending:
+                stages[i]["ready"]()
+                observed.add(i)
+            start = end
+
+        return (rows if isinstance(rows, list) else list(rows)), outputs
@@ -0,0 +1,145 @@
+from itertools import islice
+from operator import itemgetter
+from HyperLogLog import HyperLogLog
+from QuantileSketch import QuantileSketch
+
+class GroupBy:
+    # Hash aggregation of rows: composite keys, several aggregates per group, mergeable partial states.
+    #
+    #   by_month = GroupBy("region,date:month", ["sum", "mean", "p90", "distinct:customer"], "sales")
+    #   by_region = GroupBy("region", ["sum"], "sales")
+    #   GroupBy.feed([by_month, by_region], rows)        # both groupings in one scan
+    #   by_month.results()  -> {("East", "2023-01"): {"sum": ..., "mean": ..., "p90": ..., "distinct:customer": ...}}
+    #
+    # A key is a column, or a YYYY-MM-DD date column cut to a part ('date:year', 'date:month'); several keys give
+    # tuple keys. Aggregates: sum, count, mean, min, max, distinct (HyperLogLog), median, pN (N-th percentile,
+    # from a QuantileSketch), each optionally ':column' (default value_col). Missing (None) values are skipped
+
+    # Length of a normalized date cut down to a part
+    DATE_PARTS = {'year': 4, 'month': 7, 'day': 10}
+
+    def __init__(self, keys, aggregates=("sum",), value_col=None, error=0.001):
+        self.keys = self.parse_keys(keys)
+        self.aggregates = [self.make_aggregate(spec, value_col, error) for spec in aggregates]
+        self.groups = {}
+
+    @classmethod
+    def parse_keys(cls, keys):
+        # "region,date:month" or ["region", "date:month"] -> [(column, date part or None)]
+        items = keys.split(',') if isinstance(keys, str) else keys
+        parsed = []
+        for item in items:
+            column, _, part = item.strip().partition(':')
+            if not column or (part and part not in cls.DATE_PARTS):
+                raise ValueError(f"Invalid group key {item!r}: expected column or column:year|month|day")
+            parsed.append((column, part or None))
+        return parsed
+
+    @staticmethod
+    def make_aggregate(spec, value_col, error):
+        # (label, column, new state, add(state, value), merge(state, other), finish(state))
+        name, _, column = spec.strip().partition(':')
+        column = column or value_col
+        if name in ('sum', 'count'):
+            def add(state, value, step=name == 'count'):
+                state[0] += 1 if step else value
+            return spec, column, lambda: [0], add, GroupBy.merge_sums, itemgetter(0)
+        if name == 'mean':
+            def add(state, value):
+                state[0] += value
+                state[1] += 1
+            return spec, column, lambda: [0, 0], add, GroupBy.merge_sums, \
+                lambda state: state[0] / state[1] if state[1] else None
+        if name in ('min', 'max'):
+            better = min if name == 'min' else max
+
+            def add(state, value):
+                state[0] = value if state[0] is None else better(state[0], value)
+
+            def merge(state, other):
+                if other[0] is not None:
+                    add(state, other[0])
+            return spec, column, lambda: [None], add, merge, itemgetter(0)
+        if name == 'distinct':
+            return spec, column, HyperLogLog, HyperLogLog.add, HyperLogLog.merge, HyperLogLog.count
+        if name == 'median':
+            return spec, column, lambda: QuantileSketch(error), QuantileSketch.add, QuantileSketch.merge, \
+                QuantileSketch.median
+        if name[:1] == 'p' and name[1:].isdigit() and int(name[1:]) <= 100:
+            q = int(name[1:]) / 100
+            return spec, column, lambda: QuantileSketch(error), QuantileSketch.add, QuantileSketch.merge, \
+                lambda sketch: sketch.quantile(q)
+        raise ValueError(f"Unknown aggregate {spec!r}: expected sum, count, mean, min, max, distinct, median or pN")
+
+    @staticmethod
+    def merge_sums(state, other):
+        for i, value in enumerate(other):
+            state[i] += value
+
+    def key_getter(self):
+        def part(column, cut):
+            if cut is None:
+                return lambda row: row.get(column, "Unknown")
+            length = self.DATE_PARTS[cut]
+
+            def get(row):
+                value = row.get(column, "Unknown")
+                return value[:length] if isinstance(value, str) and value != "Unknown" else value
+            return get
+
+        getters = [part(column, cut) for column, cut in self.keys]
+        if len(getters) == 1:
+            return getters[0]
+        return lambda row: tuple(get(row) for get in getters)
+
+    def update(self, rows):
+        # Feed a batch of rows
+        key_of = self.key_getter()
+        groups = self.groups
+        news = [new for _, _, new, _, _, _ in self.aggregates]
+        steps = [(column, add) for _, column, _, add, _, _ in self.aggregates]
+        for row in rows:
+            key = key_of(row)
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = [new() for new in news]
+            for state, (column, add) in zip(states, steps):
+                value = row.get(column)
+                if value is not None:
+                    add(state, value)
+        return self
+
+    @staticmethod
+    def feed(groupings, rows, chunk_size=4096):
+        # Several groupings in one scan of rows (any iterable), a cache-sized chunk at a time
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return groupings
+            for grouping in groupings:
+                grouping.update(chunk)
+
+    def merge(self, other):
+        # Fold another GroupBy with the same keys and aggregates (e.g. built over another partition)
+        merges = [merge for _, _, _, _, merge, _ in self.aggregates]
+        for key, states in other.groups.items():
+            mine = self.groups.get(key)
+            if mine is None:
+                self.groups[key] = states
+                continue
+            for merge, state, other_state in zip(merges, mine, states):
+                merge(state, other_state)
+        return self
+
+    def results(self, sort=True):
+        # {key: value} for a single aggregate, {key: {label: value}} for several; sorted by key, or in order
+        # of first appearance
+        labels = [label for label, _, _, _, _, _ in self.aggregates]
+        finishes = [finish for _, _, _, _, _, finish in self.aggregates]
+        items = sorted(self.groups.items(), key=itemgetter(0)) if sort else self.groups.items()
+        results = {}
+        for key, states in items:
+            values = [finish(state) for finish, state in zip(finishes, states)]
+            results[key] = values[0] if len(values) == 1 else dict(zip(labels, values))
+        return results
@@ -0,0 +1,30 @@
+import hashlib
+import math
+
+class HyperLogLog:
+    # Approximate distinct counter in 2**precision one-byte registers; relative error ~1.04 / sqrt(registers).
+    # Values are hashed with blake2b, so counters built in different processes merge
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'big')
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        # Position of the first set bit after the register index
+        rank = 64 - self.precision - rest.bit_length() + 1
+        index = hashed >> (64 - self.precision)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(0)
+        # Linear counting while many registers are still empty
+        if estimate <= 2.5 * m and empty:
+            estimate = m * math.log(m / empty)
+        return round(estimate)
@@ -1,65 +1,142 @@
-import statistics
 from collections import Counter
+import numpy as np
+from MissingIndex import MissingIndex
+from QuantileSketch import QuantileSketch
+from StageProfiler import StageProfiler
+
 class MissingDataHandler :
-    def __init__(self):
-        pass
+    def __init__(self, median_error=0.001, missing_values=MissingIndex.MISSING_VALUES):
+        # Rank error bound of the median sketch
+        self.median_error = median_error
+        # Cell values treated as missing, by detection, imputation and drop_missing alike
+        self.missing_values = tuple(missing_values)
       
+    @StageProfiler.stage
     def detect_missing(self, data):
-        missing_info = []
-        missing_stat = {}
-        for i, record in enumerate(data):
-            for key, value in record.items():
-                if value in [None, '', 'NA', 'N/A']:
-                    missing_info.append((i, key))
-                    missing_stat[key] = missing_stat.get(key, 0) + 1
-        return missing_info, missing_stat
+        # (missing_info, missing_stats): the (row, column) of every missing cell, and the missing cells per column
+        index = MissingIndex.build(data, self.missing_values)
+        return index.cells(), index.counts()
+
+    @StageProfiler.stage
+    def build_missing_index(self, data):
+        # MissingIndex of the rows: passed as index= to the impute, fill and drop methods, it saves them from
+        # scanning every row again
+        return MissingIndex.build(data, self.missing_values)
     
-    def impute_mean(self, data, column):
-        values = [float(row[column]) for row in data if row.get(column) not in (None, '', 'NA')]
-        if not values:
-            return data
-        mean_val = statistics.mean(values)
-        for row in data:
-            if row.get(column) in (None, '', 'NA'):
-                row[column] = round(mean_val, 2)
-        return data
+    def fill_accumulator(self, strategies):
+        # (add(row), finish() -> fill values): running sum for mean, sketch for median, counter for mode
+        for strategy in strategies.values():
+            if strategy not in ('mean', 'median', 'mode'):
+                raise ValueError("Unsupported imputation strategy. Use mean, median or mode.")
+        sums = {column: 0.0 for column in strategies}
+        counts = {column: 0 for column in strategies}
+        sketches = {column: QuantileSketch(self.median_error) for column, s in strategies.items() if s == 'median'}
+        counters = {column: Counter() for column, s in strategies.items() if s == 'mode'}
+        items = list(strategies.items())
+        missing = self.missing_values
 
-    def impute_median(self, data, column):
-        values = [float(row[column]) for row in data if row.get(column) not in (None, '', 'NA')]
-        if not values:
-            return data
-        median_val = statistics.median(values)
+        def add(row):
+            for column, strategy in items:
+                value = row.get(column)
+                if value in missing:
+                    continue
+                counts[column] += 1
+                if strategy == 'mean':
+                    sums[column] += float(value)
+                elif strategy == 'median':
+                    sketches[column].add(float(value))
+                else:
+                    counters[column][value] += 1
+
+        def finish():
+            fill_values = {}
+            for column, strategy in items:
+                if counts[column] == 0:
+                    continue
+                if strategy == 'mean':
+                    fill_values[column] = round(sums[column] / counts[column], 2)
+                elif strategy == 'median':
+                    fill_values[column] = sketches[column].median()
+                else:
+                    # First seen wins ties, as with statistics.mode
+                    fill_values[column] = counters[column].most_common(1)[0][0]
+            return fill_values
+
+        return add, finish
+
+    def compute_fill_values(self, data, strategies):
+        # One pass for all columns
+        add, finish = self.fill_accumulator(strategies)
         for row in data:
-            if row.get(column) in (None, '', 'NA'):
-                row[column] = median_val
-        return data
+            add(row)
+        return finish()
+
+    # index: a MissingIndex of data (see build_missing_index). With it the methods below visit only the missing cells, and
+    # the cells they fill are cleared from it
 
-    def impute_mode(self, data, column):
-        values = [row[column] for row in data if row.get(column) not in (None, '', 'NA')]
-        if not values:
+    @StageProfiler.stage
+    def impute(self, data, strategies, index=None):
+        fill_values = self.compute_fill_values(data, strategies)
+        return self.fill_rows(data, fill_values, index)
+
+    @StageProfiler.stage
+    def fill(self, data, fill_values, index=None):
+        # Impute with fill values gathered elsewhere, e.g. over the unfiltered rows while FileLoader.load
+        # dropped some of them (see FileLoader.iter_records)
+        return self.fill_rows(data, fill_values, index)
+
+    def fill_rows(self, data, fill_values, index=None):
+        if not fill_values:
+            return data
+        if index is not None:
+            self.check_index(data, index)
+            for column, value in fill_values.items():
+                for i in index.positions(column).tolist():
+                    data[i][column] = value
+                index.clear(column)
             return data
-        try:
-            mode_val = statistics.mode(values)
-        except statistics.StatisticsError:
-            # If no unique mode, choose most common manually
-            mode_val = Counter(values).most_common(1)[0][0]
+        missing = self.missing_values
         for row in data:
-            if row.get(column) in (None, '', 'NA'):
-                row[column] = mode_val
+            for column, value in fill_values.items():
+                if row.get(column) in missing:
+                    row[column] = value
         return data
 
-    def fill_default(self, data, column, default_value):
-        for row in data:
-            if row.get(column) in (None, '', 'NA'):
-                row[column] = default_value
-        return data
+    def check_index(self, data, index):
+        if index.length != len(data) or index.missing_values != frozenset(self.missing_values):
+            raise ValueError("The missing-value index was built over other rows or missing values.")
 
-    def drop_missing(self, data, columns=None):
+    def impute_mean(self, data, column, index=None):
+        return self.impute(data, {column: 'mean'}, index)
+
+    def impute_median(self, data, column, index=None):
+        return self.impute(data, {column: 'median'}, index)
+
+    def impute_mode(self, data, column, index=None):
+        return self.impute(data, {column: 'mode'}, index)
+
+    @StageProfiler.stage
+    def fill_default(self, data, column, default_value, index=None):
+        return self.fill_rows(data, {column: default_value}, index)
+
+    @StageProfiler.stage
+    def drop_missing(self, data, columns=None, index=None):
+        # New list of the rows that miss none of the columns; an index still describes data, not the result
         if columns is None:
             columns = data[0].keys() if data else []
 
+        if index is not None:
+            self.check_index(data, index)
+            dropped = index.rows_missing_any(columns)
+            if len(dropped) == 0:
+                return list(data)
+            keep = np.ones(len(data), dtype=bool)
+            keep[dropped] = False
+            return [row for row, kept in zip(data, keep.tolist()) if kept]
+
+        missing = self.missing_values
         filtered = []
         for row in data:
-            if all(row.get(col) not in (None, '', 'NA') for col in columns):
+            if all(row.get(col) not in missing for col in columns):
                 filtered.append(row)
         return filtered
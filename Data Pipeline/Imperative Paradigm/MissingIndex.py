@@ -0,0 +1,123 @@
+import numpy as np
+
+class MissingIndex:
+    # Missing cells of a list of rows as one bitmap per column (bit i set: row i misses the column), built in one pass.
+    # Counts and row positions are read off the bitmaps on demand, so MissingDataHandler's impute, fill and drop
+    # methods can touch only the missing cells.
+    #
+    #   index = MissingIndex.build(rows)
+    #   index.counts()              -> {"sales": 6, "date": 1}
+    #   index.positions("sales")    -> array of the rows whose sales is missing
+    #
+    # A cell is missing when it holds one of missing_values. Rows without the key at all are flagged too (as
+    # row.get() sees them), but kept apart: counts() and cells() report only cells holding a missing value. The index
+    # describes the rows as they were when added; MissingDataHandler clears what it fills
+    MISSING_VALUES = (None, '', 'NA', 'N/A')
+
+    def __init__(self, missing_values=MISSING_VALUES):
+        self.missing_values = frozenset(missing_values)
+        self.length = 0
+        # column -> bytearray: cells holding a missing value
+        self.bitmaps = {}
+        # column -> bytearray: rows without the column; only for columns some row lacks
+        self.absent = {}
+
+    @classmethod
+    def build(cls, rows, missing_values=MISSING_VALUES):
+        return cls(missing_values).extend(rows)
+
+    def extend(self, rows):
+        # Index more rows, numbered after the ones already indexed (e.g. the next chunk)
+        rows = rows if isinstance(rows, list) else list(rows)
+        start = self.length
+        self.length += len(rows)
+        size = (self.length + 7) >> 3
+        for bitmap in list(self.bitmaps.values()) + list(self.absent.values()):
+            bitmap.extend(bytes(size - len(bitmap)))
+        missing = self.missing_values
+        bitmaps = self.bitmaps
+        known = bitmaps.keys()
+        for i, record in enumerate(rows, start):
+            if record.keys() != known:
+                self.add_layout(record, i, size)
+            try:
+                # Most rows miss nothing: one set test per row
+                if missing.isdisjoint(record.values()):
+                    continue
+            except TypeError:
+                pass
+            for key, value in record.items():
+                try:
+                    if value in missing:
+                        bitmaps[key][i >> 3] |= 1 << (i & 7)
+                except TypeError:
+                    # Unhashable cells (lists, objects from JSON) are values
+                    pass
+        return self
+
+    def add_layout(self, record, i, size):
+        # Row i has other keys than the columns seen so far: new columns (absent from the earlier rows) and
+        # columns the row lacks
+        for key in [key for key in record if key not in self.bitmaps]:
+            self.bitmaps[key] = bytearray(size)
+            if i:
+                absent = self.absent_bitmap(key)
+                absent[:i >> 3] = b'\xff' * (i >> 3)
+                if i & 7:
+                    absent[i >> 3] |= (1 << (i & 7)) - 1
+        for key in self.bitmaps.keys() - record.keys():
+            self.absent_bitmap(key)[i >> 3] |= 1 << (i & 7)
+
+    def absent_bitmap(self, column):
+        bitmap = self.absent.get(column)
+        if bitmap is None:
+            bitmap = self.absent[column] = bytearray((self.length + 7) >> 3)
+        return bitmap
+
+    def bits(self, bitmap):
+        # Bitmap as a boolean array over the rows
+        if bitmap is None:
+            return np.zeros(self.length, dtype=bool)
+        return np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=self.length,
+                             bitorder='little').view(bool)
+
+    def mask(self, column):
+        # Rows whose row.get(column) is missing: a missing value, or no such key
+        return self.bits(self.bitmaps.get(column)) | self.bits(self.absent.get(column))
+
+    def positions(self, column):
+        return np.flatnonzero(self.mask(column))
+
+    def rows_missing_any(self, columns):
+        # Rows missing at least one of the columns
+        mask = np.zeros(self.length, dtype=bool)
+        for column in columns:
+            mask |= self.mask(column)
+        return np.flatnonzero(mask)
+
+    def count(self, column):
+        # Cells of the column holding a missing value
+        bitmap = self.bitmaps.get(column)
+        return int.from_bytes(bitmap, 'little').bit_count() if bitmap else 0
+
+    def counts(self):
+        # {column: missing cells} for the columns with any, in the order their first missing cell appears
+        first = {}
+        for order, (column, bitmap) in enumerate(self.bitmaps.items()):
+            bits = int.from_bytes(bitmap, 'little')
+            if bits:
+                first[column] = ((bits & -bits).bit_length(), order)
+        return {column: self.count(column) for column in sorted(first, key=first.get)}
+
+    def cells(self):
+        # (row, column) of every cell holding a missing value, row by row (columns in the order first seen)
+        order = {column: i for i, column in enumerate(self.bitmaps)}
+        pairs = [(i, order[column], column) for column, bitmap in self.bitmaps.items()
+                 for i in np.flatnonzero(self.bits(bitmap)).tolist()]
+        return [(i, column) for i, _, column in sorted(pairs)]
+
+    def clear(self, column):
+        # Forget the column's missing cells, e.g. once they are filled
+        if column in self.bitmaps:
+            self.bitmaps[column] = bytearray(len(self.bitmaps[column]))
+        self.absent.pop(column, None)
@@ -0,0 +1,236 @@
+import csv
+import gzip
+import io
+import json
+import os
+import queue
+import threading
+import numpy as np
+from ColumnarTable import ColumnarTable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class OutputSink:
+    # Writes rows handed over in batches (lists of dicts or ColumnarTables) on a background thread, which encodes,
+    # compresses and writes them with large buffered writes, so the caller can keep computing while they are written.
+    # A new file is written under a temporary name and renamed into place on close, so readers never see a partial
+    # output; append=True adds to an existing file in place. Nothing is written without rows.
+    #
+    #   with OutputSink("out/processed.ndjson.gz") as sink:
+    #       for chunk in chunks:
+    #           sink.write(chunk)
+    #
+    # Formats: csv, json (array, not indented), ndjson and npz (columnar: each column's values under its name and
+    # its validity mask under '<name>.mask', as ColumnarTable keeps them); compression: none, gzip or zstd
+    FORMATS = ('csv', 'json', 'ndjson', 'npz')
+    COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+    def __init__(self, path, fmt=None, compression=None, fieldnames=None, append=False, buffer_size=1 << 20,
+                 max_pending=8):
+        self.path = path
+        self.fmt, self.compression = self.detect(path, fmt, compression)
+        if append and self.fmt in ('json', 'npz'):
+            raise ValueError(f"{self.fmt} output cannot be appended to")
+        # CSV columns; the first row's keys when None
+        self.fieldnames = fieldnames
+        self.append = append
+        self.buffer_size = buffer_size
+        self.temp_path = None
+        self.error = None
+        self.discard = False
+        self.closed = False
+        self.queue = queue.Queue(max_pending)
+        self.thread = threading.Thread(target=self.run, name="output-sink", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def detect(cls, path, fmt=None, compression=None):
+        # (format, compression): a .gz or .zst suffix gives the compression, the extension before it the format
+        # (csv unless .json, .ndjson/.jsonl or .npz); fmt and compression override them
+        name = os.path.basename(path).lower()
+        found = 'gzip' if name.endswith('.gz') else 'zstd' if name.endswith('.zst') else 'none'
+        if found != 'none':
+            name = name.rsplit('.', 1)[0]
+        ext = name.rsplit('.', 1)[-1] if '.' in name else ''
+        fmt = fmt or {'json': 'json', 'ndjson': 'ndjson', 'jsonl': 'ndjson', 'npz': 'npz'}.get(ext, 'csv')
+        compression = compression or found
+        if fmt not in cls.FORMATS:
+            raise ValueError(f"Unsupported output format {fmt!r}. Use {', '.join(cls.FORMATS)}.")
+        if compression not in cls.COMPRESSIONS:
+            raise ValueError(f"Unsupported output compression {compression!r}. Use {', '.join(cls.COMPRESSIONS)}.")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("Writing zstd-compressed output requires the zstandard package.")
+        if fmt == 'npz' and compression == 'zstd':
+            raise ValueError("npz output is compressed with gzip (zip deflate) or not at all.")
+        return fmt, compression
+
+    def write(self, rows):
+        # Hand over a batch (list of dicts or a ColumnarTable); blocks while max_pending batches wait. The rows
+        # must not be modified afterwards
+        if self.error is not None:
+            raise self.error
+        self.queue.put(rows)
+
+    def close(self, discard=False):
+        # Wait for the writer thread, then move the file into place (or remove it when discarding or on error)
+        if self.closed:
+            return
+        self.closed = True
+        self.discard = discard
+        self.queue.put(None)
+        self.thread.join()
+        if discard or self.error is not None:
+            if self.temp_path is not None and os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+            if not discard:
+                raise self.error
+        elif self.temp_path is not None:
+            os.replace(self.temp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Keep the output only when the block completed
+        self.close(discard=exc_type is not None)
+        return False
+
+    # -- Writer thread --
+
+    def run(self):
+        # After a failure batches are still taken (so write() never blocks) and dropped; the error is raised by
+        # the next write() or by close()
+        raw = None
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            if self.error is not None or len(batch) == 0:
+                continue
+            try:
+                if raw is None:
+                    raw, out = self.open_stream()
+                self.add(out, batch)
+            except Exception as error:
+                self.error = error
+        try:
+            if raw is not None and self.error is None and not self.discard:
+                self.finish(raw, out)
+        except Exception as error:
+            self.error = error
+        finally:
+            if raw is not None:
+                raw.close()
+
+    def open_stream(self):
+        if self.append:
+            raw = open(self.path, 'ab', buffering=self.buffer_size)
+        else:
+            self.temp_path = self.path + '.tmp'
+            raw = open(self.temp_path, 'wb', buffering=self.buffer_size)
+        if self.fmt == 'npz':
+            # Column blocks, saved in one go by finish()
+            self.blocks = {}
+            return raw, None
+        if self.compression == 'gzip':
+            # A new gzip member, so appending to a .gz file keeps it readable
+            out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+        elif self.compression == 'zstd':
+            out = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            out = raw
+        self.text = io.StringIO(newline='')
+        self.csv_writer = None
+        self.rows = 0
+        return raw, out
+
+    def add(self, out, batch):
+        if self.fmt == 'npz':
+            self.add_columns(batch)
+            return
+        if isinstance(batch, ColumnarTable):
+            # Text formats take the table a slice of rows at a time
+            for start in range(0, len(batch), 4096):
+                self.add(out, batch.take(slice(start, start + 4096)).to_rows())
+            return
+        for start in range(0, len(batch), 4096):
+            self.encode(batch[start:start + 4096])
+            out.write(self.text.getvalue().encode('utf-8'))
+            self.text.seek(0)
+            self.text.truncate()
+
+    def encode(self, rows):
+        if self.fmt == 'csv':
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.text, fieldnames=self.fieldnames or list(rows[0].keys()))
+                if not self.append:
+                    self.csv_writer.writeheader()
+            self.csv_writer.writerows(rows)
+            return
+        for row in rows:
+            if self.fmt == 'json':
+                self.text.write('[' if self.rows == 0 else ',\n')
+            self.text.write(json.dumps(row))
+            if self.fmt == 'ndjson':
+                self.text.write('\n')
+            self.rows += 1
+
+    def add_columns(self, batch):
+        columns = self.table_columns(batch) if isinstance(batch, ColumnarTable) else self.row_columns(batch)
+        if columns is None or (self.blocks and list(columns) != list(self.blocks)):
+            raise ValueError("npz output needs rows with the same columns, holding str, int or float values")
+        for name, block in columns.items():
+            self.blocks.setdefault(name, []).append(block)
+
+    @staticmethod
+    def table_columns(table):
+        # Missing text cells are written blank, as row_columns writes them
+        columns = {}
+        for name in table.column_names():
+            values, mask = table.columns[name], table.masks[name]
+            if values.dtype.kind == 'U' and not mask.all():
+                values = np.where(mask, values, '')
+            columns[name] = (values, mask)
+        return columns
+
+    @staticmethod
+    def row_columns(rows):
+        # {name: (values, mask)} of a batch of rows, or None when rows differ in keys or hold non-scalar values
+        names = list(rows[0].keys())
+        if any(row.keys() != rows[0].keys() for row in rows):
+            return None
+        columns = {}
+        for name in names:
+            cells = [row[name] for row in rows]
+            kinds = {type(cell) for cell in cells if cell is not None}
+            if len(kinds) > 1 or not kinds <= {str, float, int}:
+                return None
+            kind = kinds.pop() if kinds else str
+            mask = np.array([cell is not None for cell in cells], dtype=bool)
+            filler = kind()
+            values = np.array([filler if cell is None else cell for cell in cells],
+                              dtype={str: str, float: np.float64, int: np.int64}[kind])
+            columns[name] = (values, mask)
+        return columns
+
+    def finish(self, raw, out):
+        if self.fmt != 'npz':
+            if self.fmt == 'json':
+                out.write(b']\n')
+            if out is not raw:
+                out.close()
+            return
+        arrays = {}
+        for name, blocks in self.blocks.items():
+            # Blocks without a value default to str; they take the type of the others
+            typed = [values.dtype for values, mask in blocks if mask.any()] or [np.dtype(str)]
+            try:
+                arrays[name] = np.concatenate([values if mask.any() else np.zeros(len(values), typed[0])
+                                               for values, mask in blocks])
+            except TypeError:
+                raise ValueError(f"npz output: column {name!r} mixes text and numbers")
+            arrays[name + '.mask'] = np.concatenate([mask for _, mask in blocks])
+        (np.savez_compressed if self.compression == 'gzip' else np.savez)(raw, **arrays)
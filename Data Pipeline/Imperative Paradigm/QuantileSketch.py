@@ -0,0 +1,77 @@
+import math
+import sys
+import statistics
+
+class QuantileSketch:
+    # KLL-style compactor sketch: bounded memory, rank error roughly error * count; error 0 keeps every value
+    def __init__(self, error=0.001):
+        self.k = max(8, math.ceil(2 / error)) if error else sys.maxsize
+        self.levels = [[]]
+        self.count = 0
+        self.flip = 0
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def add(self, value):
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self.capacity(0):
+            self.compress()
+
+    def extend(self, values):
+        # Batch add: level 0 is filled up to its capacity a slice at a time
+        values = list(values)
+        start = 0
+        while start < len(values):
+            room = max(1, self.capacity(0) - len(self.levels[0]))
+            batch = values[start:start + room]
+            self.levels[0].extend(batch)
+            self.count += len(batch)
+            start += room
+            if len(self.levels[0]) >= self.capacity(0):
+                self.compress()
+
+    def compress(self):
+        # Halve every full level into the one above it, keeping alternate sorted items
+        for level in range(len(self.levels)):
+            if len(self.levels[level]) < self.capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(self.levels[level])
+            leftover = [items.pop()] if len(items) % 2 else []
+            self.flip ^= 1
+            self.levels[level + 1].extend(items[self.flip::2])
+            self.levels[level] = leftover
+
+    def merge(self, other):
+        # Fold another sketch into this one; items keep their level weights
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append([])
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.compress()
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        # Each item at level h stands for 2**h values
+        weighted = sorted((value, 2 ** level) for level, items in enumerate(self.levels) for value in items)
+        target = q * self.count
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+    def median(self):
+        if self.count == 0:
+            return None
+        # Exact until the first compaction
+        if len(self.levels) == 1:
+            return statistics.median(self.levels[0])
+        return self.quantile(0.5)
@@ -0,0 +1,98 @@
+import math
+from collections import Counter
+import numpy as np
+from QuantileSketch import QuantileSketch
+
+class RunningStats:
+    # One-pass summary of a numeric column, fed in batches: count, mean and variance (Welford moments), min, max,
+    # a QuantileSketch for the median and, optionally, exact value counts for the mode. Given x values as well it
+    # keeps the co-moment for the least-squares slope and correlation of (x, value). Stats of disjoint batches
+    # merge, so chunks and workers can each keep their own
+    #
+    #   stats = RunningStats()
+    #   for chunk in chunks:
+    #       stats.update(chunk)
+    #   stats.mean, stats.variance(), stats.median()
+    def __init__(self, error=0.001, modes=False):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.mean_x = 0.0
+        self.m2_x = 0.0
+        self.c_xy = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(error)
+        self.counts = Counter() if modes else None
+
+    def update(self, values, xs=None):
+        # Add a batch of values (list or array, no missing values), with their x values if given
+        items = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        if not items:
+            return self
+        y = np.asarray(values if isinstance(values, np.ndarray) else items, dtype=float)
+        x = np.asarray(xs, dtype=float) if xs is not None else np.zeros(len(y))
+        dy = y - y.mean()
+        dx = x - x.mean()
+        batch = RunningStats()
+        batch.count, batch.mean, batch.m2 = len(y), float(y.mean()), float(dy @ dy)
+        batch.mean_x, batch.m2_x, batch.c_xy = float(x.mean()), float(dx @ dx), float(dx @ dy)
+        batch.min, batch.max = min(items), max(items)
+        self.merge_moments(batch)
+        self.sketch.extend(items)
+        if self.counts is not None:
+            self.counts.update(items)
+        return self
+
+    def merge_moments(self, other):
+        # Pairwise update of the means and centred moments (Chan et al.)
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.mean_x, self.m2_x, self.c_xy = other.mean_x, other.m2_x, other.c_xy
+            self.min, self.max = other.min, other.max
+            return
+        n = self.count + other.count
+        dy = other.mean - self.mean
+        dx = other.mean_x - self.mean_x
+        weight = self.count * other.count / n
+        self.m2 += other.m2 + dy * dy * weight
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.c_xy += other.c_xy + dx * dy * weight
+        self.mean += dy * other.count / n
+        self.mean_x += dx * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def merge(self, other):
+        # Fold the stats of other rows into these
+        self.merge_moments(other)
+        self.sketch.merge(other.sketch)
+        if self.counts is not None and other.counts is not None:
+            self.counts.update(other.counts)
+        return self
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    def median(self):
+        return self.sketch.median()
+
+    def mode(self):
+        # Most common value; ties go to the value seen first
+        if not self.counts:
+            return None
+        return self.counts.most_common(1)[0][0]
+
+    def slope(self):
+        # Least-squares slope of value against x
+        return self.c_xy / self.m2_x if self.m2_x else 0
+
+    def correlation(self):
+        spread = math.sqrt(self.m2_x * self.m2)
+        return max(-1.0, min(1.0, self.c_xy / spread)) if spread else 0
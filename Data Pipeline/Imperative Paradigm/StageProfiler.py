@@ -0,0 +1,134 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from ColumnarTable import ColumnarTable
+
+class StageProfiler:
+    # Profiler that @StageProfiler.stage methods report to; while None they run unmeasured
+    active = None
+
+    # Exported per-stage metrics: (record field, metric name, type, help)
+    METRICS = [
+        ('calls', 'pipeline_stage_calls_total', 'counter', 'Times the stage ran'),
+        ('wall_seconds', 'pipeline_stage_wall_seconds_total', 'counter', 'Wall-clock time spent in the stage'),
+        ('cpu_seconds', 'pipeline_stage_cpu_seconds_total', 'counter', 'CPU time spent in the stage'),
+        ('rows_in', 'pipeline_stage_rows_in_total', 'counter', 'Rows passed to the stage'),
+        ('rows_out', 'pipeline_stage_rows_out_total', 'counter', 'Rows produced by the stage'),
+        ('rows_dropped', 'pipeline_stage_rows_dropped_total', 'counter', 'Rows removed by the stage'),
+        ('memory_delta_bytes', 'pipeline_stage_memory_delta_bytes', 'gauge', 'Resident memory change over the stage'),
+    ]
+
+    def __init__(self, detail_stage=None, detail_mode='cprofile', detail_path=None):
+        # detail_mode ('cprofile' or 'tracemalloc') is applied to detail_stage only
+        self.records = []
+        self.detail_stage = detail_stage
+        self.detail_mode = detail_mode
+        self.detail_path = detail_path or f"{detail_stage}.prof"
+        self.stack = []
+
+    def start(self):
+        StageProfiler.active = self
+        return self
+
+    def stop(self):
+        if StageProfiler.active is self:
+            StageProfiler.active = None
+
+    @staticmethod
+    def current_rss():
+        # Resident set size in bytes (None where /proc is not available)
+        try:
+            with open('/proc/self/statm') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def count_rows(value):
+        if isinstance(value, (list, ColumnarTable)):
+            return len(value)
+        return None
+
+    @contextmanager
+    def measure(self, stage, rows_in=None):
+        # The caller fills in record['rows_out']; nested stages name their parent
+        record = {'stage': stage, 'parent': self.stack[-1] if self.stack else None,
+                  'rows_in': rows_in, 'rows_out': None}
+        detail = self.detail_mode if stage == self.detail_stage else None
+        tracer = cProfile.Profile() if detail == 'cprofile' else None
+        if detail == 'tracemalloc':
+            tracemalloc.start()
+        self.stack.append(stage)
+        rss_before = self.current_rss()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        if tracer:
+            tracer.enable()
+        try:
+            yield record
+        finally:
+            if tracer:
+                tracer.disable()
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            rss_after = self.current_rss()
+            self.stack.pop()
+            record['memory_delta_bytes'] = rss_after - rss_before if None not in (rss_before, rss_after) else None
+            record['rows_dropped'] = (record['rows_in'] - record['rows_out']
+                                      if None not in (record['rows_in'], record['rows_out']) else None)
+            if tracer:
+                tracer.dump_stats(self.detail_path)
+                record['cprofile_file'] = self.detail_path
+            elif detail == 'tracemalloc':
+                # Allocations still alive when the stage ends, by source line
+                snapshot = tracemalloc.take_snapshot()
+                record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                record['top_allocations'] = [str(stat) for stat in snapshot.statistics('lineno')[:10]]
+            self.records.append(record)
+
+    @staticmethod
+    def stage(method):
+        # Method decorator: the stage is named Class.method and its first argument counts as rows in
+        name = method.__qualname__
+
+        @wraps(method)
+        def wrapper(instance, *args, **kwargs):
+            profiler = StageProfiler.active
+            if profiler is None:
+                return method(instance, *args, **kwargs)
+            with profiler.measure(name, StageProfiler.count_rows(args[0]) if args else None) as record:
+                result = method(instance, *args, **kwargs)
+                record['rows_out'] = StageProfiler.count_rows(result)
+            return result
+        return wrapper
+
+    def to_json_lines(self):
+        return ''.join(json.dumps(record) + '\n' for record in self.records)
+
+    def to_prometheus(self):
+        # Summed per stage, since a stage can run more than once
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'calls': 0})
+            total['calls'] += 1
+            for field, _, _, _ in self.METRICS[1:]:
+                if record.get(field) is not None:
+                    total[field] = total.get(field, 0) + record[field]
+
+        lines = []
+        for field, metric, kind, help_text in self.METRICS:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for stage, total in totals.items():
+                if field in total:
+                    label = stage.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                    lines.append(f'{metric}{{stage="{label}"}} {total[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, fmt='jsonl'):
+        with open(path, 'w') as file:
+            file.write(self.to_prometheus() if fmt == 'prometheus' else self.to_json_lines())
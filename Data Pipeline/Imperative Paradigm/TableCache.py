@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from ColumnarTable import ColumnarTable
+
+class TableCache:
+    # Binary snapshots of ColumnarTables, one .npy file per column and mask, with size-based LRU eviction
+    VERSION = 4
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, path, settings=None):
+        # Path, size, mtime and content hash of the input (of each file, given a list of paths) plus whatever
+        # settings shaped the table
+        if isinstance(path, list):
+            fingerprint = {"version": self.VERSION, "files": [self.file_fingerprint(item) for item in path],
+                           "settings": settings}
+        else:
+            fingerprint = {"version": self.VERSION, **self.file_fingerprint(path), "settings": settings}
+        return hashlib.blake2b(json.dumps(fingerprint, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def file_fingerprint(path):
+        stat = os.stat(path)
+        content = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content.update(block)
+        return {
+            "path": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "content": content.hexdigest()
+        }
+
+    def load(self, key):
+        # Columns come back memory-mapped (read-only); None on a miss
+        entry = os.path.join(self.cache_dir, key)
+        meta_path = os.path.join(entry, 'meta.json')
+        try:
+            with open(meta_path) as file:
+                names = json.load(file)["columns"]
+            columns = {}
+            masks = {}
+            for i, name in enumerate(names):
+                columns[name] = np.load(os.path.join(entry, f"{i}.values.npy"), mmap_mode='r')
+                masks[name] = np.load(os.path.join(entry, f"{i}.mask.npy"), mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Last use drives the LRU eviction
+        os.utime(meta_path)
+        return ColumnarTable(columns, masks)
+
+    def store(self, key, table):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        names = table.column_names()
+        for i, name in enumerate(names):
+            np.save(os.path.join(staging, f"{i}.values.npy"), np.asarray(table.columns[name]))
+            np.save(os.path.join(staging, f"{i}.mask.npy"), np.asarray(table.masks[name]))
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump({"columns": names, "rows": len(table)}, file)
+
+        try:
+            os.replace(staging, os.path.join(self.cache_dir, key))
+        except OSError:
+            # Another run stored the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        # Drop least recently used entries until the directory fits in max_bytes
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry, 'meta.json')
+            if name.startswith('.') or not os.path.isfile(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(meta_path), size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -4,8 +4,36 @@ from MissingDataHandler import MissingDataHandler
 from DataValidator import DataValidator
 from DataAnalyzer import DataAnalyzer
 from DataVisualizer import DataVisualizer
+from ChartRenderer import ChartRenderer
 from FileLoader import FileLoader
-import matplotlib.pyplot as plt
+from FusedPipeline import FusedPipeline
+from StageProfiler import StageProfiler
+import argparse
+
+parser = argparse.ArgumentParser(description="Imperative (OOP) data pipeline")
+parser.add_argument("--profile", metavar="FILE", help="Record per-stage time, rows and memory to FILE")
+parser.add_argument("--profile-format", choices=["jsonl", "prometheus"], default="jsonl",
+                    help="Profile output: JSON lines or Prometheus text format")
+parser.add_argument("--profile-stage", metavar="STAGE",
+                    help="Stage (e.g. FusedPipeline.run or DataAnalyzer.summary) to capture in detail")
+parser.add_argument("--profile-detail", choices=["cprofile", "tracemalloc"], default="cprofile",
+                    help="Detail capture used for --profile-stage")
+parser.add_argument("--no-plots", action="store_true", help="Skip the charts (matplotlib is not even imported)")
+parser.add_argument("--headless", action="store_true",
+                    help="Save the charts to --chart-dir instead of showing them")
+parser.add_argument("--chart-dir", default="Imperative(OOP)", help="Directory of the charts saved in --headless mode")
+parser.add_argument("--chart-format", choices=["png", "svg"], default="png", help="Image format of the saved charts")
+parser.add_argument("--chart-workers", type=int, help="Worker processes rendering the charts (default: up to 3)")
+parser.add_argument("--force-charts", action="store_true",
+                    help="Save the charts even when their data is unchanged since the last run")
+args = parser.parse_args()
+if args.no_plots and args.headless:
+    parser.error("--no-plots and --headless cannot be combined")
+
+profiler = None
+if args.profile:
+    profiler = StageProfiler(args.profile_stage, args.profile_detail,
+                             f"{args.profile}.{args.profile_stage}.prof").start()
 
 # ---------------------------------------------------
 data_loader = FileLoader("data/mine.csv", "Imperative(OOP)/output_data.csv")
@@ -15,50 +43,41 @@ for row in data:
     print(row)
 # ---------------------------------------------------
 validator = DataValidator()
-data = validator.remove_none_keys(data)
-# ---------------------------------------------------
 missing = MissingDataHandler()
+std = DataStandardizer()
+transformer = DataTransformer()
 
-missing_info, missing_stats = missing.detect_missing(data)
+# Every row-local step below runs in one pass over cache-sized chunks of the rows (plus a first pass gathering the
+# mean and the date format); the taps report the missing cells, the filtered rows and the aggregates on the way
+pipeline = (FusedPipeline()
+            .add(validator.remove_none_keys)
+            .tap("missing", missing.detect_missing)
+            # Fill missing sales with mean
+            .add(missing.impute_mean, "sales")
+            # convert numeric columns
+            .add(std.standardize_numeric_column, "sales")
+            # unify categorical (trim spaces, convert to str)
+            .add(std.standardize_categorical_column, "region")
+            # normalize dates into YYYY-MM-DD
+            .add(std.standardize_date_column, "date")
+            .tap("filtered", transformer.filter_rows, "sales", 1000)
+            .tap("aggregated", transformer.aggregate, "region", "sales"))
+data, outputs = pipeline.run(data)
+
+missing_info, missing_stats = outputs["missing"]
 print("\nMissing Info:", missing_info)
 print("Missing Stats:", missing_stats)
+print("\nDate parsing:", std.date_reports["date"])
 
-# Fill missing sales with mean
-data = missing.impute_mean(data, "sales")
-
-print("\n===== AFTER IMPUTATION =====")
-for row in data:
-    print(row)
-
-# ---------------------------------------------------
-std = DataStandardizer()
-
-# convert numeric columns
-data = std.standardize_numeric_column(data, "sales")
-
-# unify categorical (trim spaces, convert to str)
-data = std.standardize_categorical_column(data, "region")
-
-# normalize dates into YYYY-MM-DD
-data = std.standardize_date_column(data, "date")
-
-print("\n===== AFTER STANDARDIZATION =====")
+print("\n===== AFTER IMPUTATION AND STANDARDIZATION =====")
 for row in data:
     print(row)
 
-
-
-# ---------------------------------------------------
-
-transformer = DataTransformer()
-
-filtered_data = transformer.filter_rows(data, "sales", threshold=1000)
-
 print("\n===== FILTER (sales > 1000) =====")
-for row in filtered_data:
+for row in outputs["filtered"]:
     print(row)
 
-aggregated = transformer.aggregate(data, "region", "sales")
+aggregated = outputs["aggregated"]
 
 print("\n===== AGGREGATED SALES BY REGION =====")
 print(aggregated)
@@ -75,26 +94,41 @@ print("\nCorrelation(sales, sales):", corr)
 
 # ---------------------------------------------------
 
-visualizer = DataVisualizer(transformer , analyzer)
-
-print("\nShowing Charts...")
-
-# Bar chart
-fig1 = visualizer.bar_chart(data, "sales", "region")
-if fig1: fig1.show()
-plt.show()  
-
-# Line chart
-fig2 = visualizer.line_chart(data, "region", "sales")
-if fig2: fig2.show()
-plt.show() 
-
-# Correlation heatmap
-fig3 = visualizer.correlation_heatmap(
-    data, 
-    numeric_cols=["sales"],
-)
-if fig3: fig3.show()
-plt.show()  
+visualizer = DataVisualizer(transformer , analyzer, headless=args.headless)
+
+if args.headless:
+    print("\nSaving Charts...")
+    renderer = ChartRenderer(args.chart_dir, args.chart_format, args.chart_workers, args.force_charts)
+    saved, skipped = visualizer.save_charts(data, "sales", "region", ["sales"], renderer)
+    for path in saved:
+        print("Saved", path)
+    for path in skipped:
+        print("Unchanged, kept", path)
+elif not args.no_plots:
+    import matplotlib.pyplot as plt
+    print("\nShowing Charts...")
+
+    # Bar chart
+    fig1 = visualizer.bar_chart(data, "sales", "region")
+    if fig1: fig1.show()
+    plt.show()  
+
+    # Line chart
+    fig2 = visualizer.line_chart(data, "region", "sales")
+    if fig2: fig2.show()
+    plt.show() 
+
+    # Correlation heatmap
+    fig3 = visualizer.correlation_heatmap(
+        data, 
+        numeric_cols=["sales"],
+    )
+    if fig3: fig3.show()
+    plt.show()  
+
+if profiler:
+    profiler.stop()
+    profiler.export(args.profile, args.profile_format)
+    print(f"Profile written to {args.profile}")
 
 print("\n===== END OF PIPELINE EXECUTION =====")